@@ -0,0 +1,86 @@
+import asyncio
+import logging
+
+from playwright.async_api import async_playwright
+
+from munibot import run_munibot_async
+from rentabot import run_rentabot_async
+
+logger = logging.getLogger(__name__)
+
+# Presentaciones simultáneas por portal (cada portal tolera distinta carga)
+CONCURRENCIA_POR_DEFECTO = {
+    'posadas': 5,
+    'misiones': 2,
+}
+
+FLUJOS = {
+    'posadas': run_munibot_async,
+    'misiones': run_rentabot_async,
+}
+
+
+async def run_filings(filings, concurrencia=None, headless=True, browser=None, cdp_launcher=None):
+    """
+    Ejecuta muchas presentaciones a la vez en un único proceso y un único navegador.
+
+    Args:
+        filings (list[dict]): Cada item tiene 'key' (identificador libre, ej. id del job),
+            'portal' ('posadas' | 'misiones') y 'kwargs' (argumentos del flujo async,
+            sin el navegador).
+        concurrencia (dict, optional): Máximo de presentaciones simultáneas por portal.
+        headless (bool): Si se lanza Chromium sin ventana.
+        browser (optional): Navegador async ya abierto; si no se pasa y alguna presentación lo
+            necesita, se lanza uno.
+        cdp_launcher (CDPLauncher, optional): Navegadores CDP del worker. Si se pasa, cada
+            presentación de Misiones se conecta al navegador que entrega `cdp_launcher.lease_async()`
+            en lugar de usar el compartido.
+
+    Returns:
+        dict: {key: (status, output, error)} para cada presentación.
+    """
+    limites = {**CONCURRENCIA_POR_DEFECTO, **(concurrencia or {})}
+    semaforos = {portal: asyncio.Semaphore(max(1, n)) for portal, n in limites.items()}
+
+    async def _presentar(browser, filing, conectar_cdp=None):
+        portal = filing['portal']
+        flujo = FLUJOS.get(portal)
+        if flujo is None:
+            return filing['key'], ('Failed', None, f'Portal desconocido: {portal}')
+        async with semaforos[portal]:
+            logger.debug(f"run_filings: Iniciando {portal} ({filing['key']})")
+            try:
+                if portal == 'misiones' and conectar_cdp is not None:
+                    async with cdp_launcher.lease_async() as cdp_endpoint:
+                        navegador_cdp = await conectar_cdp(cdp_endpoint)
+                        try:
+                            return filing['key'], await flujo(browser=navegador_cdp, **filing['kwargs'])
+                        finally:
+                            await navegador_cdp.close()  # Cierra la conexión, no el navegador del launcher
+                return filing['key'], await flujo(browser=browser, **filing['kwargs'])
+            except Exception as e:
+                return filing['key'], ('Failed', None, f'Ocurrió un error inesperado: {e}')
+
+    if browser is not None and cdp_launcher is None:
+        resultados = await asyncio.gather(*(_presentar(browser, filing) for filing in filings))
+        return dict(resultados)
+
+    # Con el launcher, Misiones usa sus navegadores CDP: el compartido solo hace falta para los demás portales
+    usa_compartido = any(filing['portal'] in FLUJOS and not (filing['portal'] == 'misiones' and cdp_launcher is not None)
+                         for filing in filings)
+    async with async_playwright() as p:
+        propio = browser is None and usa_compartido
+        if propio:
+            browser = await p.chromium.launch(headless=headless)
+        conectar_cdp = p.chromium.connect_over_cdp if cdp_launcher is not None else None
+        try:
+            resultados = await asyncio.gather(*(_presentar(browser, filing, conectar_cdp) for filing in filings))
+        finally:
+            if propio:
+                await browser.close()
+    return dict(resultados)
+
+
+def run_filings_sync(filings, concurrencia=None, headless=True, cdp_launcher=None):
+    """Punto de entrada sync (worker, comandos de manage.py) para `run_filings`."""
+    return asyncio.run(run_filings(filings, concurrencia=concurrencia, headless=headless, cdp_launcher=cdp_launcher))
@@ -0,0 +1,126 @@
+"""
+Benchmark de la clasificación y suma de líneas de Rentas (rentabot.procesar_excel_rentas).
+
+Compara la versión anterior (df.apply fila por fila + iterrows) con la columnar
+(`rentabot.totales_por_tipo`) sobre un DataFrame sintético:
+
+    python bench_rentas.py --filas 100000
+    python bench_rentas.py --filas 100000 --excel   # incluye lectura de un .xlsx
+    python bench_rentas.py --filas 5000 --archivo   # 12 meses: re-parsear los .xlsx vs. el archivo columnar
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import rentas_archive
+from rentabot import archivar_excel_rentas, procesar_rentas_periodos, totales_por_tipo, totales_rentas_archivadas
+
+
+def generar_rentas(filas, semilla=0):
+    """Líneas de Rentas con ~50% percepciones, ~45% retenciones y ~5% sin tipo, en 3 períodos."""
+    rng = np.random.default_rng(semilla)
+    sorteo = rng.random(filas)
+    dias = rng.integers(1, 29, filas)
+    meses = rng.integers(7, 10, filas)
+    return pd.DataFrame({
+        'CUIT': '30-70308853-4',
+        'RAZÓN SOCIAL': 'AGENTE S.A.',
+        'RÉG': 26,
+        'FECHA': [f"{dia:02d}/{mes:02d}/2025" for dia, mes in zip(dias, meses)],
+        'BASE IMP.': rng.uniform(100, 100000, filas).round(2),
+        'ALÍC.': np.where(sorteo < 0.5, 3.31, np.nan),
+        'COEF.': np.where((sorteo >= 0.5) & (sorteo < 0.95), 1.0, np.nan),
+        'TOTAL': rng.uniform(1, 5000, filas).round(2),
+    })
+
+
+def totales_fila_a_fila(df):
+    """Implementación anterior, conservada solo como referencia para el benchmark."""
+    totales = {'PERCEPCIÓN': 0.0, 'RETENCIÓN': 0.0}
+
+    def clasificar_por_columna(row):
+        if pd.notna(row.get('ALÍC.')): return 'PERCEPCIÓN'
+        elif pd.notna(row.get('COEF.')): return 'RETENCIÓN'
+        else: return 'OTRO'
+
+    df = df.copy()
+    df['TIPO'] = df.apply(clasificar_por_columna, axis=1)
+    resultados = df.groupby('TIPO').agg({'TOTAL': 'sum'}).reset_index()
+    for _, fila in resultados.iterrows():
+        if fila['TIPO'] in totales:
+            totales[fila['TIPO']] = fila['TOTAL']
+    return totales
+
+
+def medir(funcion, *args, repeticiones=3):
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion(*args)
+        segundos = time.perf_counter() - inicio
+        mejor = segundos if mejor is None else min(mejor, segundos)
+    return mejor, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filas', type=int, default=100000)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--excel', action='store_true', help='Mide también la lectura por períodos desde un .xlsx.')
+    parser.add_argument('--archivo', action='store_true',
+                        help='Mide 12 meses de totales re-parseando los .xlsx y desde el archivo columnar (--filas por mes).')
+    args = parser.parse_args()
+
+    df = generar_rentas(args.filas)
+    antes, totales_antes = medir(totales_fila_a_fila, df, repeticiones=args.repeticiones)
+    despues, totales_despues = medir(totales_por_tipo, df, repeticiones=args.repeticiones)
+    for tipo in totales_antes:
+        assert abs(totales_antes[tipo] - totales_despues[tipo]) < 0.01, tipo
+
+    print(f"{args.filas:,} filas")
+    print(f"  fila por fila (apply + iterrows): {antes * 1000:10.1f} ms")
+    print(f"  columnar (totales_por_tipo):      {despues * 1000:10.1f} ms")
+    print(f"  speedup: {antes / despues:.0f}x")
+
+    if args.excel:
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'Rentas_2025-09.xlsx')
+            df.to_excel(ruta, index=False)
+            segundos, por_periodo = medir(procesar_rentas_periodos, [ruta], repeticiones=1)
+            print(f"  lectura .xlsx + totales por período: {segundos:.1f} s")
+            for periodo, totales in por_periodo.items():
+                print(f"    {periodo}: " + ", ".join(f"{tipo}={monto:,.2f}" for tipo, monto in totales.items()))
+
+    if args.archivo:
+        medir_archivo(args.filas)
+
+
+def medir_archivo(filas_por_mes):
+    with tempfile.TemporaryDirectory() as directorio:
+        rutas = []
+        for mes in range(1, 13):
+            ruta = os.path.join(directorio, f'Rentas_2024-{mes:02d}.xlsx')
+            generar_rentas(filas_por_mes, semilla=mes).assign(FECHA=f'15/{mes:02d}/2024').to_excel(ruta, index=False)
+            rutas.append(ruta)
+        raiz = os.path.join(directorio, 'archivo')
+        for ruta in rutas:
+            archivar_excel_rentas(ruta, raiz, 'bench')
+
+        segundos_xlsx, desde_xlsx = medir(procesar_rentas_periodos, rutas, repeticiones=1)
+        segundos_archivo, desde_archivo = medir(totales_rentas_archivadas, raiz, 'bench')
+        for periodo, totales in desde_xlsx.items():
+            for tipo, monto in totales.items():
+                assert abs(desde_archivo[periodo][tipo] - monto) < 0.01, (periodo, tipo)
+
+    print(f"12 meses x {filas_por_mes:,} filas (archivo Parquet, pyarrow {rentas_archive.pyarrow.__version__})")
+    print(f"  re-parseando los .xlsx:  {segundos_xlsx * 1000:10.1f} ms")
+    print(f"  desde el archivo:        {segundos_archivo * 1000:10.1f} ms")
+    print(f"  speedup: {segundos_xlsx / segundos_archivo:.0f}x")
+
+
+if __name__ == '__main__':
+    main()
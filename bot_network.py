@@ -0,0 +1,112 @@
+from urllib.parse import urlparse
+
+# Tipos de recurso que los bots nunca necesitan para completar formularios
+TIPOS_BLOQUEADOS_POR_DEFECTO = ('image', 'media', 'font')
+
+# CDNs de librerías que los portales pueden usar para su JS/CSS (jQuery, Bootstrap, jqGrid...)
+CDNS_PERMITIDOS = (
+    'code.jquery.com',
+    'cdnjs.cloudflare.com',
+    'cdn.jsdelivr.net',
+    'ajax.googleapis.com',
+    'stackpath.bootstrapcdn.com',
+    'maxcdn.bootstrapcdn.com',
+)
+
+# Tamaño típico (bytes) por tipo: una request abortada no informa su tamaño, así que lo que se dejó
+# de descargar es solo una estimación (la cantidad de requests bloqueadas sí es exacta)
+TAMANIO_ESTIMADO = {
+    'image': 30_000,
+    'media': 500_000,
+    'font': 40_000,
+    'stylesheet': 20_000,
+    'script': 60_000,
+}
+TAMANIO_ESTIMADO_OTRO = 5_000
+
+
+class PoliticaRed:
+    """
+    Qué requests puede hacer un bot: aborta los tipos de recurso no esenciales y los
+    hosts de terceros que no estén en la lista permitida del portal.
+    """
+
+    def __init__(self, hosts_permitidos, tipos_bloqueados=TIPOS_BLOQUEADOS_POR_DEFECTO, bloquear_terceros=True):
+        self.hosts_permitidos = tuple(h.lower() for h in hosts_permitidos) + CDNS_PERMITIDOS
+        self.tipos_bloqueados = frozenset(tipos_bloqueados)
+        self.bloquear_terceros = bloquear_terceros
+
+    def _host_permitido(self, host):
+        if not host:
+            return True  # data:, blob:, about:
+        host = host.lower()
+        return any(host == permitido or host.endswith('.' + permitido) for permitido in self.hosts_permitidos)
+
+    def motivo_bloqueo(self, url, resource_type):
+        """Devuelve 'tipo' o 'tercero' si la request debe abortarse, o None si se deja pasar."""
+        if resource_type in self.tipos_bloqueados:
+            return 'tipo'
+        if self.bloquear_terceros and resource_type != 'document' and not self._host_permitido(urlparse(url).hostname):
+            return 'tercero'
+        return None
+
+    def instalar(self, target):
+        """Instala la política en una página o contexto sync y devuelve el `FiltroRed` con sus contadores."""
+        filtro = FiltroRed(self)
+        target.route("**/*", filtro.manejar)
+        return filtro
+
+    async def instalar_async(self, target):
+        """Igual que `instalar`, para páginas o contextos de `playwright.async_api`."""
+        filtro = FiltroRed(self)
+        await target.route("**/*", filtro.manejar_async)
+        return filtro
+
+
+class FiltroRed:
+    """Handler de `route` de una ejecución: aplica la política y cuenta lo bloqueado."""
+
+    def __init__(self, politica):
+        self.politica = politica
+        self.permitidas = 0
+        self.bloqueadas = {}  # {resource_type: cantidad}
+        self.bytes_estimados = 0  # Según TAMANIO_ESTIMADO, no medidos
+
+    def _registrar(self, request):
+        motivo = self.politica.motivo_bloqueo(request.url, request.resource_type)
+        if motivo is None:
+            self.permitidas += 1
+            return False
+        tipo = request.resource_type
+        self.bloqueadas[tipo] = self.bloqueadas.get(tipo, 0) + 1
+        self.bytes_estimados += TAMANIO_ESTIMADO.get(tipo, TAMANIO_ESTIMADO_OTRO)
+        return True
+
+    def manejar(self, route):
+        if self._registrar(route.request):
+            route.abort()
+        else:
+            route.continue_()
+
+    async def manejar_async(self, route):
+        if self._registrar(route.request):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    @property
+    def total_bloqueadas(self):
+        return sum(self.bloqueadas.values())
+
+    def resumen(self):
+        detalle = ", ".join(f"{tipo}={cantidad}" for tipo, cantidad in sorted(self.bloqueadas.items())) or "ninguna"
+        return (f"Filtro de red: {self.total_bloqueadas} requests bloqueadas ({detalle}), "
+                f"{self.permitidas} permitidas. Sin descargar: ~{self.bytes_estimados / 1024:.0f} KB estimados "
+                f"(tamaño típico por tipo, no medido).")
+
+
+# Política por portal: solo el dominio del portal (y CDNs de librerías) puede cargar recursos
+POLITICAS_RED = {
+    'posadas': PoliticaRed(('sistema.posadas.gov.ar',)),
+    'misiones': PoliticaRed(('atm.misiones.gob.ar',)),
+}
@@ -0,0 +1,293 @@
+import asyncio
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+
+
+class MedidorPasos:
+    """
+    Mide el tiempo real de cada paso de un bot y le asigna su presupuesto de espera.
+
+    Uso:
+        medidor = MedidorPasos({'menu': 5000})
+        with medidor.paso('menu') as timeout:
+            locator.wait_for(state="visible", timeout=timeout)
+
+    El presupuesto (en ms) es el timeout que el paso pasa a las esperas de Playwright:
+    si la pantalla del portal no está lista dentro de ese tiempo, el paso falla.
+    """
+
+    def __init__(self, timeouts=None, timeout_por_defecto=10000):
+        self.timeouts = dict(timeouts or {})
+        self.timeout_por_defecto = timeout_por_defecto
+        self.tiempos = []  # [(nombre, segundos, 'ok' | 'error')]
+
+    def timeout(self, nombre):
+        return self.timeouts.get(nombre, self.timeout_por_defecto)
+
+    @contextmanager
+    def paso(self, nombre):
+        inicio = time.perf_counter()
+        estado = 'ok'
+        try:
+            yield self.timeout(nombre)
+        except Exception:
+            estado = 'error'
+            raise
+        finally:
+            self.tiempos.append((nombre, time.perf_counter() - inicio, estado))
+
+    def total(self):
+        return sum(segundos for _, segundos, _ in self.tiempos)
+
+    def resumen(self):
+        """Texto con el tiempo de cada paso frente a su presupuesto, para el output del bot."""
+        lineas = ["Tiempos por paso:"]
+        for nombre, segundos, estado in self.tiempos:
+            marca = "" if estado == 'ok' else " (ERROR)"
+            lineas.append(f"  - {nombre}: {segundos:.2f}s / presupuesto {self.timeout(nombre) / 1000:.0f}s{marca}")
+        lineas.append(f"  Total: {self.total():.2f}s")
+        return "\n".join(lineas)
+
+
+class PasoFatal(Exception):
+    """Error que no se arregla reintentando (ej. credenciales rechazadas): corta el flujo sin reintentos."""
+
+
+class Paso:
+    """
+    Un paso con nombre de un flujo de bot.
+
+    Args:
+        nombre (str): Nombre del paso (también la clave de su presupuesto en `MedidorPasos`).
+        funcion (callable): `funcion(estado, timeout)`; sync o async según el motor que la ejecute.
+        reintentos (int, optional): Reintentos del paso antes de reanudar desde un punto de control.
+            None usa el valor por defecto del motor.
+        punto_control (bool): Si el flujo puede reanudarse desde este paso cuando falla uno posterior.
+        preparar (callable, optional): `preparar(estado, timeout)`, se llama antes de volver a
+            ejecutar el paso (reintento o reanudación) para dejar la pantalla en su estado inicial.
+    """
+
+    def __init__(self, nombre, funcion, reintentos=None, punto_control=False, preparar=None):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.reintentos = reintentos
+        self.punto_control = punto_control
+        self.preparar = preparar
+
+
+class MotorPasos:
+    """
+    Ejecuta un flujo como una secuencia de `Paso`, dentro del mismo navegador y contexto.
+
+    Si un paso falla, se reintenta solo ese paso. Si agota sus reintentos, el flujo se
+    reanuda desde el último punto de control (el mismo paso o uno anterior) en lugar de
+    volver a empezar desde el login: lo que ya se obtuvo (sesión, Excel descargado...)
+    queda en `estado` y no se repite. `PasoFatal` corta el flujo sin reintentar.
+    """
+
+    def __init__(self, pasos, medidor=None, reintentos=1, reanudaciones=1, espera_reintento=1.0, output_messages=None):
+        self.pasos = list(pasos)
+        self.medidor = medidor or MedidorPasos()
+        self.reintentos = reintentos
+        self.reanudaciones = reanudaciones
+        self.espera_reintento = espera_reintento
+        self.output_messages = output_messages if output_messages is not None else []
+        self.completados = []  # Nombres de los pasos terminados, en orden (incluye repeticiones)
+
+    def _intentos(self, paso):
+        return 1 + (self.reintentos if paso.reintentos is None else paso.reintentos)
+
+    def _punto_de_reanudacion(self, indice):
+        """Índice del último punto de control en o antes de `indice`, o None."""
+        for i in range(indice, -1, -1):
+            if self.pasos[i].punto_control:
+                return i
+        return None
+
+    def _tras_fallo(self, indice, error, reanudaciones_hechas):
+        """Decide dónde sigue el flujo tras agotar los reintentos de un paso; relanza si no hay dónde."""
+        destino = self._punto_de_reanudacion(indice)
+        if isinstance(error, PasoFatal) or destino is None or reanudaciones_hechas >= self.reanudaciones:
+            raise error
+        self.output_messages.append(
+            f"Paso '{self.pasos[indice].nombre}' agotó sus reintentos. Reanudando desde '{self.pasos[destino].nombre}'...")
+        return destino
+
+    def _avisar_reintento(self, paso, intento, error):
+        self.output_messages.append(f"Paso '{paso.nombre}' falló ({error}). Reintento {intento}/{self._intentos(paso) - 1}...")
+
+    def ejecutar(self, estado):
+        indice, reanudaciones_hechas, reanudando = 0, 0, False
+        while indice < len(self.pasos):
+            try:
+                self._ejecutar_paso(self.pasos[indice], estado, reanudando)
+            except Exception as e:
+                indice = self._tras_fallo(indice, e, reanudaciones_hechas)
+                reanudaciones_hechas += 1
+                reanudando = True
+                continue
+            self.completados.append(self.pasos[indice].nombre)
+            indice, reanudando = indice + 1, False
+        return estado
+
+    def _ejecutar_paso(self, paso, estado, reanudando):
+        intentos = self._intentos(paso)
+        for intento in range(1, intentos + 1):
+            try:
+                with self.medidor.paso(paso.nombre) as timeout:
+                    if paso.preparar is not None and (reanudando or intento > 1):
+                        paso.preparar(estado, timeout)
+                    return paso.funcion(estado, timeout)
+            except PasoFatal:
+                raise
+            except Exception as e:
+                if intento == intentos:
+                    raise
+                self._avisar_reintento(paso, intento, e)
+                time.sleep(self.espera_reintento)
+
+    async def ejecutar_async(self, estado):
+        """Igual que `ejecutar`, con pasos (y `preparar`) async."""
+        indice, reanudaciones_hechas, reanudando = 0, 0, False
+        while indice < len(self.pasos):
+            try:
+                await self._ejecutar_paso_async(self.pasos[indice], estado, reanudando)
+            except Exception as e:
+                indice = self._tras_fallo(indice, e, reanudaciones_hechas)
+                reanudaciones_hechas += 1
+                reanudando = True
+                continue
+            self.completados.append(self.pasos[indice].nombre)
+            indice, reanudando = indice + 1, False
+        return estado
+
+    async def _ejecutar_paso_async(self, paso, estado, reanudando):
+        intentos = self._intentos(paso)
+        for intento in range(1, intentos + 1):
+            try:
+                with self.medidor.paso(paso.nombre) as timeout:
+                    if paso.preparar is not None and (reanudando or intento > 1):
+                        await paso.preparar(estado, timeout)
+                    return await paso.funcion(estado, timeout)
+            except PasoFatal:
+                raise
+            except Exception as e:
+                if intento == intentos:
+                    raise
+                self._avisar_reintento(paso, intento, e)
+                await asyncio.sleep(self.espera_reintento)
+
+
+# ==============================================================================
+# PASOS ÚNICOS PARA PLAYWRIGHT SYNC Y ASYNC
+# ==============================================================================
+# Cada paso se escribe una sola vez, como generador que hace `yield` de cada llamada a
+# Playwright y recibe su resultado:
+#
+#     def _paso_menu(estado, timeout):
+#         yield estado['page'].click(".menu-toggler")
+#         cantidad = yield estado['page'].locator("#menu li").count()
+#
+# Con `playwright.sync_api` la llamada ya se hizo y el valor vuelve tal cual (`correr`);
+# con `playwright.async_api` es una corrutina que `correr_async` espera. Lo que no es una
+# llamada simple a Playwright se pide con `EnHilo` o `Esperar`. Los helpers del flujo
+# también son generadores y se usan con `yield from`.
+
+class EnHilo:
+    """Trabajo bloqueante (session_store, pandas...): directo en sync, en un hilo aparte en async."""
+
+    def __init__(self, funcion, *args):
+        self.funcion = funcion
+        self.args = args
+
+
+class Esperar:
+    """
+    Evento disparado por una acción, como `with page.expect_download() as info: page.click(...)`.
+    `gestor` es el `page.expect_*()` y `accion` una función sin argumentos que hace el clic;
+    el paso recibe `info.value` (la descarga, la ventana emergente...).
+    """
+
+    def __init__(self, gestor, accion):
+        self.gestor = gestor
+        self.accion = accion
+
+
+def _resolver(pedido):
+    if isinstance(pedido, EnHilo):
+        return pedido.funcion(*pedido.args)
+    if isinstance(pedido, Esperar):
+        with pedido.gestor as info:
+            pedido.accion()
+        return info.value
+    return pedido
+
+
+async def _resolver_async(pedido):
+    if isinstance(pedido, EnHilo):
+        return await asyncio.to_thread(pedido.funcion, *pedido.args)
+    if isinstance(pedido, Esperar):
+        async with pedido.gestor as info:
+            await pedido.accion()
+        return await info.value
+    return await pedido if inspect.isawaitable(pedido) else pedido
+
+
+def correr(generador):
+    """Ejecuta un paso (o helper) generador con `playwright.sync_api` y devuelve su resultado."""
+    enviar, valor = generador.send, None
+    while True:
+        try:
+            pedido = enviar(valor)
+        except StopIteration as fin:
+            return fin.value
+        try:
+            valor, enviar = _resolver(pedido), generador.send
+        except Exception as e:
+            valor, enviar = e, generador.throw  # El error se levanta dentro del paso, en su `yield`
+
+
+async def correr_async(generador):
+    """Igual que `correr`, con `playwright.async_api`."""
+    enviar, valor = generador.send, None
+    while True:
+        try:
+            pedido = enviar(valor)
+        except StopIteration as fin:
+            return fin.value
+        try:
+            valor, enviar = await _resolver_async(pedido), generador.send
+        except Exception as e:
+            valor, enviar = e, generador.throw
+
+
+def _sync(funcion):
+    @functools.wraps(funcion)
+    def ejecutar(estado, timeout):
+        return correr(funcion(estado, timeout))
+    return ejecutar
+
+
+def _async(funcion):
+    @functools.wraps(funcion)
+    async def ejecutar(estado, timeout):
+        return await correr_async(funcion(estado, timeout))
+    return ejecutar
+
+
+def _adaptar(pasos, envolver):
+    return [Paso(paso.nombre, envolver(paso.funcion), paso.reintentos, paso.punto_control,
+                 envolver(paso.preparar) if paso.preparar is not None else None)
+            for paso in pasos]
+
+
+def pasos_sync(pasos):
+    """Los `pasos` (con funciones generadoras) listos para `MotorPasos.ejecutar`."""
+    return _adaptar(pasos, _sync)
+
+
+def pasos_async(pasos):
+    """Los mismos `pasos`, listos para `MotorPasos.ejecutar_async`."""
+    return _adaptar(pasos, _async)
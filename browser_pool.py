@@ -0,0 +1,146 @@
+import itertools
+import logging
+import threading
+from contextlib import contextmanager
+
+from playwright.sync_api import sync_playwright
+
+logger = logging.getLogger(__name__)
+
+
+class _PooledBrowser:
+    """Navegador del pool con su contador de contextos servidos."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, browser):
+        self.id = next(self._ids)
+        self.browser = browser
+        self.contexts_served = 0
+        self.active_leases = 0
+
+    def is_healthy(self):
+        try:
+            return self.browser.is_connected()
+        except Exception:
+            return False
+
+
+class BrowserPool:
+    """
+    Pool de navegadores Chromium headless de larga vida para el worker de bots.
+
+    Cada ejecución pide un `BrowserContext` nuevo y aislado con `lease()`; el navegador
+    se reutiliza, así que solo se paga el costo de lanzarlo una vez por proceso.
+    Los navegadores se reciclan tras `max_contexts` contextos servidos (para acotar
+    fugas de memoria de Chromium) y se relanzan si dejan de responder.
+
+    Los objetos de `playwright.sync_api` quedan atados al hilo que los creó, por lo
+    que el pool debe usarse desde un único hilo (el del worker).
+    """
+
+    def __init__(self, size=1, max_contexts=50, headless=True, launch_options=None, playwright_factory=sync_playwright):
+        if size < 1:
+            raise ValueError("El tamaño del pool debe ser al menos 1.")
+        self.size = size
+        self.max_contexts = max_contexts
+        self.headless = headless
+        self.launch_options = launch_options or {}
+        self._playwright_factory = playwright_factory
+        self._playwright = None
+        self._browsers = []
+        self._lock = threading.Lock()
+
+    # --- Ciclo de vida ---
+
+    def start(self):
+        if self._playwright is None:
+            self._playwright = self._playwright_factory().start()
+            self._browsers = [self._launch() for _ in range(self.size)]
+            logger.info(f"BrowserPool: {self.size} navegador(es) iniciados.")
+        return self
+
+    def close(self):
+        for pooled in self._browsers:
+            self._close_browser(pooled)
+        self._browsers = []
+        if self._playwright is not None:
+            self._playwright.stop()
+            self._playwright = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _launch(self):
+        browser = self._playwright.chromium.launch(headless=self.headless, **self.launch_options)
+        return _PooledBrowser(browser)
+
+    def _close_browser(self, pooled):
+        try:
+            pooled.browser.close()
+        except Exception as e:
+            logger.warning(f"BrowserPool: Error cerrando navegador #{pooled.id}: {e}")
+
+    def _replace(self, pooled, reason):
+        logger.info(f"BrowserPool: Reemplazando navegador #{pooled.id} ({reason}).")
+        self._close_browser(pooled)
+        replacement = self._launch()
+        self._browsers[self._browsers.index(pooled)] = replacement
+        return replacement
+
+    # --- Salud y reciclado ---
+
+    def health_check(self):
+        """Relanza los navegadores caídos y recicla los que superaron `max_contexts` sin uso activo."""
+        with self._lock:
+            self._refresh_browsers()
+
+    def _refresh_browsers(self):
+        # Debe llamarse con self._lock tomado.
+        for pooled in list(self._browsers):
+            if not pooled.is_healthy():
+                self._replace(pooled, "no responde")
+            elif pooled.active_leases == 0 and pooled.contexts_served >= self.max_contexts:
+                self._replace(pooled, f"{pooled.contexts_served} contextos servidos")
+
+    def _acquire(self):
+        with self._lock:
+            if self._playwright is None:
+                raise RuntimeError("BrowserPool no iniciado. Llamá a start() primero.")
+            self._refresh_browsers()
+            pooled = min(self._browsers, key=lambda b: (b.active_leases, b.contexts_served))
+            pooled.active_leases += 1
+            pooled.contexts_served += 1
+            return pooled
+
+    def _release(self, pooled):
+        with self._lock:
+            pooled.active_leases -= 1
+
+    @contextmanager
+    def lease(self, **context_options):
+        """
+        Entrega un `BrowserContext` nuevo (sin cookies ni storage previos) y lo cierra al salir.
+        Los `context_options` se pasan tal cual a `browser.new_context()`.
+        """
+        pooled = self._acquire()
+        context = None
+        try:
+            context = pooled.browser.new_context(**context_options)
+            yield context
+        finally:
+            if context is not None:
+                try:
+                    context.close()
+                except Exception as e:
+                    logger.warning(f"BrowserPool: Error cerrando contexto: {e}")
+            self._release(pooled)
+
+    def stats(self):
+        return [
+            {'id': b.id, 'contexts_served': b.contexts_served, 'active_leases': b.active_leases, 'healthy': b.is_healthy()}
+            for b in self._browsers
+        ]
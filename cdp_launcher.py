@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.request
+from contextlib import asynccontextmanager, contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Navegadores que se buscan en el PATH si no se indica un ejecutable
+EJECUTABLES_CANDIDATOS = ("msedge", "microsoft-edge", "google-chrome", "chromium", "chromium-browser", "chrome")
+
+
+def _puerto_libre():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _buscar_ejecutable():
+    ejecutable = os.getenv("BOT_CDP_EXECUTABLE")
+    if ejecutable:
+        return ejecutable
+    for candidato in EJECUTABLES_CANDIDATOS:
+        ruta = shutil.which(candidato)
+        if ruta:
+            return ruta
+    # Último recurso: el Chromium que instala Playwright (`playwright install chromium`)
+    from playwright.sync_api import sync_playwright
+    with sync_playwright() as p:
+        return p.chromium.executable_path
+
+
+class _NavegadorCDP:
+    """Proceso de navegador propio con su puerto de depuración y su perfil temporal."""
+
+    def __init__(self, proceso, puerto, user_data_dir):
+        self.proceso = proceso
+        self.puerto = puerto
+        self.user_data_dir = user_data_dir
+        self.en_uso = 0
+
+    @property
+    def endpoint(self):
+        return f"http://127.0.0.1:{self.puerto}"
+
+    def vivo(self):
+        return self.proceso.poll() is None
+
+
+class CDPLauncher:
+    """
+    Lanza y administra uno o más navegadores headless con depuración remota (CDP),
+    cada uno con su puerto y perfil propios, para que `run_rentabot` no dependa de
+    un Edge abierto a mano en 127.0.0.1:9222.
+
+    `lease()` entrega el endpoint del navegador menos ocupado; si el proceso murió
+    (cierre, crash, reinicio), se relanza antes de entregarlo.
+    """
+
+    def __init__(self, cantidad=1, ejecutable=None, headless=True, puertos=None, argumentos_extra=None, timeout_arranque=20):
+        if cantidad < 1:
+            raise ValueError("La cantidad de navegadores debe ser al menos 1.")
+        self.cantidad = cantidad
+        self.ejecutable = ejecutable
+        self.headless = headless
+        self.puertos = list(puertos or [])
+        self.argumentos_extra = list(argumentos_extra or [])
+        self.timeout_arranque = timeout_arranque
+        self._navegadores = []
+        self._lock = threading.Lock()
+
+    # --- Ciclo de vida ---
+
+    def start(self):
+        if not self._navegadores:
+            self.ejecutable = self.ejecutable or _buscar_ejecutable()
+            for i in range(self.cantidad):
+                puerto = self.puertos[i] if i < len(self.puertos) else _puerto_libre()
+                self._navegadores.append(self._lanzar(puerto))
+            logger.info(f"CDPLauncher: {self.cantidad} navegador(es) CDP iniciados.")
+        return self
+
+    def stop(self):
+        for navegador in self._navegadores:
+            self._cerrar(navegador)
+        self._navegadores = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _lanzar(self, puerto):
+        user_data_dir = tempfile.mkdtemp(prefix=f"rentabot_cdp_{puerto}_")
+        comando = [
+            self.ejecutable,
+            f"--remote-debugging-port={puerto}",
+            f"--user-data-dir={user_data_dir}",
+            "--no-first-run",
+            "--no-default-browser-check",
+        ]
+        if self.headless:
+            comando.append("--headless=new")
+        comando += self.argumentos_extra + ["about:blank"]
+
+        proceso = subprocess.Popen(comando, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        navegador = _NavegadorCDP(proceso, puerto, user_data_dir)
+        self._esperar_listo(navegador)
+        logger.info(f"CDPLauncher: Navegador listo en {navegador.endpoint} (pid {proceso.pid}).")
+        return navegador
+
+    def _esperar_listo(self, navegador):
+        limite = time.monotonic() + self.timeout_arranque
+        while time.monotonic() < limite:
+            if not navegador.vivo():
+                raise RuntimeError(f"El navegador CDP en el puerto {navegador.puerto} terminó al iniciar.")
+            try:
+                with urllib.request.urlopen(f"{navegador.endpoint}/json/version", timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        self._cerrar(navegador)
+        raise RuntimeError(f"El navegador CDP en el puerto {navegador.puerto} no respondió en {self.timeout_arranque}s.")
+
+    def _cerrar(self, navegador):
+        if navegador.vivo():
+            navegador.proceso.terminate()
+            try:
+                navegador.proceso.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                navegador.proceso.kill()
+        shutil.rmtree(navegador.user_data_dir, ignore_errors=True)
+
+    # --- Asignación ---
+
+    def _tomar(self):
+        with self._lock:
+            if not self._navegadores:
+                raise RuntimeError("CDPLauncher no iniciado. Llamá a start() primero.")
+            for i, navegador in enumerate(self._navegadores):
+                if not navegador.vivo():
+                    logger.warning(f"CDPLauncher: El navegador del puerto {navegador.puerto} no está corriendo. Relanzando...")
+                    self._cerrar(navegador)
+                    self._navegadores[i] = self._lanzar(navegador.puerto)
+            navegador = min(self._navegadores, key=lambda n: n.en_uso)
+            navegador.en_uso += 1
+            return navegador
+
+    def _devolver(self, navegador):
+        with self._lock:
+            navegador.en_uso -= 1
+
+    @contextmanager
+    def lease(self):
+        """Entrega el endpoint CDP (`http://127.0.0.1:<puerto>`) de un navegador vivo."""
+        navegador = self._tomar()
+        try:
+            yield navegador.endpoint
+        finally:
+            self._devolver(navegador)
+
+    @asynccontextmanager
+    async def lease_async(self):
+        """
+        `lease()` para corrutinas. Tomar un navegador puede relanzarlo y esperar a que responda
+        (con el lock tomado), así que corre en un hilo y no frena el event loop.
+        """
+        navegador = await asyncio.to_thread(self._tomar)
+        try:
+            yield navegador.endpoint
+        finally:
+            await asyncio.to_thread(self._devolver, navegador)
+
+    def endpoints(self):
+        return [navegador.endpoint for navegador in self._navegadores]
@@ -0,0 +1,99 @@
+import logging
+import os
+import shutil
+import urllib.parse
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+# Firmas de archivo de planilla: .xlsx es un ZIP, .xls es un documento OLE2
+FIRMAS_PLANILLA = (
+    b'PK\x03\x04',
+    b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1',
+)
+
+TAMANIO_BLOQUE = 64 * 1024
+
+# Lee del DOM el formulario que envía el botón (con los valores ya cargados en la página)
+JS_FORMULARIO_DEL_BOTON = """(selector) => {
+    const boton = document.querySelector(selector);
+    const form = boton && (boton.form || boton.closest('form'));
+    if (!form) return null;
+    const campos = [];
+    for (const [nombre, valor] of new FormData(form)) {
+        if (typeof valor === 'string') campos.push([nombre, valor]);
+    }
+    if (boton.name) campos.push([boton.name, boton.value || '']);
+    const accion = boton.getAttribute('formaction') || form.getAttribute('action') || location.href;
+    return {
+        action: new URL(accion, location.href).href,
+        method: (boton.getAttribute('formmethod') || form.getAttribute('method') || 'GET').toUpperCase(),
+        enctype: (form.getAttribute('enctype') || 'application/x-www-form-urlencoded').toLowerCase(),
+        campos: campos,
+    };
+}"""
+
+
+def es_planilla(ruta):
+    """True si el archivo empieza con la firma de un .xlsx o un .xls."""
+    with open(ruta, 'rb') as archivo:
+        cabecera = archivo.read(8)
+    return any(cabecera.startswith(firma) for firma in FIRMAS_PLANILLA)
+
+
+def cabecera_cookies(cookies):
+    """Arma el header `Cookie` a partir de `context.cookies(url)` de Playwright."""
+    return "; ".join(f"{cookie['name']}={cookie['value']}" for cookie in cookies)
+
+
+def armar_request(formulario, cookies, user_agent=None, referer=None):
+    """
+    Convierte la descripción del formulario (ver `JS_FORMULARIO_DEL_BOTON`) en un
+    `urllib.request.Request` con la sesión del navegador. Devuelve None si el
+    formulario no se puede reproducir fuera del navegador (ej. multipart).
+    """
+    if formulario is None or formulario.get('enctype') != 'application/x-www-form-urlencoded':
+        return None
+
+    # page.evaluate devuelve los pares como listas; urlencode necesita tuplas
+    datos = urllib.parse.urlencode([tuple(campo) for campo in formulario.get('campos') or []])
+    headers = {'Cookie': cabecera_cookies(cookies)}
+    if user_agent:
+        headers['User-Agent'] = user_agent
+    if referer:
+        headers['Referer'] = referer
+
+    if formulario.get('method') == 'POST':
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        return urllib.request.Request(formulario['action'], data=datos.encode(), headers=headers, method='POST')
+
+    # En un GET el navegador reemplaza el query string de la acción por los campos del formulario
+    partes = urllib.parse.urlsplit(formulario['action'])
+    url = urllib.parse.urlunsplit((partes.scheme, partes.netloc, partes.path, datos, ''))
+    return urllib.request.Request(url, headers=headers, method='GET')
+
+
+def descargar_planilla(request, destino, timeout=60):
+    """
+    Ejecuta el request y guarda la respuesta en `destino` por bloques, sin cargarla
+    entera en memoria. Si lo recibido no es una planilla (ej. la pantalla de login
+    o una página de error), borra el archivo y devuelve None.
+
+    Returns:
+        str | None: La ruta del archivo guardado.
+    """
+    temporal = f"{destino}.parcial"
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as respuesta, open(temporal, 'wb') as archivo:
+            shutil.copyfileobj(respuesta, archivo, TAMANIO_BLOQUE)
+        if not es_planilla(temporal):
+            logger.warning(f"descargar_planilla: La respuesta de {request.full_url} no es una planilla.")
+            os.remove(temporal)
+            return None
+        os.replace(temporal, destino)
+        return destino
+    except OSError as e:
+        logger.warning(f"descargar_planilla: Falló la descarga directa de {request.full_url}: {e}")
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        return None
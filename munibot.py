@@ -1,7 +1,185 @@
+import asyncio
+import re
+import unicodedata
+from datetime import datetime, timedelta
 from playwright.sync_api import sync_playwright
 import sys
 
-def run_munibot(municipal_username, municipal_password, monto, driver_path=None):  # Opcional, ignóralo
+from bot_network import POLITICAS_RED
+from bot_steps import EnHilo, Esperar, MedidorPasos, MotorPasos, Paso, PasoFatal, pasos_async, pasos_sync
+
+URL_LOGIN = "https://sistema.posadas.gov.ar/mp_sistemas/autogestion/login"
+URL_RELACIONES = "https://sistema.posadas.gov.ar/mp_sistemas/autogestion/relacionesPropias"
+URL_SECCION_DDJJ = "https://sistema.posadas.gov.ar/mp_sistemas/autogestion/seccion/4/show"
+BOTON_LOGIN = 'xpath=//*[@id="wrapper"]/div/div/div[1]/form/div[3]/button'
+DROPDOWN_DDJJ = 'xpath=//*[@id="wrapper"]/div[2]/div/div/div[2]/table/tbody/tr[1]/td[6]/div/select'
+JS_DROPDOWN_CON_OPCIONES = """
+    () => {
+        const xpath = '//*[@id="wrapper"]/div[2]/div/div/div[2]/table/tbody/tr[1]/td[6]/div/select';
+        const result = document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null);
+        const select = result.singleNodeValue;
+        return select && select.querySelectorAll('option').length > 1;
+    }
+"""
+
+MESES = ('enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 'julio', 'agosto', 'septiembre', 'octubre',
+         'noviembre', 'diciembre')
+
+# Presupuesto de espera por paso (ms), ver bot_steps.MedidorPasos
+TIMEOUTS_PASOS = {
+    'sesion': 30000,
+    'seccion_ddjj': 30000,
+    'declaracion': 30000,
+}
+
+def _es_pagina_login(page):
+    """El portal redirige al login cuando la sesión no es válida."""
+    return "/autogestion/login" in page.url
+
+def _login(page, municipal_username, municipal_password, output_messages, timeout):
+    # Paso 1: Login
+    yield page.goto(URL_LOGIN, timeout=timeout)
+    yield page.fill("#username", municipal_username, timeout=timeout)
+    yield page.fill("#password", municipal_password, timeout=timeout)
+    yield page.click(BOTON_LOGIN, timeout=timeout)
+    output_messages.append("Login hecho. Esperando redirección...")
+    
+    yield page.wait_for_load_state("networkidle", timeout=timeout)
+
+def _paso_sesion(estado, timeout):
+    """
+    Deja la página con una sesión válida. Si el contexto se creó con una sesión guardada,
+    intenta saltear el login y solo lo hace completo cuando el portal rechaza la sesión.
+    """
+    page, output_messages, session_store = estado['page'], estado['output'], estado['session_store']
+    # La sesión guardada se prueba una sola vez: si este paso se reintenta, ya fue usada o descartada
+    sesion_guardada, estado['sesion_guardada'] = estado['sesion_guardada'], False
+    if sesion_guardada:
+        yield page.goto(URL_RELACIONES, timeout=timeout)
+        yield page.wait_for_load_state("networkidle", timeout=timeout)
+        if _es_pagina_login(page):
+            output_messages.append("La sesión guardada fue rechazada. Haciendo login completo...")
+            yield EnHilo(session_store.clear)
+            sesion_guardada = False
+        else:
+            output_messages.append("Sesión guardada reutilizada (sin login).")
+            output_messages.append("Entramos a relacionesPropias")
+
+    if not sesion_guardada:
+        yield from _login(page, estado['municipal_username'], estado['municipal_password'], output_messages, timeout)
+
+        # Paso 2: Navegación
+        yield page.goto(URL_RELACIONES, timeout=timeout)
+        output_messages.append("Entramos a relacionesPropias")
+        yield page.wait_for_load_state("networkidle", timeout=timeout)
+        if _es_pagina_login(page):
+            raise PasoFatal("El portal rechazó el login. Revisá las credenciales de la municipalidad.")
+        if session_store is not None:
+            yield EnHilo(session_store.save, (yield page.context.storage_state()))
+            output_messages.append("Sesión guardada para las próximas ejecuciones.")
+
+def _paso_seccion_ddjj(estado, timeout):
+    page = estado['page']
+    yield page.goto(URL_SECCION_DDJJ, timeout=timeout)
+    estado['output'].append("Entramos a sección 4 (declaración jurada mensual)")
+    yield page.wait_for_load_state("networkidle", timeout=timeout)
+
+def _periodo_por_defecto():
+    """El mes anterior, en formato 'YYYY-MM': el que el portal ofrece primero."""
+    return (datetime.today().replace(day=1) - timedelta(days=1)).strftime("%Y-%m")
+
+def _menciona_periodo(etiqueta, periodo):
+    """True si la etiqueta de una opción nombra el período ('03/2026', '2026-03', 'Marzo 2026'...)."""
+    anio, mes = periodo.split('-')
+    texto = unicodedata.normalize('NFKD', etiqueta).encode('ascii', 'ignore').decode().lower()
+    nombres = MESES[int(mes) - 1] + ('|setiembre' if mes == '09' else '')
+    return bool(re.search(rf'(?<!\d)0?{int(mes)}\s*[/-]\s*{anio}(?!\d)', texto)
+                or re.search(rf'(?<!\d){anio}\s*[/-]\s*0?{int(mes)}(?!\d)', texto)
+                or re.search(rf'\b(?:{nombres})\b\W*(?:de\s+)?{anio}(?!\d)', texto))
+
+def _opcion_del_periodo(etiquetas, periodo):
+    """
+    Índice de la opción del select DDJJ que corresponde a `periodo`. Si ninguna etiqueta nombra
+    un período se usa la primera opción (la del mes anterior), pero solo para ese período: con
+    otro, la declaración se cancela en lugar de presentar el mes equivocado.
+    """
+    periodo = periodo or _periodo_por_defecto()
+    for indice, etiqueta in enumerate(etiquetas):
+        if indice and _menciona_periodo(etiqueta, periodo):
+            return indice
+    if periodo == _periodo_por_defecto():
+        return 1
+    raise PasoFatal(f"El portal no ofrece una declaración jurada para el período {periodo} "
+                    f"(opciones: {', '.join(etiquetas[1:]) or 'ninguna'}).")
+
+def _paso_declaracion(estado, timeout):
+    page, output_messages = estado['page'], estado['output']
+    if estado['periodo']:
+        output_messages.append(f"Período a declarar: {estado['periodo']}")
+    # Paso 3: Esperar y seleccionar dropdown
+    dropdown_selector = DROPDOWN_DDJJ
+    dropdown_locator = page.locator(dropdown_selector)
+    yield dropdown_locator.wait_for(state="visible", timeout=timeout)  # Espera que el select aparezca (attached y visible)
+    
+    # Espera que haya al menos 2 opciones (sin chequear visibility, ya que options suelen estar hidden)
+    # Mimica tu original: len(options) > 1, usando wait_for_function
+    yield page.wait_for_function(JS_DROPDOWN_CON_OPCIONES, timeout=timeout)
+    indice = _opcion_del_periodo((yield dropdown_locator.locator("option").all_inner_texts()), estado['periodo'])
+    
+    # Captura popup y selecciona (el select abre la ventana)
+    popup_page = yield Esperar(page.expect_popup(), lambda: page.select_option(dropdown_selector, index=indice))
+    output_messages.append("Seleccionada opción: Declaración Jurada Mensual")
+    output_messages.append("Cambiamos a la ventana nueva")
+    
+    # Paso 4: Ingresar monto
+    #popup_page.fill("#monto_imponible", estado['monto'])
+    #output_messages.append(f"Escrito el monto: {estado['monto']}")
+    
+    # Paso 5: Click en "Agregar"
+    #popup_page.click("#addRow")
+    #output_messages.append("Clic en Agregar")
+    
+    # Paso 6: Click en "Presentar"
+    #popup_page.click("#send")
+    output_messages.append("Declaración presentada con éxito.")
+
+# La sección DDJJ es el punto de control: si la declaración falla, se vuelve a abrir la
+# sección (sin repetir el login). La declaración no se reintenta en el lugar porque el
+# select ya pudo haber abierto la ventana emergente.
+FLUJO_MUNIBOT = [
+    Paso('sesion', _paso_sesion),
+    Paso('seccion_ddjj', _paso_seccion_ddjj, punto_control=True),
+    Paso('declaracion', _paso_declaracion, reintentos=0),
+]
+# El mismo flujo para playwright.sync_api (run_munibot) y playwright.async_api (run_munibot_async)
+PASOS_MUNIBOT = pasos_sync(FLUJO_MUNIBOT)
+PASOS_MUNIBOT_ASYNC = pasos_async(FLUJO_MUNIBOT)
+
+def _estado_inicial(page, municipal_username, municipal_password, monto, output_messages, session_store, sesion_guardada,
+                    periodo=None):
+    return {
+        'page': page,
+        'output': output_messages,
+        'municipal_username': municipal_username,
+        'municipal_password': municipal_password,
+        'monto': monto,
+        'session_store': session_store,
+        'sesion_guardada': sesion_guardada,
+        'periodo': periodo,
+    }
+
+def _presentar_ddjj(page, municipal_username, municipal_password, monto, output_messages, session_store=None,
+                    sesion_guardada=False, medidor=None, periodo=None):
+    """
+    Recorre el flujo de login y declaración jurada (`PASOS_MUNIBOT`) sobre una página ya abierta.
+    Un paso que falla se reintenta, o el flujo se reanuda desde la sección DDJJ, sin volver al login.
+    """
+    estado = _estado_inicial(page, municipal_username, municipal_password, monto, output_messages,
+                             session_store, sesion_guardada, periodo)
+    MotorPasos(PASOS_MUNIBOT, medidor or MedidorPasos(TIMEOUTS_PASOS), output_messages=output_messages).ejecutar(estado)
+
+def run_munibot(municipal_username, municipal_password, monto, driver_path=None, pool=None, session_store=None,
+                politica_red=None, periodo=None):  # driver_path: opcional, ignóralo
     """
     Automatiza el proceso de declaración jurada mensual en el sistema municipal con Playwright.
 
@@ -10,6 +188,15 @@ def run_munibot(municipal_username, municipal_password, monto, driver_path=None)
         municipal_password (str): Contraseña para el sistema municipal.
         monto (str): Monto imponible a declarar.
         driver_path (str, optional): Ruta al driver (no usada en Playwright).
+        pool (BrowserPool, optional): Pool de navegadores del worker. Si se pasa, la
+            ejecución usa un contexto aislado de un navegador ya abierto en lugar de
+            lanzar uno nuevo.
+        session_store (optional): Objeto con `load()`, `save(state)` y `clear()` para
+            reutilizar el `storage_state` de un login previo.
+        politica_red (PoliticaRed, optional): Qué requests se abortan (imágenes, fuentes,
+            terceros...). Por defecto la del portal de Posadas; `False` desactiva el filtro.
+        periodo (str, optional): Período 'YYYY-MM' que se declara (por defecto el mes anterior). Se
+            elige la opción del select DDJJ que lo nombra; si el portal no lo ofrece, la ejecución falla.
 
     Returns:
         tuple: (status, output, error)
@@ -21,74 +208,78 @@ def run_munibot(municipal_username, municipal_password, monto, driver_path=None)
     error_messages = []
     status = 'Failed'
 
+    storage_state = session_store.load() if session_store is not None else None
+    politica = POLITICAS_RED['posadas'] if politica_red is None else politica_red
+    filtro = None
+    medidor = MedidorPasos(TIMEOUTS_PASOS)
+
     try:
-        with sync_playwright() as p:
-            # Lanzar Edge (channel="msedge" para matching tu driver original)
-            browser = p.chromium.launch(headless=False, channel="msedge")  # Cambia a True para headless en prod
-            context = browser.new_context()
-            page = context.new_page()
-            
-            # Paso 1: Login
-            page.goto("https://sistema.posadas.gov.ar/mp_sistemas/autogestion/login")
-            page.fill("#username", municipal_username)
-            page.fill("#password", municipal_password)
-            page.click('xpath=//*[@id="wrapper"]/div/div/div[1]/form/div[3]/button')
-            output_messages.append("Login hecho. Esperando redirección...")
-            
-            page.wait_for_load_state("networkidle")
-            
-            # Paso 2: Navegación
-            page.goto("https://sistema.posadas.gov.ar/mp_sistemas/autogestion/relacionesPropias")
-            output_messages.append("Entramos a relacionesPropias")
-            page.wait_for_load_state("networkidle")
-            
-            page.goto("https://sistema.posadas.gov.ar/mp_sistemas/autogestion/seccion/4/show")
-            output_messages.append("Entramos a sección 4 (declaración jurada mensual)")
-            page.wait_for_load_state("networkidle")
-            
-            # Paso 3: Esperar y seleccionar dropdown
-            dropdown_selector = 'xpath=//*[@id="wrapper"]/div[2]/div/div/div[2]/table/tbody/tr[1]/td[6]/div/select'
-            dropdown_locator = page.locator(dropdown_selector)
-            dropdown_locator.wait_for(state="visible")  # Espera que el select aparezca (attached y visible)
-            
-            # Espera que haya al menos 2 opciones (sin chequear visibility, ya que options suelen estar hidden)
-            # Mimica tu original: len(options) > 1, usando wait_for_function
-            page.wait_for_function(
-                """
-                () => {
-                    const xpath = '//*[@id="wrapper"]/div[2]/div/div/div[2]/table/tbody/tr[1]/td[6]/div/select';
-                    const result = document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null);
-                    const select = result.singleNodeValue;
-                    return select && select.querySelectorAll('option').length > 1;
-                }
-                """,
-                timeout=30000
-            )
-            
-            # Captura popup y selecciona (el select abre la ventana)
-            with page.expect_popup() as popup_info:
-                page.select_option(dropdown_selector, index=1)
-            output_messages.append("Seleccionada opción: Declaración Jurada Mensual")
-            
-            popup_page = popup_info.value
-            output_messages.append("Cambiamos a la ventana nueva")
-            
-            # Paso 4: Ingresar monto
-            #popup_page.fill("#monto_imponible", monto)
-            #output_messages.append(f"Escrito el monto: {monto}")
-            
-            # Paso 5: Click en "Agregar"
-            #popup_page.click("#addRow")
-            #output_messages.append("Clic en Agregar")
-            
-            # Paso 6: Click en "Presentar"
-            #popup_page.click("#send")
-            output_messages.append("Declaración presentada con éxito.")
-            
-            browser.close()
-            status = 'Success'
+        if pool is not None:
+            with pool.lease(storage_state=storage_state) as context:
+                filtro = politica.instalar(context) if politica else None
+                _presentar_ddjj(context.new_page(), municipal_username, municipal_password, monto, output_messages,
+                                session_store, sesion_guardada=storage_state is not None, medidor=medidor,
+                                periodo=periodo)
+        else:
+            with sync_playwright() as p:
+                # Lanzar Edge (channel="msedge" para matching tu driver original)
+                browser = p.chromium.launch(headless=False, channel="msedge")  # Cambia a True para headless en prod
+                context = browser.new_context(storage_state=storage_state)
+                filtro = politica.instalar(context) if politica else None
+                _presentar_ddjj(context.new_page(), municipal_username, municipal_password, monto, output_messages,
+                                session_store, sesion_guardada=storage_state is not None, medidor=medidor,
+                                periodo=periodo)
+                browser.close()
+        status = 'Success'
 
     except Exception as e:
         error_messages.append(f"Error en munibot: {e}")
+    finally:
+        if filtro is not None:
+            output_messages.append(filtro.resumen())
+        output_messages.append(medidor.resumen())
     
-    return status, "\n".join(output_messages), "\n".join(error_messages)
\ No newline at end of file
+    return status, "\n".join(output_messages), "\n".join(error_messages)
+
+
+# ==============================================================================
+# VERSIÓN ASYNC (playwright.async_api) para el runner concurrente
+# ==============================================================================
+async def run_munibot_async(municipal_username, municipal_password, monto, browser, session_store=None, politica_red=None,
+                            periodo=None):
+    """
+    Igual que `run_munibot`, pero sobre `playwright.async_api` y un navegador compartido:
+    cada llamada abre su propio contexto aislado en `browser` y lo cierra al terminar.
+
+    Returns:
+        tuple: (status, output, error), con el mismo formato que `run_munibot`.
+    """
+    output_messages = []
+    error_messages = []
+    status = 'Failed'
+
+    politica = POLITICAS_RED['posadas'] if politica_red is None else politica_red
+    filtro = None
+    medidor = MedidorPasos(TIMEOUTS_PASOS)
+
+    try:
+        storage_state = await asyncio.to_thread(session_store.load) if session_store is not None else None
+        context = await browser.new_context(storage_state=storage_state)
+        try:
+            filtro = await politica.instalar_async(context) if politica else None
+            page = await context.new_page()
+            estado = _estado_inicial(page, municipal_username, municipal_password, monto, output_messages,
+                                     session_store, storage_state is not None, periodo)
+            await MotorPasos(PASOS_MUNIBOT_ASYNC, medidor, output_messages=output_messages).ejecutar_async(estado)
+        finally:
+            await context.close()
+        status = 'Success'
+
+    except Exception as e:
+        error_messages.append(f"Error en munibot: {e}")
+    finally:
+        if filtro is not None:
+            output_messages.append(filtro.resumen())
+        output_messages.append(medidor.resumen())
+
+    return status, "\n".join(output_messages), "\n".join(error_messages)
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import MunicipalCredentials, ExecutionHistory
+from .models import MunicipalCredentials, ExecutionHistory, BotJob, ParsedUploadCache, RentasLine
 
 admin.site.register(MunicipalCredentials)
 admin.site.register(ExecutionHistory)
+admin.site.register(BotJob)
+admin.site.register(ParsedUploadCache)
+admin.site.register(RentasLine)
@@ -0,0 +1,85 @@
+import threading
+
+import faiss
+import numpy as np
+
+
+class CacheRespuestas:
+    """
+    Cache semántica de respuestas del chatbot: guarda (embedding de la pregunta, respuesta) y
+    devuelve la respuesta de una pregunta anterior cuando la nueva está a una distancia coseno
+    de a lo sumo `distancia_maxima` (es decir, es otra forma de preguntar lo mismo).
+
+    La búsqueda usa un índice FAISS propio (producto interno sobre vectores normalizados). Cada
+    respuesta queda atada a la versión del índice de conocimiento con la que se generó: si el
+    índice cambia, la cache se vacía sola. Guarda a lo sumo `max_entradas` (descarta las más viejas).
+    """
+
+    def __init__(self, max_entradas, distancia_maxima):
+        self.max_entradas = max_entradas
+        self.distancia_maxima = distancia_maxima
+        self._lock = threading.Lock()
+        self._indice = None
+        self._respuestas = {}  # id del vector -> respuesta, en orden de llegada
+        self._proximo_id = 0
+        self.version = None
+        self.aciertos = 0
+        self.fallos = 0
+
+    @staticmethod
+    def _normalizado(embedding):
+        vector = np.array(embedding, dtype='float32').reshape(1, -1)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def _vaciar(self, version):
+        self._indice = None
+        self._respuestas.clear()
+        self.version = version
+
+    def limpiar(self):
+        with self._lock:
+            self._vaciar(None)
+
+    def buscar(self, embedding, version):
+        """La respuesta de la pregunta guardada más parecida, o None si ninguna está lo bastante cerca."""
+        vector = self._normalizado(embedding)
+        with self._lock:
+            if version != self.version:
+                self._vaciar(version)
+            if self._indice is not None and self._indice.ntotal and self._indice.d == vector.shape[1]:
+                similitudes, ids = self._indice.search(vector, 1)
+                if ids[0][0] != -1 and 1.0 - similitudes[0][0] <= self.distancia_maxima:
+                    self.aciertos += 1
+                    return self._respuestas[int(ids[0][0])]
+            self.fallos += 1
+            return None
+
+    def guardar(self, embedding, respuesta, version):
+        if self.max_entradas <= 0:
+            return
+        vector = self._normalizado(embedding)
+        with self._lock:
+            if version != self.version or (self._indice is not None and self._indice.d != vector.shape[1]):
+                self._vaciar(version)
+            if self._indice is None:
+                self._indice = faiss.IndexIDMap2(faiss.IndexFlatIP(vector.shape[1]))
+            identificador = self._proximo_id
+            self._proximo_id += 1
+            self._indice.add_with_ids(vector, np.array([identificador], dtype='int64'))
+            self._respuestas[identificador] = respuesta
+            if len(self._respuestas) > self.max_entradas:
+                viejos = list(self._respuestas)[:len(self._respuestas) - self.max_entradas]
+                self._indice.remove_ids(np.array(viejos, dtype='int64'))
+                for viejo in viejos:
+                    del self._respuestas[viejo]
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._respuestas),
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': self.aciertos / consultas if consultas else 0.0,
+            }
@@ -0,0 +1,192 @@
+import csv
+import logging
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connections
+
+from .jobs import ERROR_INTERRUMPIDO, claim_job, parse_amount, process_job
+from .models import BotJob, MunicipalCredentials, MisionesCredentials
+from browser_pool import BrowserPool
+from cdp_launcher import CDPLauncher
+
+logger = logging.getLogger(__name__)
+
+CREDENCIALES_POR_PORTAL = {
+    BotJob.PORTAL_POSADAS: MunicipalCredentials,
+    BotJob.PORTAL_MISIONES: MisionesCredentials,
+}
+
+
+def leer_montos(ruta):
+    """Lee un CSV con columnas `username,amount` y devuelve {username: Decimal}."""
+    montos = {}
+    with open(ruta, newline='', encoding='utf-8-sig') as archivo:
+        for fila in csv.DictReader(archivo):
+            username = (fila.get('username') or '').strip()
+            if username:
+                montos[username] = parse_amount((fila.get('amount') or '').strip())
+    return montos
+
+
+def planificar_periodo(portal, period, montos=None, reintentar_interrumpidos=False):
+    """
+    Arma la lista de trabajos a presentar para un período, usando los `BotJob` como checkpoint:
+
+    - Usuario con un trabajo exitoso en el período: ya presentado, se saltea.
+    - Usuario con un trabajo 'running' (corrida interrumpida o worker activo), o cuyo último
+      trabajo el worker dio por perdido (`jobs.fail_stale_jobs`): no se toca, porque el portal
+      pudo haber recibido la presentación. Con `reintentar_interrumpidos` se vuelve a encolar.
+    - Usuario con un trabajo en cola: se reutiliza.
+    - Resto (sin trabajo, o solo fallidos): se encola un trabajo nuevo.
+
+    Returns:
+        dict: 'pendientes' (ids de `BotJob` en cola), 'presentados' (cantidad) e
+              'interrumpidos' (ids de `BotJob` que quedaron en 'running' o se dieron por perdidos).
+    """
+    montos = montos or {}
+    trabajos_por_usuario = {}
+    for job in BotJob.objects.filter(portal=portal, period=period).order_by('created_at', 'pk'):
+        trabajos_por_usuario.setdefault(job.user_id, []).append(job)
+
+    plan = {'pendientes': [], 'presentados': 0, 'interrumpidos': []}
+    credenciales = CREDENCIALES_POR_PORTAL[portal].objects.filter(user__is_active=True).select_related('user').order_by('user_id')
+    for credencial in credenciales:
+        trabajos = trabajos_por_usuario.get(credencial.user_id, [])
+        if any(job.result == 'Success' for job in trabajos):
+            plan['presentados'] += 1
+            continue
+
+        en_curso = [job for job in trabajos if job.status == BotJob.STATUS_RUNNING]
+        interrumpidos = en_curso or [job for job in trabajos[-1:] if job.error == ERROR_INTERRUMPIDO]
+        if interrumpidos and not reintentar_interrumpidos:
+            plan['interrumpidos'].extend(job.pk for job in interrumpidos)
+            continue
+        if en_curso:
+            BotJob.objects.filter(pk__in=[job.pk for job in en_curso]).update(status=BotJob.STATUS_QUEUED, started_at=None)
+
+        en_cola = [job for job in trabajos if job.status in (BotJob.STATUS_QUEUED, BotJob.STATUS_RUNNING)]
+        if en_cola:
+            plan['pendientes'].append(en_cola[0].pk)
+            continue
+
+        job = BotJob.objects.create(
+            user=credencial.user,
+            portal=portal,
+            period=period,
+            amount=montos.get(credencial.user.username),
+        )
+        plan['pendientes'].append(job.pk)
+    return plan
+
+
+def _inicializar_proceso():
+    """Cada proceso del pool abre sus propias conexiones (y configura Django si arrancó con spawn)."""
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'municipal_payments.settings')
+    django.setup()
+    connections.close_all()
+
+
+def procesar_lote(job_ids, portal):
+    """
+    Presenta un lote de trabajos en orden, con navegadores propios del proceso.
+    Cada trabajo se toma con `claim_job`: si otro worker ya lo tomó, se saltea.
+
+    Returns:
+        list: [(job_id, resultado, segundos)] de los trabajos presentados por este lote.
+    """
+    resultados = []
+    pool = None
+    cdp_launcher = None
+    try:
+        if portal == BotJob.PORTAL_POSADAS and getattr(settings, 'BOT_BROWSER_POOL_SIZE', 1) > 0:
+            pool = BrowserPool(size=1, max_contexts=getattr(settings, 'BOT_BROWSER_MAX_CONTEXTS', 50)).start()
+        elif portal == BotJob.PORTAL_MISIONES and getattr(settings, 'BOT_CDP_BROWSERS', 1) > 0:
+            cdp_launcher = CDPLauncher(cantidad=1).start()
+
+        for job_id in job_ids:
+            job = claim_job(job_id)
+            if job is None:
+                logger.info(f"procesar_lote: Job #{job_id} ya fue tomado por otro worker.")
+                continue
+            inicio = time.perf_counter()
+            job = process_job(job, pool=pool, cdp_launcher=cdp_launcher)
+            resultados.append((job.pk, job.result, time.perf_counter() - inicio))
+    finally:
+        if pool is not None:
+            pool.close()
+        if cdp_launcher is not None:
+            cdp_launcher.stop()
+        connections.close_all()
+    return resultados
+
+
+def repartir(job_ids, procesos):
+    """Reparte los trabajos en `procesos` lotes (round-robin, para equilibrar la carga)."""
+    procesos = max(1, min(procesos, len(job_ids)))
+    return [job_ids[i::procesos] for i in range(procesos)]
+
+
+def ejecutar_periodo(job_ids, portal, procesos=1, al_terminar_lote=None):
+    """
+    Presenta los trabajos repartidos en un pool de procesos (uno por lote).
+    Con `procesos` <= 1 todo corre en el proceso actual.
+
+    Args:
+        al_terminar_lote (callable, optional): Se llama con la lista de resultados de cada lote.
+
+    Returns:
+        list: [(job_id, resultado, segundos)] de todos los lotes.
+    """
+    if not job_ids:
+        return []
+    lotes = repartir(job_ids, procesos)
+    resultados = []
+    if len(lotes) == 1:
+        resultados = procesar_lote(lotes[0], portal)
+        if al_terminar_lote:
+            al_terminar_lote(resultados)
+        return resultados
+
+    # Las conexiones abiertas no deben heredarse en los procesos hijos (fork)
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=len(lotes), initializer=_inicializar_proceso) as executor:
+        futuros = [executor.submit(procesar_lote, lote, portal) for lote in lotes]
+        for futuro in as_completed(futuros):
+            try:
+                resultados_lote = futuro.result()
+            except Exception as e:
+                # Los trabajos no terminados quedan en cola (o 'running') y la próxima corrida los retoma
+                logger.error(f"ejecutar_periodo: Falló un lote de {portal}: {e}")
+                continue
+            resultados.extend(resultados_lote)
+            if al_terminar_lote:
+                al_terminar_lote(resultados_lote)
+    return resultados
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano (p entre 0 y 100); None si no hay valores."""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    indice = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[indice]
+
+
+def resumen_throughput(resultados, segundos_totales):
+    """Presentaciones por minuto y duración p50/p95 por usuario."""
+    duraciones = [segundos for _, _, segundos in resultados]
+    return {
+        'total': len(resultados),
+        'exitosos': sum(1 for _, resultado, _ in resultados if resultado == 'Success'),
+        'fallidos': sum(1 for _, resultado, _ in resultados if resultado != 'Success'),
+        'por_minuto': len(resultados) / (segundos_totales / 60) if segundos_totales > 0 else 0.0,
+        'p50': percentil(duraciones, 50),
+        'p95': percentil(duraciones, 95),
+        'segundos': segundos_totales,
+    }
@@ -0,0 +1,172 @@
+import logging
+import os
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.utils.text import get_valid_filename
+
+from .upload_cache import buscar_en_cache, guardar_en_cache, hash_archivo
+from .utils import extract_total_from_file, file_type
+
+logger = logging.getLogger(__name__)
+
+TAMANIO_BLOQUE = 64 * 1024
+
+
+def _limite_archivo():
+    return getattr(settings, 'MAX_UPLOAD_SIZE', 10 * 1024 * 1024)
+
+
+def _copiar_limitado(origen, destino, limite):
+    """Copia por bloques y falla si el contenido real supera `limite` (el tamaño declarado en un ZIP puede mentir)."""
+    copiados = 0
+    with open(destino, 'wb') as salida:
+        for bloque in iter(lambda: origen.read(TAMANIO_BLOQUE), b''):
+            copiados += len(bloque)
+            if copiados > limite:
+                raise ValueError(f"El archivo supera el tamaño máximo permitido ({limite // (1024 * 1024)} MB).")
+            salida.write(bloque)
+
+
+class _Guardado:
+    """Archivos de una carga masiva ya escritos en disco, en el orden en que llegaron."""
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self.filas = []  # [{'archivo', 'ruta', 'error'}]
+
+    def _ruta(self, nombre):
+        # Prefijo con el índice: evita choques de nombres y rutas fuera del directorio (../ en el ZIP)
+        return os.path.join(self.directorio, f"{len(self.filas):04d}_{get_valid_filename(os.path.basename(nombre)) or 'archivo'}")
+
+    def _controlar_cantidad(self):
+        maximo = getattr(settings, 'BULK_UPLOAD_MAX_FILES', 100)
+        if len(self.filas) >= maximo:
+            raise ValueError(f"Se pueden procesar hasta {maximo} archivos por carga.")
+
+    def agregar(self, nombre, origen, tamanio=None):
+        self._controlar_cantidad()
+        fila = {'archivo': nombre, 'ruta': None, 'error': None}
+        limite = _limite_archivo()
+        ruta = self._ruta(nombre)
+        try:
+            if file_type(nombre) is None:
+                raise ValueError("Tipo de archivo no soportado. Solo Excel, PDF y CSV/TXT.")
+            if tamanio is not None and tamanio > limite:
+                raise ValueError(f"El archivo supera el tamaño máximo permitido ({limite // (1024 * 1024)} MB).")
+            if hasattr(origen, 'temporary_file_path'):
+                # La subida ya está en disco (ver upload_handlers): se parsea ahí mismo, sin copiarla
+                fila['ruta'] = origen.temporary_file_path()
+            else:
+                _copiar_limitado(origen, ruta, limite)
+                fila['ruta'] = ruta
+        except ValueError as e:
+            if os.path.exists(ruta):
+                os.remove(ruta)
+            fila['error'] = str(e)
+        self.filas.append(fila)
+
+    def agregar_zip(self, archivo):
+        """Extrae los miembros de a uno, leyendo por bloques: el ZIP nunca se carga entero en memoria."""
+        try:
+            with zipfile.ZipFile(archivo) as zip_subido:
+                for miembro in zip_subido.infolist():
+                    nombre = miembro.filename
+                    if miembro.is_dir() or nombre.startswith('__MACOSX/') or os.path.basename(nombre).startswith('.'):
+                        continue
+                    with zip_subido.open(miembro) as origen:
+                        self.agregar(f"{archivo.name}/{nombre}", origen, miembro.file_size)
+        except (zipfile.BadZipFile, zipfile.LargeZipFile, RuntimeError, NotImplementedError) as e:
+            # RuntimeError: ZIP cifrado; NotImplementedError: método de compresión no soportado
+            self.filas.append({'archivo': archivo.name, 'ruta': None, 'error': f"ZIP inválido: {e}"})
+
+
+def guardar_subidas(archivos, directorio):
+    """
+    Escribe en `directorio` los archivos subidos y los miembros de los ZIP, por bloques.
+
+    Returns:
+        list: [{'archivo', 'ruta', 'error'}] en el orden de la carga; `ruta` es None si el archivo se rechazó.
+    """
+    guardado = _Guardado(directorio)
+    for archivo in archivos:
+        if archivo.name.lower().endswith('.zip'):
+            guardado.agregar_zip(archivo)
+        else:
+            guardado.agregar(archivo.name, archivo, getattr(archivo, 'size', None))
+    return guardado.filas
+
+
+def _parsear_archivo(ruta, nombre):
+    """Corre en los procesos del pool: devuelve (monto, error, milisegundos)."""
+    inicio = time.perf_counter()
+    try:
+        with open(ruta, 'rb') as archivo:
+            monto = extract_total_from_file(File(archivo, name=nombre))
+        return monto, None, (time.perf_counter() - inicio) * 1000
+    except ValueError as e:
+        return None, str(e), (time.perf_counter() - inicio) * 1000
+
+
+def _parsear_todos(pendientes, procesos):
+    """Parsea {sha256: (ruta, nombre)} en un pool de procesos (o en este proceso si no vale la pena)."""
+    if procesos <= 1 or len(pendientes) <= 1:
+        return {sha256: _parsear_archivo(ruta, nombre) for sha256, (ruta, nombre) in pendientes.items()}
+
+    resultados = {}
+    with ProcessPoolExecutor(max_workers=min(procesos, len(pendientes))) as executor:
+        futuros = {sha256: executor.submit(_parsear_archivo, ruta, nombre) for sha256, (ruta, nombre) in pendientes.items()}
+        for sha256, futuro in futuros.items():
+            try:
+                resultados[sha256] = futuro.result()
+            except Exception as e:
+                logger.error(f"procesar_carga_masiva: Falló el proceso que parseaba {pendientes[sha256][1]}: {e}")
+                resultados[sha256] = (None, f"Error interno procesando el archivo: {e}", 0.0)
+    return resultados
+
+
+def procesar_carga_masiva(archivos, procesos=None):
+    """
+    Extrae el total de cada archivo subido (Excel, PDF o los que vengan dentro de un ZIP).
+    Los contenidos ya parseados se toman del cache de montos; los repetidos en la misma
+    carga se parsean una sola vez; el resto se reparte en un pool de procesos.
+
+    Returns:
+        list: [{'archivo', 'monto', 'error', 'cache'}] en el orden de la carga.
+    """
+    if procesos is None:
+        procesos = getattr(settings, 'BULK_UPLOAD_PROCESSES', 4)
+
+    with tempfile.TemporaryDirectory(prefix='carga_masiva_') as directorio:
+        filas = guardar_subidas(archivos, directorio)
+
+        pendientes = {}
+        for fila in filas:
+            fila.update(monto=None, cache=False)
+            if fila['error']:
+                continue
+            fila['sha256'] = hash_archivo(fila['ruta'])
+            fila['monto'] = buscar_en_cache(fila['sha256'])
+            if fila['monto'] is not None:
+                fila['cache'] = True
+            else:
+                pendientes.setdefault(fila['sha256'], (fila['ruta'], os.path.basename(fila['archivo'])))
+
+        parseados = _parsear_todos(pendientes, procesos)
+        for sha256, (monto, _, parse_ms) in parseados.items():
+            if monto is not None:
+                ruta = pendientes[sha256][0]
+                guardar_en_cache(sha256, monto, ruta, os.path.getsize(ruta), parse_ms)
+
+    for fila in filas:
+        sha256 = fila.pop('sha256', None)
+        fila.pop('ruta')
+        if sha256 in parseados:
+            fila['monto'], fila['error'], _ = parseados[sha256]
+    logger.info(f"procesar_carga_masiva: {len(filas)} archivo(s), {len(pendientes)} parseado(s), "
+                f"{sum(1 for fila in filas if fila['cache'])} desde el cache.")
+    return filas
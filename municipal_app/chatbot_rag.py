@@ -1,11 +1,22 @@
 import os
 import glob
+import logging
+import time
 import numpy as np
 import faiss
 import pickle
 import google.generativeai as genai
 from django.conf import settings
 
+from .answer_cache import CacheRespuestas
+from .embedding_cache import CacheEmbeddings
+from .embedding_pipeline import con_reintentos, lotes, procesar_en_orden
+from .rag_index import (almacen_vectores, aplicar_parametros_busqueda, comparar_con_flat, configuracion_indice,
+                        construir_indice, contenido_almacen, guardar_configuracion, leer_configuracion)
+from .rag_manifest import fragmentar, guardar_manifiesto, leer_manifiesto, manifiesto_parcial, planificar
+
+logger = logging.getLogger(__name__)
+
 # --- Configuración Inicial ---
 
 # La API Key se cargará desde settings.py de Django
@@ -33,57 +44,199 @@ MODEL_CHAT = "gemini-flash-latest" # Usamos un modelo que soporta System Instruc
 # PARTE 1: Gestión del Índice (Indexación)
 # ===========================
 
-def cargar_y_fragmentar_docs():
-    """Lee archivos .txt de la carpeta y los divide en trozos (chunks)."""
-    documentos = []
-    archivos = glob.glob(os.path.join(DOCS_DIR, "*.txt"))
-    
-    for archivo in archivos:
+def cargar_documentos():
+    """Lee los archivos .txt de la carpeta: {nombre del archivo: texto}."""
+    documentos = {}
+    for archivo in sorted(glob.glob(os.path.join(DOCS_DIR, "*.txt"))):
         with open(archivo, 'r', encoding='utf-8') as f:
-            texto = f.read()
-            # Fragmentación simple por párrafos.
-            chunks = [t.strip() for t in texto.split('\n\n') if t.strip()]
-            documentos.extend(chunks)
-            
+            documentos[os.path.basename(archivo)] = f.read()
     return documentos
 
-def crear_indice_rag():
-    """Crea el índice vectorial FAISS y guarda los textos."""
-    textos = cargar_y_fragmentar_docs()
-    if not textos:
-        print("No se encontraron documentos para indexar en 'base_conocimiento/'.")
-        return
+def cargar_y_fragmentar_docs():
+    """Lee archivos .txt de la carpeta y los divide en trozos (chunks)."""
+    return [chunk for texto in cargar_documentos().values() for chunk in fragmentar(texto)]
 
-    print(f"Generando embeddings para {len(textos)} fragmentos de texto...")
-    
+def _embeddings_documentos(textos):
+    """Embeddings (matriz float32) de los fragmentos, en el mismo orden."""
+    response = genai.embed_content(
+        model=MODEL_EMBEDDING,
+        content=textos,
+        task_type="retrieval_document"
+    )
+    embeddings = np.array(response['embedding'], dtype='float32')
+    if len(embeddings) != len(textos):
+        raise ValueError(f"La API devolvió {len(embeddings)} embeddings para {len(textos)} fragmentos.")
+    return embeddings
+
+def _reemplazar(nombre, escribir):
+    """Escribe `INDEX_DIR/nombre` en un temporal y lo reemplaza de forma atómica."""
+    ruta = os.path.join(INDEX_DIR, nombre)
+    escribir(f"{ruta}.parcial")
+    os.replace(f"{ruta}.parcial", ruta)
+
+def _guardar_textos(textos):
+    def escribir(ruta):
+        with open(ruta, "wb") as f:
+            pickle.dump(textos, f)
+    _reemplazar("textos.pkl", escribir)
+
+def _leer_almacen(manifiesto):
+    """Los embeddings ya calculados, si el manifiesto corresponde al modelo actual."""
+    if manifiesto.get('modelo') != MODEL_EMBEDDING:
+        return None
     try:
-        # Generar embeddings para todos los textos
-        response = genai.embed_content(
-            model=MODEL_EMBEDDING,
-            content=textos,
-            task_type="retrieval_document"
-        )
-        embeddings_list = response['embedding']
-    except Exception as e:
-        print(f"Error al generar embeddings: {e}")
-        return
+        return faiss.read_index(os.path.join(INDEX_DIR, "vectores.faiss"))
+    except RuntimeError:  # FAISS no distingue "no existe" de "ilegible"
+        return None
 
-    embeddings_np = np.array(embeddings_list, dtype='float32')
-    dimension = embeddings_np.shape[1]
+def _guardar_avance(almacen, manifiesto, plan, embebidos):
+    """Deja en disco los embeddings obtenidos hasta ahora, para retomar si la indexación se corta."""
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    _reemplazar("vectores.faiss", lambda ruta: faiss.write_index(almacen, ruta))
+    guardar_manifiesto(INDEX_DIR, manifiesto_parcial(manifiesto, plan, embebidos))
 
-    # Crear y construir el índice FAISS
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings_np)
+def _embeber_pendientes(plan, manifiesto, almacen):
+    """
+    Embeddings de los fragmentos nuevos del `plan`, en lotes de RAG_EMBEDDING_BATCH_SIZE que se
+    piden en paralelo (RAG_EMBEDDING_WORKERS hilos) y se reintentan si la API limita la tasa.
+    Cada lote se agrega al `almacen` en orden apenas llega, y cada RAG_EMBEDDING_CHECKPOINT_BATCHES
+    lotes (y ante un error) el avance queda guardado: la próxima corrida retoma desde ahí.
+
+    Returns:
+        El almacén de vectores con los fragmentos nuevos agregados.
+    """
+    tamanio_lote = getattr(settings, "RAG_EMBEDDING_BATCH_SIZE", 100)
+    guardar_cada = max(1, getattr(settings, "RAG_EMBEDDING_CHECKPOINT_BATCHES", 20))
+    pendientes = lotes(plan['nuevos'], tamanio_lote)
+    embeber = con_reintentos(_embeddings_documentos, getattr(settings, "RAG_EMBEDDING_MAX_RETRIES", 5))
+    print(f"Generando embeddings para {len(plan['nuevos'])} fragmentos de texto en {len(pendientes)} lote(s)...")
+
+    embebidos = []
+    def al_terminar(numero, lote, embeddings):
+        nonlocal almacen
+        if almacen is None:
+            almacen = almacen_vectores(embeddings.shape[1])
+        almacen.add_with_ids(embeddings, np.array([identificador for identificador, _ in lote], dtype='int64'))
+        embebidos.extend(lote)
+        if (numero + 1) % guardar_cada == 0 and numero + 1 < len(pendientes):
+            _guardar_avance(almacen, manifiesto, plan, embebidos)
+            print(f"Avance guardado: {len(embebidos)}/{len(plan['nuevos'])} fragmentos.")
+
+    try:
+        procesar_en_orden(pendientes, lambda lote: embeber([texto for _, texto in lote]),
+                          getattr(settings, "RAG_EMBEDDING_WORKERS", 4), al_terminar)
+    except Exception:
+        if embebidos:
+            _guardar_avance(almacen, manifiesto, plan, embebidos)
+            print(f"Quedaron guardados {len(embebidos)}/{len(plan['nuevos'])} fragmentos: "
+                  "al volver a correr la indexación se retoma desde ahí.")
+        raise
+    return almacen
+
+def _vaciar_indice(almacen, manifiesto):
+    """
+    Sin fragmentos no hay índice que publicar (IVF ni siquiera se puede entrenar): se borran
+    `index.faiss` y `textos.pkl` y quedan el manifiesto y el almacén sin los documentos quitados.
+    """
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    # Primero el índice: si la corrida se corta, la siguiente no lo da por publicado y al día
+    nombres = ("index.faiss", "textos.pkl") if almacen is not None else ("index.faiss", "textos.pkl", "vectores.faiss")
+    for nombre in nombres:
+        try:
+            os.remove(os.path.join(INDEX_DIR, nombre))
+        except FileNotFoundError:
+            pass
+    if almacen is not None:
+        _reemplazar("vectores.faiss", lambda ruta: faiss.write_index(almacen, ruta))
+    guardar_manifiesto(INDEX_DIR, manifiesto)
+    _cache_respuestas.limpiar()
+    print("No quedan fragmentos para indexar: se borró el índice RAG publicado.")
+
+def crear_indice_rag(tipo_indice=None, parametros=None, reporte=False, completo=False):
+    """
+    Crea o actualiza el índice vectorial FAISS y guarda los textos. Es incremental: según el
+    manifiesto (ver `rag_manifest`) solo se embeben los fragmentos nuevos o modificados y se
+    borran los vectores de los que ya no están. Los embeddings quedan en `vectores.faiss` (un
+    índice exacto con ids) y el índice de búsqueda se arma a partir de ellos.
+
+    Args:
+        tipo_indice (str, optional): 'flat', 'ivf' o 'hnsw' (ver `rag_index`); por defecto RAG_INDEX_TYPE.
+        parametros (dict, optional): nlist, nprobe, m, ef_construction, ef_search.
+        reporte (bool): Si es True, mide recall y latencia del índice frente al flat.
+        completo (bool): Si es True, ignora el manifiesto y vuelve a embeber todo.
+
+    Returns:
+        dict: 'resumen' (archivos y fragmentos nuevos, modificados y eliminados), 'tiempos'
+        (segundos por fase) y 'reporte' (el de `rag_index.comparar_con_flat`, si se pidió).
+        None si falló la generación de embeddings. Si no queda ningún fragmento, el índice
+        publicado se borra (ver `_vaciar_indice`).
+    """
+    configuracion = configuracion_indice(tipo_indice or getattr(settings, "RAG_INDEX_TYPE", "flat"), **(parametros or {}))
+    tiempos = {}
+    inicio = time.perf_counter()
+    documentos = cargar_documentos()
+    if not documentos:
+        print("No se encontraron documentos para indexar en 'base_conocimiento/'.")
+
+    manifiesto = {} if completo else leer_manifiesto(INDEX_DIR)
+    almacen = _leer_almacen(manifiesto)
+    if almacen is None:
+        manifiesto = {}
+    plan = planificar(documentos, manifiesto, MODEL_EMBEDDING)
+    tiempos['lectura'] = time.perf_counter() - inicio
+    resultado = {'resumen': plan['resumen'], 'tiempos': tiempos, 'reporte': None}
+    if (almacen is not None and not plan['nuevos'] and not plan['eliminados'] and 'pendientes' not in manifiesto
+            and configuracion == leer_configuracion(INDEX_DIR)
+            and os.path.exists(os.path.join(INDEX_DIR, "index.faiss"))):
+        print("El índice RAG ya está al día: no hay fragmentos nuevos, modificados ni eliminados.")
+        if reporte:
+            ids, vectores = contenido_almacen(almacen)
+            index = aplicar_parametros_busqueda(faiss.read_index(os.path.join(INDEX_DIR, "index.faiss")), configuracion)
+            resultado['reporte'] = comparar_con_flat(index, vectores, ids=ids)
+        return resultado
+
+    inicio = time.perf_counter()
+    if plan['nuevos']:
+        try:
+            almacen = _embeber_pendientes(plan, manifiesto, almacen)
+        except Exception as e:
+            print(f"Error al generar embeddings: {e}")
+            return
+    tiempos['embeddings'] = time.perf_counter() - inicio
+
+    # Construir el índice FAISS a partir de los embeddings guardados
+    inicio = time.perf_counter()
+    if plan['eliminados']:
+        almacen.remove_ids(np.array(plan['eliminados'], dtype='int64'))
+    if almacen is None or not almacen.ntotal:
+        _vaciar_indice(almacen, plan['manifiesto'])
+        tiempos['indice'] = time.perf_counter() - inicio
+        return resultado
+    ids, vectores = contenido_almacen(almacen)
+    index = construir_indice(vectores, configuracion, ids)
+    print(f"Índice {configuracion['tipo']} construido con {index.ntotal} vectores.")
+    tiempos['indice'] = time.perf_counter() - inicio
 
     # Guardar el índice y los textos fragmentados
+    inicio = time.perf_counter()
     if not os.path.exists(INDEX_DIR):
         os.makedirs(INDEX_DIR)
-        
-    faiss.write_index(index, os.path.join(INDEX_DIR, "index.faiss"))
-    with open(os.path.join(INDEX_DIR, "textos.pkl"), "wb") as f:
-        pickle.dump(textos, f)
-        
+
+    # Primero los textos, los vectores y el manifiesto, y al final el índice, cada uno con un
+    # reemplazo atómico: el índice nuevo (que cambia `version_indice`) nunca queda visible
+    # junto a los textos viejos
+    _guardar_textos(plan['textos'])
+    _reemplazar("vectores.faiss", lambda ruta: faiss.write_index(almacen, ruta))
+    guardar_manifiesto(INDEX_DIR, plan['manifiesto'])
+    guardar_configuracion(INDEX_DIR, configuracion)
+    _reemplazar("index.faiss", lambda ruta: faiss.write_index(index, ruta))
+    _cache_respuestas.limpiar()
+    tiempos['guardado'] = time.perf_counter() - inicio
+
     print(f"Índice RAG creado y guardado exitosamente en {INDEX_DIR}")
+    if reporte:
+        resultado['reporte'] = comparar_con_flat(index, vectores, ids=ids)
+    return resultado
 
 
 # ===========================
@@ -93,31 +246,70 @@ def crear_indice_rag():
 # Caché en memoria para no recargar el índice en cada petición
 _cached_index = None
 _cached_texts = None
+_cached_version = None
+# Embeddings de las preguntas recientes: las repetidas no vuelven a llamar a la API
+_cache_embeddings = CacheEmbeddings(getattr(settings, "RAG_EMBEDDING_CACHE_SIZE", 512),
+                                    getattr(settings, "RAG_EMBEDDING_CACHE_TTL_SECONDS", 3600))
+# Respuestas a preguntas equivalentes (por cercanía de embeddings), atadas a la versión del índice
+_cache_respuestas = CacheRespuestas(getattr(settings, "RAG_ANSWER_CACHE_SIZE", 256),
+                                    getattr(settings, "RAG_ANSWER_CACHE_MAX_DISTANCE", 0.05))
+
+# Cada cuántas consultas a una cache se deja su tasa de aciertos en el log (0 = nunca)
+CACHE_LOG_CADA = getattr(settings, "RAG_CACHE_STATS_EVERY", 100)
+
+def _registrar_cache(nombre, cache):
+    """Cada CACHE_LOG_CADA consultas a `cache`, deja en el log sus aciertos, fallos y entradas."""
+    estadisticas = cache.estadisticas()
+    consultas = estadisticas['aciertos'] + estadisticas['fallos']
+    if CACHE_LOG_CADA > 0 and consultas and consultas % CACHE_LOG_CADA == 0:
+        logger.info(f"Cache de {nombre}: {estadisticas['aciertos']}/{consultas} aciertos "
+                    f"({estadisticas['tasa_aciertos']:.1%}), {estadisticas['entradas']} entradas")
+
+def version_indice():
+    """Identifica el índice guardado en disco (cambia cada vez que `crear_indice_rag` lo regenera)."""
+    try:
+        estado = os.stat(os.path.join(INDEX_DIR, "index.faiss"))
+    except FileNotFoundError:
+        return None
+    return f"{estado.st_mtime_ns}-{estado.st_size}"
 
 def cargar_recursos_rag():
-    """Carga el índice y los textos en una caché en memoria."""
-    global _cached_index, _cached_texts
-    if _cached_index is None:
+    """Carga el índice y los textos en una caché en memoria (y los recarga si el índice se regeneró)."""
+    global _cached_index, _cached_texts, _cached_version
+    version = version_indice()
+    if version is None:  # No hay índice publicado (o se borró porque no quedan documentos)
+        _cached_index = _cached_texts = _cached_version = None
+        return False
+    if _cached_index is None or version != _cached_version:
         try:
-            _cached_index = faiss.read_index(os.path.join(INDEX_DIR, "index.faiss"))
+            _cached_index = aplicar_parametros_busqueda(faiss.read_index(os.path.join(INDEX_DIR, "index.faiss")),
+                                                        leer_configuracion(INDEX_DIR))
             with open(os.path.join(INDEX_DIR, "textos.pkl"), "rb") as f:
                 _cached_texts = pickle.load(f)
+            _cached_version = version
         except FileNotFoundError:
-            return False
+            return _cached_index is not None
     return True
 
+def embedding_pregunta(pregunta):
+    """Embedding de la pregunta (vector float32), desde la caché si se preguntó lo mismo hace poco."""
+    def calcular():
+        response = genai.embed_content(
+            model=MODEL_EMBEDDING,
+            content=pregunta,
+            task_type="retrieval_query"
+        )
+        return response['embedding']
+    vector = _cache_embeddings.obtener_o_calcular(pregunta, calcular)
+    _registrar_cache('embeddings de preguntas', _cache_embeddings)
+    return vector
+
 def buscar_contexto(pregunta, k=3):
     """Busca los fragmentos de texto más relevantes para una pregunta."""
     if not cargar_recursos_rag():
         return []
 
-    # Generar embedding para la pregunta
-    response = genai.embed_content(
-        model=MODEL_EMBEDDING,
-        content=pregunta,
-        task_type="retrieval_query"
-    )
-    pregunta_emb = np.array([response['embedding']], dtype='float32')
+    pregunta_emb = embedding_pregunta(pregunta)[np.newaxis, :]
 
     # Buscar en FAISS los k vecinos más cercanos
     distances, indices = _cached_index.search(pregunta_emb, k)
@@ -127,8 +319,17 @@ def buscar_contexto(pregunta, k=3):
     return contextos
 
 def generar_respuesta_rag(pregunta_usuario):
-    """Genera una respuesta utilizando el contexto recuperado."""
-    
+    """
+    Genera una respuesta utilizando el contexto recuperado. Si ya se respondió una pregunta
+    equivalente con el mismo índice, devuelve esa respuesta sin llamar al modelo generativo.
+    """
+    version = version_indice()
+    pregunta_emb = embedding_pregunta(pregunta_usuario)
+    respuesta_guardada = _cache_respuestas.buscar(pregunta_emb, version)
+    _registrar_cache('respuestas', _cache_respuestas)
+    if respuesta_guardada is not None:
+        return respuesta_guardada
+
     contexto = buscar_contexto(pregunta_usuario)
     if not contexto:
         contexto_str = "No se encontró información relevante en la base de conocimiento interna."
@@ -153,6 +354,7 @@ PREGUNTA DEL USUARIO:
 """
     try:
         response = model.generate_content(prompt)
+        _cache_respuestas.guardar(pregunta_emb, response.text, version)
         return response.text
     except Exception as e:
         return f"Error al contactar el modelo generativo: {e}"
\ No newline at end of file
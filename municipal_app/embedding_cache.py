@@ -0,0 +1,85 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalizar_pregunta(texto):
+    """
+    Clave de la cache: sin mayúsculas, tildes, signos de apertura/cierre ni espacios de más.
+    "¿Cuándo vence IIBB?" y "cuando vence  iibb" comparten el mismo embedding.
+    """
+    texto = unicodedata.normalize('NFKD', str(texto).casefold())
+    texto = ''.join(caracter for caracter in texto if not unicodedata.combining(caracter))
+    return re.sub(r'\s+', ' ', texto).strip(' ¿?¡!.,;:')
+
+
+class CacheEmbeddings:
+    """
+    Cache LRU con vencimiento de los embeddings de las preguntas, compartida entre los hilos
+    del servidor. Guarda a lo sumo `max_entradas` vectores y descarta los que tienen más de
+    `ttl_segundos`. Los vectores se devuelven de solo lectura: son los mismos para todos.
+    """
+
+    def __init__(self, max_entradas, ttl_segundos, reloj=time.monotonic):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self._reloj = reloj
+        self._entradas = OrderedDict()  # clave -> (vence, vector), de la menos a la más usada
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave):
+        """El vector guardado, o None si no está o venció (cuenta como acierto o fallo)."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[0] <= self._reloj():
+                del self._entradas[clave]
+                entrada = None
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[1]
+
+    def guardar(self, clave, vector):
+        if self.max_entradas <= 0:
+            return vector
+        vector = np.array(vector, dtype='float32')
+        vector.setflags(write=False)
+        with self._lock:
+            self._entradas[clave] = (self._reloj() + self.ttl_segundos, vector)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+        return vector
+
+    def obtener_o_calcular(self, pregunta, calcular):
+        """
+        Embedding de `pregunta`; si no está en la cache lo pide con `calcular()`. El cálculo
+        (la llamada a la API) se hace fuera del lock, para no frenar a los demás hilos.
+        """
+        clave = normalizar_pregunta(pregunta)
+        vector = self.obtener(clave)
+        if vector is None:
+            vector = self.guardar(clave, calcular())
+        return vector
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._entradas),
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': self.aciertos / consultas if consultas else 0.0,
+            }
@@ -0,0 +1,73 @@
+"""
+Generación de embeddings en lotes: cada lote se manda en su propia llamada a la API desde un
+pool acotado de hilos, con reintentos y espera exponencial cuando la API limita la tasa, y los
+resultados se entregan en el orden de los lotes a medida que llegan.
+"""
+import logging
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from google.api_core import exceptions as api_exceptions
+    ERRORES_TRANSITORIOS = (api_exceptions.ResourceExhausted, api_exceptions.TooManyRequests,
+                            api_exceptions.ServiceUnavailable, api_exceptions.DeadlineExceeded,
+                            api_exceptions.InternalServerError)
+except ImportError:
+    ERRORES_TRANSITORIOS = ()
+
+logger = logging.getLogger(__name__)
+
+PATRON_TRANSITORIO = re.compile(r'\b(429|503)\b|quota|rate.?limit|resource.?exhausted', re.IGNORECASE)
+
+
+def es_transitorio(error):
+    """True si la API limitó la tasa o no estuvo disponible: vale la pena esperar y reintentar."""
+    return isinstance(error, ERRORES_TRANSITORIOS) or bool(PATRON_TRANSITORIO.search(str(error)))
+
+
+def lotes(items, tamanio):
+    return [items[inicio:inicio + tamanio] for inicio in range(0, len(items), max(1, tamanio))]
+
+
+def con_reintentos(funcion, reintentos, espera_inicial=1.0, espera_maxima=60.0, dormir=time.sleep):
+    """
+    `funcion` que, ante un error transitorio, espera (1s, 2s, 4s... con jitter, hasta `espera_maxima`)
+    y reintenta hasta `reintentos` veces. Los demás errores se propagan enseguida.
+    """
+    def ejecutar(*args, **kwargs):
+        for intento in range(reintentos + 1):
+            try:
+                return funcion(*args, **kwargs)
+            except Exception as e:
+                if intento == reintentos or not es_transitorio(e):
+                    raise
+                espera = min(espera_maxima, espera_inicial * 2 ** intento)
+                espera = random.uniform(espera / 2, espera)  # Jitter: los hilos no reintentan todos juntos
+                logger.warning(f"con_reintentos: error transitorio ({e}); reintento {intento + 1}/{reintentos} en {espera:.1f}s")
+                dormir(espera)
+    return ejecutar
+
+
+def procesar_en_orden(lotes_pendientes, funcion, hilos, al_terminar):
+    """
+    Ejecuta `funcion(lote)` en un pool de `hilos` y llama a `al_terminar(numero, lote, resultado)`
+    en el orden de los lotes, apenas están listos el lote y todos los anteriores. Hay a lo sumo
+    2 × `hilos` lotes en vuelo. Si un lote falla, se cancelan los que no empezaron y se propaga
+    el error: lo entregado hasta ahí ya pasó por `al_terminar`.
+    """
+    hilos = max(1, hilos)
+    with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='embeddings') as pool:
+        en_vuelo = {}
+        enviados = 0
+        try:
+            for numero, lote in enumerate(lotes_pendientes):
+                while enviados < len(lotes_pendientes) and len(en_vuelo) < 2 * hilos:
+                    en_vuelo[enviados] = pool.submit(funcion, lotes_pendientes[enviados])
+                    enviados += 1
+                al_terminar(numero, lote, en_vuelo.pop(numero).result())
+        except BaseException:
+            for futuro in en_vuelo.values():
+                futuro.cancel()
+            raise
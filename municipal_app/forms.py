@@ -6,11 +6,36 @@ from .models import MunicipalCredentials, MisionesCredentials
 class FileUploadForm(forms.Form):
     file = forms.FileField(
         label='Cargar archivo',
-        help_text='Selecciona un archivo Excel (.xlsx, .xls) o PDF (.pdf)',
-        widget=forms.ClearableFileInput(attrs={'accept': '.xlsx,.xls,.pdf'}),
+        help_text='Selecciona un archivo Excel (.xlsx, .xls), PDF (.pdf) o CSV/TXT (.csv, .txt)',
+        widget=forms.ClearableFileInput(attrs={'accept': '.xlsx,.xls,.pdf,.csv,.txt'}),
         required=False
     )
 
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+class MultipleFileField(forms.FileField):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('widget', MultipleFileInput())
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single_file_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            archivos = [single_file_clean(d, initial) for d in data]
+        else:
+            archivos = [single_file_clean(data, initial)]
+        return [archivo for archivo in archivos if archivo]
+
+class BulkUploadForm(forms.Form):
+    files = MultipleFileField(
+        label='Cargar archivos',
+        help_text='Selecciona varios archivos Excel, PDF o CSV/TXT, o un ZIP que los contenga',
+        widget=MultipleFileInput(attrs={'accept': '.xlsx,.xls,.pdf,.csv,.txt,.zip'}),
+        # Puede llegar vacío si todos los archivos se rechazaron al recibirlos (ver upload_handlers)
+        required=False,
+    )
+
 class MunicipalCredentialsForm(forms.ModelForm):
     class Meta:
         model = MunicipalCredentials
@@ -0,0 +1,308 @@
+import functools
+import logging
+import os
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from cryptography.fernet import Fernet
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import (
+    BotJob, MunicipalCredentials, ExecutionHistory,
+    MisionesCredentials, MisionesExecutionHistory,
+)
+from .rentas_lines import guardar_lineas
+from .session_cache import EncryptedSessionStore
+from bot_network import POLITICAS_RED, PoliticaRed
+from munibot import run_munibot
+try:
+    from rentabot import run_rentabot
+except ImportError:
+    run_rentabot = None
+
+logger = logging.getLogger(__name__)
+
+try:
+    f = Fernet(settings.FERNET_KEY)
+except Exception as e:
+    logger.error(f"Error initializing Fernet: {e}. Ensure FERNET_KEY is set correctly in settings.py")
+    f = None
+
+
+def periodo_anterior():
+    """Devuelve el período a declarar por defecto (mes anterior) en formato 'YYYY-MM'."""
+    mes_a_declarar = timezone.localdate().replace(day=1) - timedelta(days=1)
+    return mes_a_declarar.strftime("%Y-%m")
+
+
+def parse_amount(monto):
+    """Convierte el monto ingresado a Decimal; devuelve None si no es un número válido."""
+    if not monto:
+        return None
+    try:
+        return Decimal(monto)
+    except InvalidOperation:
+        logger.warning(f"Valor de monto no válido '{monto}'")
+        return None
+
+
+def enqueue_job(user, portal, monto, period=None):
+    """
+    Encola un trabajo de bot y devuelve el `BotJob` creado.
+    El request HTTP solo persiste el trabajo; la ejecución la hace el worker.
+    """
+    job = BotJob.objects.create(
+        user=user,
+        portal=portal,
+        period=period or periodo_anterior(),
+        amount=parse_amount(monto),
+    )
+    logger.info(f"enqueue_job: Encolado job #{job.pk} ({portal}, {job.period}) para {user.username}")
+    return job
+
+
+def claim_next_job():
+    """
+    Toma el próximo trabajo en cola y lo marca como 'running'.
+    El UPDATE condicionado al estado evita que dos workers tomen el mismo trabajo.
+    """
+    while True:
+        job = BotJob.objects.filter(status=BotJob.STATUS_QUEUED).order_by('created_at', 'pk').first()
+        if job is None:
+            return None
+        claimed = claim_job(job.pk)
+        if claimed is not None:
+            return claimed
+
+
+# Error de los trabajos que `fail_stale_jobs` da por perdidos (`planificar_periodo` los reconoce)
+ERROR_INTERRUMPIDO = ("Trabajo interrumpido: el worker se detuvo mientras lo ejecutaba. "
+                      "Verificá en el portal si la presentación se hizo antes de volver a intentarla.")
+
+
+def fail_stale_jobs(minutes):
+    """
+    Marca como fallidos los trabajos que siguen en 'running' `minutes` minutos después de
+    tomarlos: el worker que los tenía se cayó o lo mataron, y nadie más los va a terminar.
+    Escribe el historial como cualquier trabajo fallido. Devuelve los trabajos marcados.
+    """
+    if minutes <= 0:
+        return []
+    limite = timezone.now() - timedelta(minutes=minutes)
+    vencidos = []
+    for job in BotJob.objects.filter(status=BotJob.STATUS_RUNNING, started_at__lt=limite).select_related('user'):
+        logger.warning(f"fail_stale_jobs: Job #{job.pk} sigue en 'running' desde {job.started_at}; se marca como fallido.")
+        vencidos.append(finish_job(job, 'Failed', job.output, ERROR_INTERRUMPIDO))
+    return vencidos
+
+
+def claim_job(job_id):
+    """Toma un trabajo puntual si sigue en cola; devuelve None si ya lo tomó otro worker."""
+    claimed = BotJob.objects.filter(pk=job_id, status=BotJob.STATUS_QUEUED).update(
+        status=BotJob.STATUS_RUNNING,
+        started_at=timezone.now(),
+    )
+    return BotJob.objects.get(pk=job_id) if claimed else None
+
+
+def _decrypt_password(encrypted_password):
+    if not (f and encrypted_password):
+        raise Exception("Fernet not initialized or encrypted password missing.")
+    try:
+        return f.decrypt(encrypted_password).decode()
+    except Exception as decrypt_e:
+        logger.error(f"Error al descifrar la contraseña: {decrypt_e}")
+        raise
+
+
+def _politica_red(portal):
+    """
+    Política de red de los bots: la del portal (`bot_network.POLITICAS_RED`) más los hosts de
+    BOT_FILTRO_RED_HOSTS_EXTRA. Con BOT_FILTRO_RED=False devuelve False (sin filtro), para
+    destrabar un portal que cambió sin tener que desplegar código.
+    """
+    if not getattr(settings, 'BOT_FILTRO_RED', True):
+        return False
+    extra = tuple(getattr(settings, 'BOT_FILTRO_RED_HOSTS_EXTRA', ()))
+    if not extra:
+        return None  # La política por defecto del bot
+    politica = POLITICAS_RED[portal]
+    return PoliticaRed(politica.hosts_permitidos + extra, politica.tipos_bloqueados, politica.bloquear_terceros)
+
+
+def _run_posadas(job, pool=None):
+    try:
+        credentials = MunicipalCredentials.objects.get(user=job.user)
+    except MunicipalCredentials.DoesNotExist:
+        return 'Failed', None, 'Credenciales de la municipalidad no encontradas.'
+
+    municipal_username = str(credentials.municipal_username or '')
+    municipal_password = _decrypt_password(credentials.municipal_password)
+    monto_str = str(job.amount) if job.amount is not None else ''
+
+    # Ruta al driver de Edge
+    driver_path = os.path.join(settings.BASE_DIR, 'edgedriver_win64', 'msedgedriver.exe')
+    # La sesión del portal se reutiliza entre ejecuciones del mismo usuario para saltear el login
+    session_store = EncryptedSessionStore(job.user, BotJob.PORTAL_POSADAS)
+    return run_munibot(municipal_username, municipal_password, monto_str, driver_path, pool=pool, session_store=session_store,
+                       politica_red=_politica_red(BotJob.PORTAL_POSADAS), periodo=job.period)
+
+
+def _run_misiones(job, cdp_launcher=None):
+    try:
+        credentials = MisionesCredentials.objects.get(user=job.user)
+    except MisionesCredentials.DoesNotExist:
+        return 'Failed', None, 'Credenciales de Renta Misiones no encontradas.'
+    if not run_rentabot:
+        return 'Failed', 'rentabot not implemented yet', 'rentabot module not found'
+
+    kwargs = {
+        'misiones_username': str(credentials.misiones_username or ''),
+        'misiones_password': _decrypt_password(credentials.misiones_password),
+        'session_store': EncryptedSessionStore(job.user, BotJob.PORTAL_MISIONES),
+        'directorio_descargas': _directorio_descargas(job),
+        'politica_red': _politica_red(BotJob.PORTAL_MISIONES),
+        'descarga_http': getattr(settings, 'BOT_RENTAS_DESCARGA_HTTP', False),
+        'directorio_archivo': getattr(settings, 'RENTAS_ARCHIVE_DIR', None),
+        'usuario_archivo': job.user.pk,
+        'al_procesar': functools.partial(guardar_lineas, job.user, job=job),
+        # El período del trabajo es el que se consulta, se declara y se guarda en RentasLine
+        'periodo': job.period,
+    }
+    if cdp_launcher is None:
+        return run_rentabot(None, **kwargs)
+    # Navegador CDP administrado por el worker: contexto y página propios por ejecución
+    with cdp_launcher.lease() as cdp_endpoint:
+        return run_rentabot(None, cdp_endpoint=cdp_endpoint, **kwargs)
+
+
+def _directorio_descargas(job):
+    """Directorio propio por trabajo: las descargas simultáneas no se pisan."""
+    return os.path.join(settings.BASE_DIR, 'descargas_rentas', f'job_{job.pk}')
+
+
+def finish_job(job, execution_status, execution_output, execution_error):
+    """Escribe la fila de historial del portal y marca el trabajo como terminado."""
+    logger.debug(f"finish_job: Guardando historial de job #{job.pk}. Estado: {execution_status}, Monto: {job.amount}, Error: {execution_error}")
+
+    history_model = MisionesExecutionHistory if job.portal == BotJob.PORTAL_MISIONES else ExecutionHistory
+    history_model.objects.create(
+        user=job.user,
+        amount=job.amount,
+        status=execution_status,
+        output=execution_output,
+        error=execution_error
+    )
+
+    job.status = BotJob.STATUS_DONE
+    job.result = execution_status
+    job.output = execution_output
+    job.error = execution_error or None
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'output', 'error', 'finished_at'])
+    return job
+
+
+def process_job(job, pool=None, cdp_launcher=None):
+    """
+    Ejecuta el bot correspondiente a un trabajo ya tomado por el worker,
+    guarda el resultado en el job y escribe la fila de historial del portal.
+    `pool` es el `BrowserPool` del worker y `cdp_launcher` su `CDPLauncher` (ambos opcionales).
+    """
+    execution_status = 'Failed'
+    execution_output = None
+    execution_error = None
+
+    try:
+        if job.portal == BotJob.PORTAL_POSADAS:
+            execution_status, execution_output, execution_error = _run_posadas(job, pool)
+        elif job.portal == BotJob.PORTAL_MISIONES:
+            execution_status, execution_output, execution_error = _run_misiones(job, cdp_launcher)
+        else:
+            execution_error = f'Portal desconocido: {job.portal}'
+    except Exception as e:
+        execution_error = f'Ocurrió un error inesperado: {e}'
+        logger.error(f"process_job: Error en job #{job.pk}: {e}")
+    finally:
+        finish_job(job, execution_status, execution_output, execution_error)
+
+    return job
+
+
+def claim_jobs(limit):
+    """Toma hasta `limit` trabajos en cola (para procesarlos juntos con el runner async)."""
+    jobs = []
+    while len(jobs) < limit:
+        job = claim_next_job()
+        if job is None:
+            break
+        jobs.append(job)
+    return jobs
+
+
+def _build_filing(job):
+    """Arma el item para `async_runner.run_filings` (credenciales descifradas, sesión del usuario)."""
+    if job.portal == BotJob.PORTAL_POSADAS:
+        credentials = MunicipalCredentials.objects.filter(user=job.user).first()
+        if credentials is None:
+            raise ValueError('Credenciales de la municipalidad no encontradas.')
+        kwargs = {
+            'municipal_username': str(credentials.municipal_username or ''),
+            'municipal_password': _decrypt_password(credentials.municipal_password),
+            'monto': str(job.amount) if job.amount is not None else '',
+            'session_store': EncryptedSessionStore(job.user, BotJob.PORTAL_POSADAS),
+            'politica_red': _politica_red(BotJob.PORTAL_POSADAS),
+            'periodo': job.period,
+        }
+    elif job.portal == BotJob.PORTAL_MISIONES:
+        credentials = MisionesCredentials.objects.filter(user=job.user).first()
+        if credentials is None:
+            raise ValueError('Credenciales de Renta Misiones no encontradas.')
+        kwargs = {
+            'ruta_archivo': None,
+            'misiones_username': str(credentials.misiones_username or ''),
+            'misiones_password': _decrypt_password(credentials.misiones_password),
+            'session_store': EncryptedSessionStore(job.user, BotJob.PORTAL_MISIONES),
+            'directorio_descargas': _directorio_descargas(job),
+            'politica_red': _politica_red(BotJob.PORTAL_MISIONES),
+        'descarga_http': getattr(settings, 'BOT_RENTAS_DESCARGA_HTTP', False),
+            'directorio_archivo': getattr(settings, 'RENTAS_ARCHIVE_DIR', None),
+            'usuario_archivo': job.user.pk,
+            'al_procesar': functools.partial(guardar_lineas, job.user, job=job),
+            'periodo': job.period,
+        }
+    else:
+        raise ValueError(f'Portal desconocido: {job.portal}')
+    return {'key': job.pk, 'portal': job.portal, 'kwargs': kwargs}
+
+
+def process_jobs_concurrently(jobs, concurrencia=None, cdp_launcher=None):
+    """
+    Ejecuta varios trabajos ya tomados a la vez con el runner async (un navegador,
+    un semáforo por portal) y escribe el historial de cada uno al terminar. Con
+    `cdp_launcher`, los de Misiones usan los navegadores CDP del worker.
+    """
+    from async_runner import run_filings_sync
+
+    filings = []
+    for job in jobs:
+        try:
+            filings.append(_build_filing(job))
+        except Exception as e:
+            logger.error(f"process_jobs_concurrently: No se pudo preparar job #{job.pk}: {e}")
+            finish_job(job, 'Failed', None, str(e) if isinstance(e, ValueError) else f'Ocurrió un error inesperado: {e}')
+
+    resultados = {}
+    if filings:
+        try:
+            resultados = run_filings_sync(filings, concurrencia=concurrencia, cdp_launcher=cdp_launcher)
+        except Exception as e:
+            logger.error(f"process_jobs_concurrently: Error en el runner async: {e}")
+            resultados = {filing['key']: ('Failed', None, f'Ocurrió un error inesperado: {e}') for filing in filings}
+
+    for job in jobs:
+        if job.pk in resultados:
+            finish_job(job, *resultados[job.pk])
+    return jobs
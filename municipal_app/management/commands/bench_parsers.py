@@ -0,0 +1,167 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from django.conf import settings
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from municipal_app.synthetic_files import escribir_factura_pdf, escribir_factura_xlsx, escribir_rentas_csv, escribir_rentas_xlsx
+from municipal_app.utils import extract_total_from_csv, extract_total_from_excel, extract_total_from_pdf
+from rentabot import procesar_excel_rentas
+
+TAMANIOS_POR_DEFECTO = '1000,10000,100000,1000000'
+
+
+class _ArchivoEnDisco(File):
+    """Como la subida que reciben los parsers en producción: un temporal en disco (ver upload_handlers)."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def _con_archivo(parser):
+    def ejecutar(ruta):
+        with open(ruta, 'rb') as archivo:
+            return parser(_ArchivoEnDisco(archivo, name=os.path.basename(ruta)))
+    return ejecutar
+
+
+def _sin_salida(parser):
+    # procesar_excel_rentas imprime un resumen en cada llamada
+    def ejecutar(ruta):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return parser(ruta)
+    return ejecutar
+
+
+# parser -> (generador del archivo sintético, extensión, función a medir sobre la ruta)
+PARSERS = {
+    'extract_total_from_excel': (escribir_factura_xlsx, 'xlsx', _con_archivo(extract_total_from_excel)),
+    'extract_total_from_pdf': (escribir_factura_pdf, 'pdf', _con_archivo(extract_total_from_pdf)),
+    'procesar_excel_rentas': (escribir_rentas_xlsx, 'xlsx', _sin_salida(procesar_excel_rentas)),
+    'extract_total_from_csv': (escribir_rentas_csv, 'csv', _con_archivo(extract_total_from_csv)),
+}
+
+
+def _commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Mide el tiempo y el pico de memoria de los parsers de archivos (Excel y PDF de facturación, '
+            'planillas de Rentas) sobre archivos sintéticos de distintos tamaños, y guarda los resultados en JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default=TAMANIOS_POR_DEFECTO,
+                            help=f'Filas de cada archivo sintético, separadas por coma (por defecto {TAMANIOS_POR_DEFECTO}).')
+        parser.add_argument('--parsers', default=','.join(PARSERS),
+                            help=f"Parsers a medir, separados por coma ({', '.join(PARSERS)}).")
+        parser.add_argument('--repeat', type=int, default=3, help='Repeticiones por medición de tiempo (se guarda la mejor).')
+        parser.add_argument('--data-dir', help='Dónde guardar los archivos sintéticos para reusarlos entre corridas '
+                                               '(por defecto un directorio temporal que se borra al terminar).')
+        parser.add_argument('--output', help='Archivo JSON de resultados (por defecto bench_parsers_<commit>.json).')
+        parser.add_argument('--compare', help='JSON de una corrida anterior: muestra la variación de tiempo y memoria.')
+
+    def handle(self, *args, **options):
+        try:
+            tamanios = [int(tamanio) for tamanio in options['sizes'].split(',') if tamanio.strip()]
+        except ValueError:
+            raise CommandError('--sizes debe ser una lista de enteros separados por coma.')
+        parsers = [nombre.strip() for nombre in options['parsers'].split(',') if nombre.strip()]
+        desconocidos = [nombre for nombre in parsers if nombre not in PARSERS]
+        if desconocidos:
+            raise CommandError(f"Parsers desconocidos: {', '.join(desconocidos)}.")
+        anterior = self._leer_anterior(options['compare']) if options['compare'] else None
+
+        commit = _commit_actual()
+        reporte = {
+            'commit': commit,
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'repeticiones': options['repeat'],
+            'resultados': [],
+        }
+        with tempfile.TemporaryDirectory(prefix='bench_parsers_') as temporal:
+            directorio = options['data_dir'] or temporal
+            os.makedirs(directorio, exist_ok=True)
+            # Los archivos grandes superan MAX_UPLOAD_SIZE: se mide el parser, no el límite de la subida
+            with override_settings(MAX_UPLOAD_SIZE=2 ** 62):
+                for nombre in parsers:
+                    for filas in tamanios:
+                        resultado = self._medir(nombre, filas, directorio, options['repeat'])
+                        reporte['resultados'].append(resultado)
+                        self._mostrar(resultado, anterior)
+
+        salida = options['output'] or f"bench_parsers_{commit or 'local'}.json"
+        with open(salida, 'w', encoding='utf-8') as archivo:
+            json.dump(reporte, archivo, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f'Resultados guardados en {salida}'))
+
+    def _leer_anterior(self, ruta):
+        try:
+            with open(ruta, encoding='utf-8') as archivo:
+                datos = json.load(archivo)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'No se pudo leer {ruta}: {e}')
+        self.commit_anterior = datos.get('commit') or ruta
+        return {(r['parser'], r['filas']): r for r in datos.get('resultados', [])}
+
+    def _medir(self, nombre, filas, directorio, repeticiones):
+        generar, extension, ejecutar = PARSERS[nombre]
+        ruta = os.path.join(directorio, f'{generar.__name__}_{filas}.{extension}')
+        if not os.path.exists(ruta):
+            self.stdout.write(f'Generando {os.path.basename(ruta)}...')
+            generar(ruta, filas)
+
+        resultado = {'parser': nombre, 'filas': filas, 'bytes': os.path.getsize(ruta), 'error': None}
+        try:
+            tiempos = []
+            for _ in range(max(1, repeticiones)):
+                inicio = time.perf_counter()
+                valor = ejecutar(ruta)
+                tiempos.append(time.perf_counter() - inicio)
+            # El pico de memoria se mide en una corrida aparte: tracemalloc hace más lento el parseo
+            tracemalloc.start()
+            try:
+                ejecutar(ruta)
+                pico = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        except ValueError as e:
+            resultado['error'] = str(e)
+            return resultado
+
+        resultado.update({
+            'segundos': min(tiempos),
+            'segundos_mediana': sorted(tiempos)[len(tiempos) // 2],
+            'filas_por_segundo': filas / min(tiempos) if min(tiempos) > 0 else None,
+            'pico_memoria_bytes': pico,
+            'valor': str(valor),
+        })
+        return resultado
+
+    def _mostrar(self, resultado, anterior):
+        encabezado = f"{resultado['parser']:<26} {resultado['filas']:>9,} filas  {resultado['bytes'] / 1024 / 1024:8.1f} MB"
+        if resultado['error']:
+            self.stdout.write(self.style.ERROR(f"{encabezado}  error: {resultado['error']}"))
+            return
+        linea = f"{encabezado}  {resultado['segundos'] * 1000:10.1f} ms  pico {resultado['pico_memoria_bytes'] / 1024 / 1024:8.1f} MB"
+        previo = (anterior or {}).get((resultado['parser'], resultado['filas']))
+        if previo and previo.get('segundos') and previo.get('pico_memoria_bytes'):
+            linea += (f"  (tiempo x{resultado['segundos'] / previo['segundos']:.2f}, "
+                      f"memoria x{resultado['pico_memoria_bytes'] / previo['pico_memoria_bytes']:.2f} vs {self.commit_anterior})")
+        self.stdout.write(linea)
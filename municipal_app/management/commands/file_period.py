@@ -0,0 +1,63 @@
+import re
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from municipal_app.bulk_filing import ejecutar_periodo, leer_montos, planificar_periodo, resumen_throughput
+from municipal_app.models import BotJob
+
+class Command(BaseCommand):
+    help = ('Presenta el período de todos los usuarios con credenciales de un portal, repartidos en un pool '
+            'de procesos. Se puede interrumpir y volver a correr: no presenta dos veces al mismo usuario.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--portal', required=True, choices=[BotJob.PORTAL_POSADAS, BotJob.PORTAL_MISIONES])
+        parser.add_argument('--period', required=True, help='Período a presentar, en formato YYYY-MM.')
+        parser.add_argument('--processes', type=int, default=getattr(settings, 'BOT_FILE_PERIOD_PROCESSES', 2),
+                            help='Procesos en paralelo, cada uno con su propio navegador (1 = sin pool de procesos).')
+        parser.add_argument('--amounts', help='CSV con columnas username,amount (montos a declarar en Posadas).')
+        parser.add_argument('--retry-interrupted', action='store_true',
+                            help="Vuelve a encolar los trabajos que quedaron en 'running' en una corrida interrumpida, "
+                                 'y los que run_bot_worker dio por perdidos al arrancar (en running más de '
+                                 'BOT_STALE_JOB_MINUTES minutos: quedan fallidos con un error de trabajo interrumpido). '
+                                 'Verificá antes en el portal que no se hayan presentado.')
+
+    def handle(self, *args, **options):
+        portal, period = options['portal'], options['period']
+        if not re.fullmatch(r'\d{4}-(0[1-9]|1[0-2])', period):
+            raise CommandError('El período debe tener el formato YYYY-MM.')
+
+        montos = leer_montos(options['amounts']) if options['amounts'] else None
+        plan = planificar_periodo(portal, period, montos, options['retry_interrupted'])
+        pendientes = plan['pendientes']
+        self.stdout.write(f"{portal} {period}: {len(pendientes)} pendiente(s), {plan['presentados']} ya presentado(s).")
+        if plan['interrumpidos']:
+            self.stdout.write(self.style.WARNING(
+                f"{len(plan['interrumpidos'])} trabajo(s) quedaron interrumpidos y no se reintentan "
+                f"({', '.join(f'#{pk}' for pk in plan['interrumpidos'])}). Usá --retry-interrupted si no se presentaron."))
+        if not pendientes:
+            return
+
+        avance = {'hechos': 0}
+        def al_terminar_lote(resultados):
+            avance['hechos'] += len(resultados)
+            self.stdout.write(f"Lote terminado: {avance['hechos']}/{len(pendientes)} presentaciones.")
+
+        inicio = time.perf_counter()
+        try:
+            resultados = ejecutar_periodo(pendientes, portal, options['processes'], al_terminar_lote)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Interrumpido. Volvé a correr el comando para retomar.'))
+            return
+        resumen = resumen_throughput(resultados, time.perf_counter() - inicio)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Presentaciones: {resumen['total']} ({resumen['exitosos']} exitosas, {resumen['fallidos']} fallidas) "
+            f"en {resumen['segundos']:.1f}s"))
+        if resumen['total']:
+            self.stdout.write(f"Throughput: {resumen['por_minuto']:.1f} presentaciones por minuto")
+            self.stdout.write(f"Duración por usuario: p50 {resumen['p50']:.1f}s, p95 {resumen['p95']:.1f}s")
+        pendientes_restantes = len(pendientes) - resumen['total']
+        if pendientes_restantes:
+            self.stdout.write(self.style.WARNING(
+                f'{pendientes_restantes} trabajo(s) sin presentar (tomados por otro worker o en un lote que falló).'))
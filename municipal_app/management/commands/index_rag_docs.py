@@ -1,13 +1,48 @@
 from django.core.management.base import BaseCommand
 from municipal_app.chatbot_rag import crear_indice_rag
+from municipal_app.rag_index import PARAMETROS_POR_DEFECTO, TIPOS_INDICE
 
 class Command(BaseCommand):
     help = 'Crea o actualiza el índice FAISS para el chatbot RAG a partir de los documentos en base_conocimiento/'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--index-type', choices=TIPOS_INDICE,
+                            help='flat (exacto), ivf o hnsw (aproximados). Por defecto RAG_INDEX_TYPE.')
+        parser.add_argument('--nlist', type=int, help=f"IVF: celdas del índice (por defecto {PARAMETROS_POR_DEFECTO['nlist']}).")
+        parser.add_argument('--nprobe', type=int, help=f"IVF: celdas revisadas por consulta (por defecto {PARAMETROS_POR_DEFECTO['nprobe']}).")
+        parser.add_argument('--m', type=int, help=f"HNSW: vecinos por nodo del grafo (por defecto {PARAMETROS_POR_DEFECTO['m']}).")
+        parser.add_argument('--ef-construction', type=int,
+                            help=f"HNSW: exploración al construir (por defecto {PARAMETROS_POR_DEFECTO['ef_construction']}).")
+        parser.add_argument('--ef-search', type=int,
+                            help=f"HNSW: exploración por consulta (por defecto {PARAMETROS_POR_DEFECTO['ef_search']}).")
+        parser.add_argument('--full', action='store_true',
+                            help='Ignora el manifiesto y vuelve a generar los embeddings de todos los documentos.')
+        parser.add_argument('--report', action='store_true',
+                            help='Muestra recall@k y latencia del índice comparados con la búsqueda exacta (flat).')
+
     def handle(self, *args, **kwargs):
         self.stdout.write(self.style.SUCCESS('Iniciando el proceso de indexación de documentos...'))
+        parametros = {nombre: kwargs[nombre] for nombre in PARAMETROS_POR_DEFECTO}
         try:
-            crear_indice_rag()
-            self.stdout.write(self.style.SUCCESS('¡Proceso de indexación completado exitosamente!'))
+            resultado = crear_indice_rag(kwargs['index_type'], parametros, reporte=kwargs['report'], completo=kwargs['full'])
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Ocurrió un error durante la indexación: {e}'))
\ No newline at end of file
+            self.stdout.write(self.style.ERROR(f'Ocurrió un error durante la indexación: {e}'))
+            return
+        if resultado is None:
+            self.stdout.write(self.style.ERROR('No se pudo generar el índice (ver los mensajes anteriores). '
+                                               'Los embeddings ya obtenidos quedan guardados para la próxima corrida.'))
+            return
+        self.stdout.write(self.style.SUCCESS('¡Proceso de indexación completado exitosamente!'))
+        resumen, tiempos = resultado['resumen'], resultado['tiempos']
+        self.stdout.write(
+            f"Archivos: {resumen['archivos_nuevos']} nuevos, {resumen['archivos_modificados']} modificados, "
+            f"{resumen['archivos_eliminados']} eliminados, {resumen['archivos_sin_cambios']} sin cambios\n"
+            f"Fragmentos: {resumen['fragmentos_nuevos']} embebidos, {resumen['fragmentos_reutilizados']} reutilizados, "
+            f"{resumen['fragmentos_retomados']} retomados de una corrida interrumpida, {resumen['fragmentos_eliminados']} eliminados\n"
+            "Tiempos: " + ', '.join(f"{fase} {segundos:.2f}s" for fase, segundos in tiempos.items()))
+        reporte = resultado['reporte']
+        if reporte:
+            self.stdout.write(
+                f"Recall@{reporte['k']} frente a flat: {reporte['recall']:.3f} ({reporte['consultas']} consultas)\n"
+                f"Latencia por consulta: media {reporte['latencia_media_ms']:.3f} ms, p95 {reporte['latencia_p95_ms']:.3f} ms "
+                f"(flat: media {reporte['latencia_media_flat_ms']:.3f} ms, p95 {reporte['latencia_p95_flat_ms']:.3f} ms)")
@@ -0,0 +1,42 @@
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from municipal_app.rentas_lines import TIPOS_DECLARADOS, totales_por_agente, totales_por_periodo
+
+PATRON_PERIODO = r'\d{4}-(0[1-9]|1[0-2])'
+
+
+class Command(BaseCommand):
+    help = ('Totales de retenciones y percepciones de Renta Misiones de un usuario, calculados en la base '
+            'con las líneas guardadas en cada descarga (sin navegador ni Excel).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='Usuario de la aplicación.')
+        parser.add_argument('--from', dest='desde', help='Primer período, en formato YYYY-MM.')
+        parser.add_argument('--to', dest='hasta', help='Último período, en formato YYYY-MM.')
+        parser.add_argument('--by-agent', metavar='YYYY-MM', help='Detalle por agente de un período.')
+
+    def handle(self, *args, **options):
+        for opcion in ('desde', 'hasta', 'by_agent'):
+            if options[opcion] and not re.fullmatch(PATRON_PERIODO, options[opcion]):
+                raise CommandError('Los períodos deben tener el formato YYYY-MM.')
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No existe el usuario {options['user']}.")
+
+        if options['by_agent']:
+            filas = totales_por_agente(user, options['by_agent'])
+            if not filas:
+                self.stdout.write(self.style.WARNING(f"No hay líneas de Rentas guardadas para {options['by_agent']}."))
+            for fila in filas:
+                self.stdout.write(f"{fila['agent_cuit']:<15} {fila['razon_social'][:40]:<40} {fila['line_type']:<11} "
+                                  f"{fila['total']:>15,.2f}  ({fila['lineas']} línea(s))")
+            return
+
+        totales = totales_por_periodo(user, options['desde'], options['hasta'])
+        if not totales:
+            self.stdout.write(self.style.WARNING('No hay líneas de Rentas guardadas en ese rango.'))
+        for periodo, por_tipo in totales.items():
+            self.stdout.write(f"{periodo}  " + '  '.join(f"{tipo}: {por_tipo[tipo]:,.2f}" for tipo in TIPOS_DECLARADOS))
@@ -0,0 +1,126 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.core.management.base import BaseCommand
+from municipal_app.jobs import claim_next_job, claim_jobs, fail_stale_jobs, process_job, process_jobs_concurrently
+
+class Command(BaseCommand):
+    help = 'Procesa los trabajos de bots (munibot / rentabot) encolados por las vistas de facturación'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Procesa la cola hasta vaciarla y termina.')
+        parser.add_argument('--interval', type=float, default=2.0, help='Segundos de espera cuando la cola está vacía.')
+        parser.add_argument('--pool-size', type=int, default=getattr(settings, 'BOT_BROWSER_POOL_SIZE', 1),
+                            help='Navegadores headless que el worker mantiene abiertos; cada uno atiende un trabajo a la vez, '
+                                 'en su propio ejecutor (0 desactiva el pool y procesa de a uno).')
+        parser.add_argument('--max-contexts', type=int, default=getattr(settings, 'BOT_BROWSER_MAX_CONTEXTS', 50),
+                            help='Contextos servidos por navegador antes de reciclarlo.')
+        parser.add_argument('--cdp-browsers', type=int, default=getattr(settings, 'BOT_CDP_BROWSERS', 1),
+                            help='Navegadores CDP propios para rentabot (0 usa el Edge abierto a mano en 127.0.0.1:9222).')
+        parser.add_argument('--concurrent', type=int, default=0,
+                            help='Toma hasta N trabajos por vuelta y los presenta a la vez con el runner async '
+                                 '(límite por portal en BOT_CONCURRENCY). 0 = de a uno.')
+        parser.add_argument('--stale-minutes', type=int, default=getattr(settings, 'BOT_STALE_JOB_MINUTES', 60),
+                            help="Al arrancar, marca como fallidos los trabajos que siguen en 'running' hace más de "
+                                 'estos minutos (su worker se cayó). 0 no revisa.')
+
+    def handle(self, *args, **options):
+        for job in fail_stale_jobs(options['stale_minutes']):
+            self.stdout.write(self.style.WARNING(
+                f"Job #{job.pk} ({job.portal}, {job.period}) seguía en 'running' desde {job.started_at}: marcado como fallido."))
+        if options['concurrent'] > 0:
+            return self._handle_concurrent(options)
+
+        cdp_launcher = None
+        if options['cdp_browsers'] > 0:
+            from cdp_launcher import CDPLauncher
+            cdp_launcher = CDPLauncher(cantidad=options['cdp_browsers']).start()
+            self.stdout.write(f"Navegadores CDP iniciados: {', '.join(cdp_launcher.endpoints())}")
+
+        # Un ejecutor (hilo) por navegador del pool: cada uno toma trabajos de la cola por su cuenta
+        ejecutores = max(1, options['pool_size'])
+        detener = threading.Event()
+        hilos = [threading.Thread(target=self._ejecutor, args=(numero, options, cdp_launcher, detener),
+                                  name=f'bot-worker-{numero}', daemon=True)
+                 for numero in range(1, ejecutores + 1)]
+        self.stdout.write(self.style.SUCCESS(f'Worker de bots iniciado ({ejecutores} ejecutor(es)). Esperando trabajos...'))
+        try:
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                while hilo.is_alive():
+                    hilo.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Worker detenido. Esperando los trabajos en curso...'))
+            detener.set()
+            for hilo in hilos:
+                hilo.join()
+        finally:
+            if cdp_launcher is not None:
+                cdp_launcher.stop()
+
+    def _ejecutor(self, numero, options, cdp_launcher, detener):
+        """
+        Toma y procesa trabajos de a uno hasta que se pide detener el worker (o, con `--once`, hasta
+        vaciar la cola). Los objetos de `playwright.sync_api` quedan atados al hilo que los creó,
+        así que cada ejecutor abre su propio `BrowserPool` de un navegador.
+        """
+        pool = None
+        try:
+            if options['pool_size'] > 0:
+                from browser_pool import BrowserPool
+                pool = BrowserPool(size=1, max_contexts=options['max_contexts']).start()
+                self.stdout.write(f'Ejecutor {numero}: navegador del pool iniciado.')
+
+            while not detener.is_set():
+                job = claim_next_job()
+                if job is None:
+                    if options['once']:
+                        break
+                    if pool is not None:
+                        pool.health_check()
+                    detener.wait(options['interval'])
+                    continue
+
+                self.stdout.write(f'Ejecutor {numero}: ejecutando job #{job.pk} ({job.portal}, {job.period}) para {job.user.username}...')
+                job = process_job(job, pool=pool, cdp_launcher=cdp_launcher)
+                if job.result == 'Success':
+                    self.stdout.write(self.style.SUCCESS(f'Job #{job.pk} finalizado correctamente.'))
+                else:
+                    self.stdout.write(self.style.ERROR(f'Job #{job.pk} falló: {job.error}'))
+        finally:
+            if pool is not None:
+                pool.close()
+            connection.close()  # Cada hilo tiene su propia conexión a la base
+
+    def _handle_concurrent(self, options):
+        concurrencia = getattr(settings, 'BOT_CONCURRENCY', None)
+        cdp_launcher = None
+        if options['cdp_browsers'] > 0:
+            from cdp_launcher import CDPLauncher
+            cdp_launcher = CDPLauncher(cantidad=options['cdp_browsers']).start()
+            self.stdout.write(f"Navegadores CDP iniciados para Misiones: {', '.join(cdp_launcher.endpoints())}")
+
+        self.stdout.write(self.style.SUCCESS(f"Worker de bots iniciado en modo concurrente (hasta {options['concurrent']} trabajos por vuelta)."))
+        try:
+            while True:
+                jobs = claim_jobs(options['concurrent'])
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+
+                self.stdout.write(f'Ejecutando {len(jobs)} trabajo(s) en paralelo: {", ".join(f"#{job.pk}" for job in jobs)}')
+                for job in process_jobs_concurrently(jobs, concurrencia=concurrencia, cdp_launcher=cdp_launcher):
+                    if job.result == 'Success':
+                        self.stdout.write(self.style.SUCCESS(f'Job #{job.pk} finalizado correctamente.'))
+                    else:
+                        self.stdout.write(self.style.ERROR(f'Job #{job.pk} falló: {job.error}'))
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Worker detenido.'))
+        finally:
+            if cdp_launcher is not None:
+                cdp_launcher.stop()
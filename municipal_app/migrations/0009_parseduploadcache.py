@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('municipal_app', '0008_portalsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParsedUploadCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64)),
+                ('parser_version', models.PositiveIntegerField()),
+                ('amount', models.CharField(max_length=50)),
+                ('file_type', models.CharField(max_length=10)),
+                ('file_size', models.PositiveBigIntegerField()),
+                ('parse_ms', models.FloatField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_used_at'], name='municipal_a_last_us_aaec32_idx')],
+                'unique_together': {('sha256', 'parser_version')},
+            },
+        ),
+    ]
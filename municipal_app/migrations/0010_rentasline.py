@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('municipal_app', '0009_parseduploadcache'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RentasLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=7)),
+                ('line_type', models.CharField(choices=[('PERCEPCIÓN', 'Percepción'), ('RETENCIÓN', 'Retención'), ('OTRO', 'Otro')], max_length=20)),
+                ('line_date', models.DateField(blank=True, null=True)),
+                ('agent_cuit', models.CharField(blank=True, default='', max_length=20)),
+                ('agent_name', models.CharField(blank=True, default='', max_length=200)),
+                ('regime', models.CharField(blank=True, default='', max_length=20)),
+                ('tax_base', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('rate', models.DecimalField(blank=True, decimal_places=4, max_digits=8, null=True)),
+                ('coefficient', models.DecimalField(blank=True, decimal_places=4, max_digits=8, null=True)),
+                ('total', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='municipal_app.botjob')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'period', 'line_type'], name='municipal_a_user_id_446553_idx'), models.Index(fields=['user', 'agent_cuit'], name='municipal_a_user_id_87306e_idx')],
+            },
+        ),
+    ]
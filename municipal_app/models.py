@@ -45,3 +45,124 @@ class MisionesExecutionHistory(models.Model):
     def __str__(self):
         return f"Misiones Execution for {self.user.username} at {self.execution_time.strftime('%Y-%m-%d %H:%M')}"
 
+
+class BotJob(models.Model):
+    """
+    Trabajo encolado para ejecutar un bot (munibot / rentabot) fuera del request HTTP.
+    El worker (`manage.py run_bot_worker`) lo toma, ejecuta el bot y escribe el historial.
+    """
+    PORTAL_POSADAS = 'posadas'
+    PORTAL_MISIONES = 'misiones'
+    PORTAL_CHOICES = [
+        (PORTAL_POSADAS, 'Municipalidad de Posadas'),
+        (PORTAL_MISIONES, 'Renta Misiones'),
+    ]
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'En cola'),
+        (STATUS_RUNNING, 'En ejecución'),
+        (STATUS_DONE, 'Finalizado'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    portal = models.CharField(max_length=20, choices=PORTAL_CHOICES)
+    period = models.CharField(max_length=7) # Formato 'YYYY-MM'
+    amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    result = models.CharField(max_length=20, blank=True, default='') # 'Success' / 'Failed' al terminar
+    output = models.TextField(blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Job #{self.pk} {self.portal} {self.period} ({self.status}) para {self.user.username}"
+
+class PortalSession(models.Model):
+    """
+    `storage_state` de Playwright de un login exitoso, cifrado con la misma clave Fernet
+    que las credenciales. Permite que los bots salteen el login mientras no venza.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    portal = models.CharField(max_length=20, choices=BotJob.PORTAL_CHOICES)
+    storage_state = models.BinaryField() # JSON cifrado con Fernet
+    created_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = [('user', 'portal')]
+
+    def __str__(self):
+        return f"Sesión {self.portal} de {self.user.username} (vence {self.expires_at.strftime('%Y-%m-%d %H:%M')})"
+
+class ParsedUploadCache(models.Model):
+    """
+    Monto ya extraído de un archivo subido, identificado por el SHA-256 de su contenido y
+    la versión del parser (`utils.PARSER_VERSION`). Si el usuario vuelve a subir el mismo
+    archivo, las vistas usan este monto en lugar de volver a parsearlo.
+    """
+    sha256 = models.CharField(max_length=64)
+    parser_version = models.PositiveIntegerField()
+    amount = models.CharField(max_length=50) # str(Decimal) tal como lo devolvió el parser, sin redondear
+    file_type = models.CharField(max_length=10) # 'excel' / 'pdf' / 'csv'
+    file_size = models.PositiveBigIntegerField()
+    parse_ms = models.FloatField() # Lo que tardó el parseo original
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = [('sha256', 'parser_version')]
+        indexes = [
+            models.Index(fields=['last_used_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.file_type} {self.sha256[:12]}… v{self.parser_version}: {self.amount}"
+
+class RentasLine(models.Model):
+    """
+    Línea de la planilla de retenciones y percepciones de Renta Misiones, guardada al
+    descargarla (ver `rentas_lines`). Permite recalcular totales o conciliar meses viejos
+    con consultas a la base, sin navegador ni parseo de Excel.
+    """
+    TYPE_PERCEPCION = 'PERCEPCIÓN'
+    TYPE_RETENCION = 'RETENCIÓN'
+    TYPE_OTRO = 'OTRO'
+    TYPE_CHOICES = [
+        (TYPE_PERCEPCION, 'Percepción'),
+        (TYPE_RETENCION, 'Retención'),
+        (TYPE_OTRO, 'Otro'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    job = models.ForeignKey(BotJob, on_delete=models.SET_NULL, null=True, blank=True)
+    period = models.CharField(max_length=7) # Período consultado, formato 'YYYY-MM'
+    line_type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    line_date = models.DateField(null=True, blank=True)
+    agent_cuit = models.CharField(max_length=20, blank=True, default='')
+    agent_name = models.CharField(max_length=200, blank=True, default='')
+    regime = models.CharField(max_length=20, blank=True, default='')
+    tax_base = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    rate = models.DecimalField(max_digits=8, decimal_places=4, null=True, blank=True)
+    coefficient = models.DecimalField(max_digits=8, decimal_places=4, null=True, blank=True)
+    total = models.DecimalField(max_digits=14, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'period', 'line_type']),
+            models.Index(fields=['user', 'agent_cuit']),
+        ]
+
+    def __str__(self):
+        return f"{self.period} {self.line_type} {self.agent_cuit}: {self.total} ({self.user.username})"
@@ -0,0 +1,132 @@
+"""
+Tipos de índice FAISS para la base de conocimiento del chatbot.
+
+- flat: búsqueda exacta, recorre todos los fragmentos (`IndexFlatL2`).
+- ivf:  agrupa los vectores en `nlist` celdas y solo revisa las `nprobe` más cercanas (`IndexIVFFlat`).
+- hnsw: grafo navegable de `m` vecinos por nodo; `ef_search` regula cuánto se explora (`IndexHNSWFlat`).
+
+Los parámetros se guardan en `index_config.json`, junto a `index.faiss`, y los de búsqueda
+(nprobe, ef_search) se vuelven a aplicar cada vez que se carga el índice.
+"""
+import json
+import os
+import time
+
+import faiss
+import numpy as np
+
+TIPOS_INDICE = ('flat', 'ivf', 'hnsw')
+PARAMETROS_POR_DEFECTO = {'nlist': 100, 'nprobe': 8, 'm': 32, 'ef_construction': 40, 'ef_search': 64}
+ARCHIVO_CONFIGURACION = 'index_config.json'
+PUNTOS_POR_CELDA = 39  # Mínimo que pide FAISS para entrenar cada centroide de IVF
+
+
+def configuracion_indice(tipo='flat', **parametros):
+    """Tipo y parámetros completos (los que faltan, con su valor por defecto)."""
+    if tipo not in TIPOS_INDICE:
+        raise ValueError(f"Tipo de índice desconocido: {tipo!r} (opciones: {', '.join(TIPOS_INDICE)}).")
+    configuracion = {'tipo': tipo, **PARAMETROS_POR_DEFECTO}
+    configuracion.update({nombre: valor for nombre, valor in parametros.items() if valor is not None})
+    return configuracion
+
+
+def construir_indice(embeddings, configuracion, ids=None):
+    """
+    Índice FAISS (distancia L2) con los `embeddings` (matriz float32) ya agregados. Con `ids`
+    (uno por fila) queda envuelto en `IndexIDMap2` y las búsquedas devuelven esos ids. En IVF,
+    `nlist` se limita para que cada celda se entrene con al menos `PUNTOS_POR_CELDA` vectores
+    (con menos, k-means deja celdas vacías o casi vacías).
+    """
+    dimension = embeddings.shape[1]
+    if configuracion['tipo'] == 'ivf':
+        nlist = max(1, min(configuracion['nlist'], len(embeddings) // PUNTOS_POR_CELDA))
+        indice = faiss.IndexIVFFlat(faiss.IndexFlatL2(dimension), dimension, nlist)
+        indice.train(embeddings)
+    elif configuracion['tipo'] == 'hnsw':
+        indice = faiss.IndexHNSWFlat(dimension, configuracion['m'])
+        indice.hnsw.efConstruction = configuracion['ef_construction']
+    else:
+        indice = faiss.IndexFlatL2(dimension)
+    aplicar_parametros_busqueda(indice, configuracion)
+    if ids is None:
+        indice.add(embeddings)
+        return indice
+    indice = faiss.IndexIDMap2(indice)
+    indice.add_with_ids(embeddings, np.asarray(ids, dtype='int64'))
+    return indice
+
+
+def almacen_vectores(dimension):
+    """Índice exacto con ids propios: guarda los embeddings para agregar y borrar de a uno."""
+    return faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+
+
+def contenido_almacen(almacen):
+    """(ids, matriz de embeddings) de un `almacen_vectores`, en el mismo orden."""
+    return faiss.vector_to_array(almacen.id_map).astype('int64'), almacen.index.reconstruct_n(0, almacen.ntotal)
+
+
+def aplicar_parametros_busqueda(indice, configuracion):
+    """nprobe (IVF) o efSearch (HNSW); no se guardan en index.faiss, hay que aplicarlos al cargarlo."""
+    if configuracion['tipo'] == 'ivf':
+        faiss.ParameterSpace().set_index_parameter(indice, 'nprobe', configuracion['nprobe'])
+    elif configuracion['tipo'] == 'hnsw':
+        faiss.ParameterSpace().set_index_parameter(indice, 'efSearch', configuracion['ef_search'])
+    return indice
+
+
+def guardar_configuracion(directorio, configuracion):
+    ruta = os.path.join(directorio, ARCHIVO_CONFIGURACION)
+    with open(f"{ruta}.parcial", 'w', encoding='utf-8') as archivo:
+        json.dump(configuracion, archivo, indent=2)
+    os.replace(f"{ruta}.parcial", ruta)
+
+
+def leer_configuracion(directorio):
+    """La configuración guardada; un índice anterior a este archivo es flat."""
+    try:
+        with open(os.path.join(directorio, ARCHIVO_CONFIGURACION), encoding='utf-8') as archivo:
+            return configuracion_indice(**json.load(archivo))
+    except FileNotFoundError:
+        return configuracion_indice('flat')
+
+
+def _latencias_ms(indice, consultas, k):
+    latencias = []
+    resultados = []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        _, ids = indice.search(consulta[np.newaxis, :], k)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        resultados.append(ids[0])
+    return np.array(latencias), resultados
+
+
+def comparar_con_flat(indice, embeddings, k=3, max_consultas=1000, ids=None):
+    """
+    Recall@k y latencia por consulta del `indice` frente a la búsqueda exacta (flat) sobre los
+    mismos `embeddings` (con `ids`, si el índice los devuelve). Las consultas son una muestra de
+    los propios fragmentos: miden cuánto de lo que encuentra el flat recupera el índice
+    aproximado, no la calidad de las respuestas.
+
+    Returns:
+        dict: recall, consultas, k y latencias (media y p95 en ms) del índice y del flat.
+    """
+    k = min(k, len(embeddings))
+    rng = np.random.default_rng(0)
+    muestra = rng.choice(len(embeddings), size=min(max_consultas, len(embeddings)), replace=False)
+    consultas = embeddings[np.sort(muestra)]
+    exacto = construir_indice(embeddings, configuracion_indice('flat'), ids)
+
+    latencias_flat, esperados = _latencias_ms(exacto, consultas, k)
+    latencias, obtenidos = _latencias_ms(indice, consultas, k)
+    aciertos = sum(len(set(esperado) & set(obtenido)) for esperado, obtenido in zip(esperados, obtenidos))
+    return {
+        'consultas': len(consultas),
+        'k': k,
+        'recall': aciertos / (len(consultas) * k) if len(consultas) else 1.0,
+        'latencia_media_ms': float(latencias.mean()) if len(latencias) else 0.0,
+        'latencia_p95_ms': float(np.percentile(latencias, 95)) if len(latencias) else 0.0,
+        'latencia_media_flat_ms': float(latencias_flat.mean()) if len(latencias_flat) else 0.0,
+        'latencia_p95_flat_ms': float(np.percentile(latencias_flat, 95)) if len(latencias_flat) else 0.0,
+    }
@@ -0,0 +1,122 @@
+"""
+Manifiesto de la indexación incremental de `base_conocimiento/`.
+
+`faiss_index/manifest.json` guarda, por archivo, el hash de su contenido y el de cada
+fragmento con el id de su vector en el índice:
+
+    {"modelo": "...", "proximo_id": 812,
+     "archivos": {"normativa_rentas.txt": {"sha256": "...", "fragmentos": [{"sha256": "...", "id": 0}, ...]}}}
+
+Comparando los documentos actuales con el manifiesto se sabe qué fragmentos hay que
+embeber (nuevos o modificados) y qué vectores borrar (los de fragmentos que ya no están).
+
+Una indexación interrumpida deja, además, "pendientes": {hash: [ids]} de los fragmentos que
+ya se embebieron (y están en `vectores.faiss`) pero todavía no forman parte del índice. La
+corrida siguiente los retoma en lugar de volver a pedirlos a la API.
+"""
+import hashlib
+import json
+import os
+from collections import defaultdict
+
+ARCHIVO_MANIFIESTO = 'manifest.json'
+
+
+def hash_texto(texto):
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+def fragmentar(texto):
+    """Fragmentación simple por párrafos."""
+    return [t.strip() for t in texto.split('\n\n') if t.strip()]
+
+
+def leer_manifiesto(directorio):
+    try:
+        with open(os.path.join(directorio, ARCHIVO_MANIFIESTO), encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def guardar_manifiesto(directorio, manifiesto):
+    ruta = os.path.join(directorio, ARCHIVO_MANIFIESTO)
+    with open(f"{ruta}.parcial", 'w', encoding='utf-8') as archivo:
+        json.dump(manifiesto, archivo, ensure_ascii=False, indent=1)
+    os.replace(f"{ruta}.parcial", ruta)
+
+
+def planificar(documentos, manifiesto, modelo):
+    """
+    Qué cambió entre los `documentos` actuales ({nombre: texto}) y el `manifiesto` anterior.
+    Un fragmento que sigue en el mismo archivo conserva su id (y su vector), aunque el
+    archivo haya cambiado; uno que quedó pendiente de una corrida interrumpida retoma el suyo,
+    y uno nuevo recibe un id que nunca se usó.
+
+    Returns:
+        dict: 'manifiesto' (el nuevo), 'nuevos' [(id, texto)] a embeber, 'eliminados' [id] a
+        borrar del índice, 'textos' {id: texto} de todos los fragmentos y 'resumen' (contadores).
+    """
+    anteriores = manifiesto.get('archivos', {})
+    proximo_id = manifiesto.get('proximo_id', 0)
+    archivos, nuevos, textos = {}, [], {}
+    pendientes = defaultdict(list, {hash_chunk: list(ids) for hash_chunk, ids in manifiesto.get('pendientes', {}).items()})
+    resumen = dict.fromkeys(('archivos_nuevos', 'archivos_modificados', 'archivos_sin_cambios', 'archivos_eliminados',
+                             'fragmentos_nuevos', 'fragmentos_reutilizados', 'fragmentos_retomados',
+                             'fragmentos_eliminados'), 0)
+
+    for nombre, texto in sorted(documentos.items()):
+        previo = anteriores.get(nombre)
+        sha256 = hash_texto(texto)
+        if previo is None:
+            resumen['archivos_nuevos'] += 1
+        elif previo['sha256'] == sha256:
+            resumen['archivos_sin_cambios'] += 1
+        else:
+            resumen['archivos_modificados'] += 1
+
+        disponibles = defaultdict(list)  # hash -> ids del archivo anterior (un párrafo puede repetirse)
+        for fragmento in (previo or {}).get('fragmentos', []):
+            disponibles[fragmento['sha256']].append(fragmento['id'])
+        fragmentos = []
+        for chunk in fragmentar(texto):
+            hash_chunk = hash_texto(chunk)
+            if disponibles[hash_chunk]:
+                identificador = disponibles[hash_chunk].pop(0)
+                resumen['fragmentos_reutilizados'] += 1
+            elif pendientes[hash_chunk]:
+                identificador = pendientes[hash_chunk].pop(0)
+                resumen['fragmentos_retomados'] += 1
+            else:
+                identificador = proximo_id
+                proximo_id += 1
+                nuevos.append((identificador, chunk))
+            fragmentos.append({'sha256': hash_chunk, 'id': identificador})
+            textos[identificador] = chunk
+        archivos[nombre] = {'sha256': sha256, 'fragmentos': fragmentos}
+
+    resumen['archivos_eliminados'] = len(set(anteriores) - set(documentos))
+    eliminados = [fragmento['id'] for previo in anteriores.values() for fragmento in previo['fragmentos']
+                  if fragmento['id'] not in textos]
+    eliminados += [identificador for ids in pendientes.values() for identificador in ids]  # Ya no se usan
+    resumen['fragmentos_nuevos'] = len(nuevos)
+    resumen['fragmentos_eliminados'] = len(eliminados)
+    return {
+        'manifiesto': {'modelo': modelo, 'proximo_id': proximo_id, 'archivos': archivos},
+        'nuevos': nuevos,
+        'eliminados': eliminados,
+        'textos': textos,
+        'resumen': resumen,
+    }
+
+
+def manifiesto_parcial(manifiesto, plan, embebidos):
+    """
+    Manifiesto para guardar a mitad de la indexación: el anterior (que sigue describiendo el
+    índice publicado) más, como pendientes, los fragmentos `embebidos` [(id, texto)] hasta ahora.
+    """
+    pendientes = defaultdict(list, {hash_chunk: list(ids) for hash_chunk, ids in manifiesto.get('pendientes', {}).items()})
+    for identificador, texto in embebidos:
+        pendientes[hash_texto(texto)].append(identificador)
+    return {**manifiesto, 'modelo': plan['manifiesto']['modelo'], 'proximo_id': plan['manifiesto']['proximo_id'],
+            'archivos': manifiesto.get('archivos', {}), 'pendientes': dict(pendientes)}
@@ -0,0 +1,125 @@
+"""
+Líneas de las planillas de Rentas en la base (modelo `RentasLine`). Se guardan una vez por
+descarga, en lotes de `bulk_create`, y los totales por período o por agente salen de una
+agregación en SQL: no hace falta volver a descargar ni a parsear el Excel.
+"""
+import logging
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+
+from .models import RentasLine
+
+logger = logging.getLogger(__name__)
+
+TIPOS_DECLARADOS = (RentasLine.TYPE_PERCEPCION, RentasLine.TYPE_RETENCION)
+TIPOS_VALIDOS = {tipo for tipo, _ in RentasLine.TYPE_CHOICES}
+CENTAVOS = Decimal('0.01')
+DIEZMILESIMOS = Decimal('0.0001')
+
+
+def _columna(df, nombre):
+    return df[nombre] if nombre in df.columns else pd.Series(None, index=df.index, dtype=object)
+
+
+def _texto(valor):
+    if valor is None or pd.isna(valor):
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)  # RÉG con celdas vacías llega como float: 26.0 -> '26'
+    return str(valor).strip()
+
+
+def _decimal(valor, exponente=CENTAVOS):
+    if valor is None or pd.isna(valor):
+        return None
+    try:
+        return Decimal(str(valor)).quantize(exponente)
+    except InvalidOperation:
+        return None
+
+
+def _fechas(df):
+    fechas = _columna(df, 'FECHA')
+    if not pd.api.types.is_datetime64_any_dtype(fechas):
+        fechas = pd.to_datetime(fechas, format='%d/%m/%Y', errors='coerce')
+    return [None if pd.isna(fecha) else fecha.date() for fecha in fechas]
+
+
+def _lineas(user, df, period, job):
+    """Un `RentasLine` por fila con TOTAL; se generan a medida que se insertan los lotes."""
+    tipos = df['TIPO'] if 'TIPO' in df.columns else pd.Series(RentasLine.TYPE_OTRO, index=df.index)
+    numericas = [pd.to_numeric(_columna(df, nombre), errors='coerce') for nombre in ('BASE IMP.', 'ALÍC.', 'COEF.', 'TOTAL')]
+    columnas = zip(tipos, _fechas(df), _columna(df, 'CUIT'), _columna(df, 'RAZÓN SOCIAL'), _columna(df, 'RÉG'), *numericas)
+    for tipo, fecha, cuit, razon_social, regimen, base, alicuota, coeficiente, total in columnas:
+        total = _decimal(total)
+        if total is None:
+            continue  # Sin monto no suma en ningún total (igual que en `totales_por_tipo`)
+        yield RentasLine(
+            user=user, job=job, period=period,
+            line_type=tipo if tipo in TIPOS_VALIDOS else RentasLine.TYPE_OTRO,
+            line_date=fecha,
+            agent_cuit=_texto(cuit)[:20],
+            agent_name=_texto(razon_social)[:200],
+            regime=_texto(regimen)[:20],
+            tax_base=_decimal(base),
+            rate=_decimal(alicuota, DIEZMILESIMOS),
+            coefficient=_decimal(coeficiente, DIEZMILESIMOS),
+            total=total,
+        )
+
+
+def guardar_lineas(user, df, period, job=None, tamanio_lote=None):
+    """
+    Guarda las líneas de una planilla de Rentas (ver `rentabot.leer_lineas_rentas`) para el
+    período 'YYYY-MM' consultado. Reemplaza las que ya hubiera del mismo usuario y período, en
+    una sola transacción: una descarga repetida nunca duplica montos.
+
+    Returns:
+        int: Cantidad de líneas guardadas.
+    """
+    tamanio_lote = tamanio_lote or getattr(settings, 'RENTAS_LINES_BATCH_SIZE', 1000)
+    lineas = _lineas(user, df, period, job)
+    guardadas = 0
+    with transaction.atomic():
+        RentasLine.objects.filter(user=user, period=period).delete()
+        while lote := list(islice(lineas, tamanio_lote)):
+            RentasLine.objects.bulk_create(lote)
+            guardadas += len(lote)
+    logger.debug(f"guardar_lineas: {guardadas} línea(s) de Rentas de {user.username} para {period}.")
+    return guardadas
+
+
+def totales_por_periodo(user, desde=None, hasta=None):
+    """
+    Totales declarables por período entre `desde` y `hasta` ('YYYY-MM', inclusive), sumados en la base.
+
+    Returns:
+        dict: {'YYYY-MM': {'PERCEPCIÓN': Decimal, 'RETENCIÓN': Decimal}}, ordenado por período.
+    """
+    lineas = RentasLine.objects.filter(user=user, line_type__in=TIPOS_DECLARADOS)
+    if desde:
+        lineas = lineas.filter(period__gte=desde)
+    if hasta:
+        lineas = lineas.filter(period__lte=hasta)
+    totales = {}
+    for fila in lineas.values('period', 'line_type').annotate(total=Sum('total')).order_by('period'):
+        totales.setdefault(fila['period'], dict.fromkeys(TIPOS_DECLARADOS, Decimal('0.00')))[fila['line_type']] = fila['total']
+    return totales
+
+
+def totales_por_agente(user, period):
+    """
+    Montos de un período por agente de retención/percepción y tipo, de mayor a menor.
+
+    Returns:
+        list: [{'agent_cuit', 'razon_social', 'line_type', 'total': Decimal, 'lineas': int}]
+    """
+    return list(RentasLine.objects.filter(user=user, period=period)
+                .values('agent_cuit', 'line_type')
+                .annotate(razon_social=Max('agent_name'), total=Sum('total'), lineas=Count('id'))
+                .order_by('-total', 'agent_cuit'))
@@ -0,0 +1,67 @@
+import json
+import logging
+from datetime import timedelta
+
+from cryptography.fernet import Fernet
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import PortalSession
+
+logger = logging.getLogger(__name__)
+
+try:
+    f = Fernet(settings.FERNET_KEY)
+except Exception as e:
+    logger.error(f"Error initializing Fernet: {e}. Ensure FERNET_KEY is set correctly in settings.py")
+    f = None
+
+
+class EncryptedSessionStore:
+    """
+    Guarda y recupera el `storage_state` de Playwright de un usuario para un portal.
+    Es la interfaz `load()` / `save(state)` / `clear()` que esperan los bots.
+    """
+
+    def __init__(self, user, portal, ttl_minutes=None):
+        self.user = user
+        self.portal = portal
+        if ttl_minutes is None:
+            ttl_minutes = getattr(settings, 'BOT_SESSION_TTL_MINUTES', 30)
+        self.ttl = timedelta(minutes=ttl_minutes)
+
+    def load(self):
+        """Devuelve el `storage_state` guardado, o None si no hay, venció o no se puede descifrar."""
+        if not f:
+            return None
+        session = PortalSession.objects.filter(user=self.user, portal=self.portal).first()
+        if session is None:
+            return None
+        if session.expires_at <= timezone.now():
+            logger.debug(f"EncryptedSessionStore: Sesión {self.portal} de {self.user.username} vencida.")
+            session.delete()
+            return None
+        try:
+            return json.loads(f.decrypt(bytes(session.storage_state)).decode())
+        except Exception as e:
+            logger.warning(f"EncryptedSessionStore: No se pudo descifrar la sesión {self.portal} de {self.user.username}: {e}")
+            session.delete()
+            return None
+
+    def save(self, state):
+        if not f:
+            logger.error("EncryptedSessionStore: Fernet no inicializado. La sesión no se guarda.")
+            return
+        PortalSession.objects.update_or_create(
+            user=self.user,
+            portal=self.portal,
+            defaults={
+                'storage_state': f.encrypt(json.dumps(state).encode()),
+                'expires_at': timezone.now() + self.ttl,
+            },
+        )
+        logger.info(f"EncryptedSessionStore: Sesión {self.portal} guardada para {self.user.username}.")
+
+    def clear(self):
+        PortalSession.objects.filter(user=self.user, portal=self.portal).delete()
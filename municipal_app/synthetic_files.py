@@ -0,0 +1,152 @@
+"""
+Archivos sintéticos para benchmarks y tests: planillas de Rentas con el formato real
+de la extranet de ATM y facturas en Excel o PDF. Todo se escribe en disco a medida que
+se genera, así se pueden armar archivos de 1M de filas sin tenerlos en memoria.
+"""
+import csv
+import io
+import random
+
+import openpyxl
+
+# Mismas columnas que la planilla que descarga rentabot (descargas_rentas/Rentas_YYYY-MM.xlsx)
+COLUMNAS_RENTAS = ['CUIT', 'RAZÓN SOCIAL', 'RÉG', 'FECHA', 'BASE IMP.', 'ALÍC.', 'COEF.', 'TOTAL']
+AGENTES = [
+    ('30-70308853-4', 'MERCADO LIBRE S.R.L.'),
+    ('30-50001091-2', 'BANCO DE LA NACION ARGENTINA'),
+    ('30-99903208-3', 'ELECTRICIDAD DE MISIONES S.A.'),
+]
+LINEAS_POR_PAGINA = 50
+
+
+def monto_ar(valor):
+    """1234.5 -> '1.234,50' (así vienen los montos en la planilla de la extranet)."""
+    return f"{valor:,.2f}".replace(',', '_').replace('.', ',').replace('_', '.')
+
+
+def filas_rentas(filas, periodo='2025-09', semilla=0):
+    """
+    Líneas de Rentas: ~50% percepciones (con ALÍC.), ~45% retenciones (con COEF.) y el resto
+    sin tipo. Los montos son texto en formato argentino, como en el archivo real.
+    """
+    rng = random.Random(semilla)
+    anio, mes = periodo.split('-')
+    for _ in range(filas):
+        cuit, razon_social = rng.choice(AGENTES)
+        base = rng.uniform(100, 100000)
+        sorteo = rng.random()
+        if sorteo < 0.5:
+            alicuota, coeficiente, total = '3,31', None, base * 0.0331
+        elif sorteo < 0.95:
+            alicuota, coeficiente, total = None, '1,00', base * 0.04
+        else:
+            alicuota, coeficiente, total = None, None, base * 0.01
+        yield [cuit, razon_social, 26, f"{rng.randint(1, 28):02d}/{mes}/{anio}", monto_ar(base),
+               alicuota, coeficiente, monto_ar(total)]
+
+
+def escribir_rentas_xlsx(ruta, filas, periodo='2025-09', semilla=0):
+    """Planilla de Rentas con `filas` líneas, escrita en modo write_only (memoria constante)."""
+    wb = openpyxl.Workbook(write_only=True)
+    hoja = wb.create_sheet()
+    hoja.append(COLUMNAS_RENTAS)
+    for fila in filas_rentas(filas, periodo, semilla):
+        hoja.append(fila)
+    wb.save(ruta)
+    return ruta
+
+
+def escribir_rentas_csv(ruta, filas, periodo='2025-09', semilla=0):
+    """Las mismas líneas que `escribir_rentas_xlsx`, exportadas como CSV separado por ';'."""
+    with open(ruta, 'w', newline='', encoding='utf-8') as archivo:
+        escritor = csv.writer(archivo, delimiter=';')
+        escritor.writerow(COLUMNAS_RENTAS)
+        escritor.writerows(filas_rentas(filas, periodo, semilla))
+    return ruta
+
+
+def _items_factura(filas, semilla):
+    rng = random.Random(semilla)
+    total = 0.0
+    for numero in range(1, filas + 1):
+        cantidad = rng.randint(1, 20)
+        precio = round(rng.uniform(10, 5000), 2)
+        total += cantidad * precio
+        yield numero, cantidad, precio, round(cantidad * precio, 2), round(total, 2)
+
+
+def escribir_factura_xlsx(ruta, filas, semilla=0):
+    """Factura con `filas` ítems y el total en la última fila (lo que busca extract_total_from_excel)."""
+    wb = openpyxl.Workbook(write_only=True)
+    hoja = wb.create_sheet()
+    hoja.append(['Detalle', 'Cantidad', 'Precio unitario', 'Importe'])
+    total = 0.0
+    for numero, cantidad, precio, importe, total in _items_factura(filas, semilla):
+        hoja.append([f"Ítem {numero}", cantidad, precio, importe])
+    hoja.append(['Total', round(total, 2)])
+    wb.save(ruta)
+    return ruta
+
+
+def escribir_pdf(destino, paginas):
+    """
+    Escribe en `destino` (archivo binario) un PDF de texto plano (Helvetica), sin dependencias
+    externas. `paginas` es un iterable de listas de líneas; se consume de a una página.
+    """
+    posiciones = []
+    escritos = 0
+
+    def escribir(datos):
+        nonlocal escritos
+        destino.write(datos)
+        escritos += len(datos)
+
+    def objeto(numero, contenido):
+        posiciones.append((numero, escritos))
+        escribir(f'{numero} 0 obj\n'.encode() + contenido + b'\nendobj\n')
+
+    escribir(b'%PDF-1.4\n')
+    objeto(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    objeto(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+    cantidad = 0
+    for lineas in paginas:
+        texto = ' '.join('(%s) Tj T*' % linea.replace('(', '\\(').replace(')', '\\)') for linea in lineas)
+        contenido = f'BT /F1 12 Tf 72 720 Td 14 TL {texto} ET'.encode('latin-1')
+        numero = 4 + 2 * cantidad
+        objeto(numero, f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents {numero + 1} 0 R >>'.encode())
+        objeto(numero + 1, f'<< /Length {len(contenido)} >>\nstream\n'.encode() + contenido + b'\nendstream')
+        cantidad += 1
+    # El árbol de páginas va al final: recién ahora se conoce la cantidad
+    objeto(2, ('<< /Type /Pages /Kids [%s] /Count %d >>' % (' '.join(f'{4 + 2 * i} 0 R' for i in range(cantidad)), cantidad)).encode())
+
+    inicio_xref = escritos
+    total_objetos = 3 + 2 * cantidad
+    desplazamientos = dict(posiciones)
+    escribir(f'xref\n0 {total_objetos + 1}\n0000000000 65535 f \n'.encode())
+    escribir(b''.join(f'{desplazamientos[numero]:010d} 00000 n \n'.encode() for numero in range(1, total_objetos + 1)))
+    escribir(f'trailer\n<< /Size {total_objetos + 1} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n'.encode())
+
+
+def pdf_minimo(paginas):
+    """El mismo PDF que `escribir_pdf`, en memoria (una lista de líneas por página)."""
+    buffer = io.BytesIO()
+    escribir_pdf(buffer, paginas)
+    return buffer.getvalue()
+
+
+def escribir_factura_pdf(ruta, filas, semilla=0, lineas_por_pagina=LINEAS_POR_PAGINA):
+    """Factura PDF con `filas` ítems repartidos en páginas y "Total a pagar" al final de la última."""
+    def paginas():
+        pagina = []
+        total = 0.0
+        for numero, cantidad, precio, importe, total in _items_factura(filas, semilla):
+            pagina.append(f"Item {numero}  {cantidad} x {monto_ar(precio)}  {monto_ar(importe)}")
+            if len(pagina) == lineas_por_pagina:
+                yield pagina
+                pagina = []
+        pagina.append(f"Total a pagar: $ {monto_ar(total)}")
+        yield pagina
+
+    with open(ruta, 'wb') as destino:
+        escribir_pdf(destino, paginas())
+    return ruta
@@ -1,16 +1,64 @@
+import asyncio
+import hashlib
+import io
+import json
+import zipfile
 import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
 from django.test import TestCase
 
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from io import StringIO
 from django.contrib.auth.models import User
 from django.conf import settings
 from cryptography.fernet import Fernet
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock, ANY, call
+from datetime import timedelta
+from django.utils import timezone
 from decimal import Decimal
 
-from .models import MunicipalCredentials, ExecutionHistory
+from .models import MunicipalCredentials, MisionesCredentials, ExecutionHistory, BotJob, PortalSession, ParsedUploadCache, RentasLine
+from .synthetic_files import escribir_factura_pdf, escribir_rentas_xlsx, pdf_minimo
+from .upload_cache import extract_total_cached, hash_archivo, hash_upload
+from .bulk_upload import procesar_carga_masiva
+from .rentas_lines import guardar_lineas, totales_por_agente, totales_por_periodo
+from .embedding_cache import CacheEmbeddings, normalizar_pregunta
+from .answer_cache import CacheRespuestas
+from . import rag_index, rag_manifest
+from .embedding_pipeline import con_reintentos, procesar_en_orden
+from google.api_core import exceptions as api_exceptions
 from .forms import MunicipalCredentialsForm
+from .jobs import (enqueue_job, claim_job, claim_next_job, claim_jobs, process_job, process_jobs_concurrently, periodo_anterior,
+                   ERROR_INTERRUMPIDO)
+from .bulk_filing import planificar_periodo, percentil, procesar_lote, repartir
+from .session_cache import EncryptedSessionStore
+from .utils import extract_total_from_excel, extract_total_from_pdf
+from . import utils
+from .utils import extract_total_from_csv
+from browser_pool import BrowserPool
+import munibot
+from bot_steps import MedidorPasos, MotorPasos, Paso, PasoFatal, correr
+import async_runner
+from cdp_launcher import CDPLauncher
+from bot_network import PoliticaRed
+import rentabot
+import rentas_archive
+import pandas as pd
+import openpyxl
+import faiss
+import numpy as np
 
 # Initialize Fernet for testing
 # Ensure FERNET_KEY is set in settings for tests
@@ -175,66 +223,1598 @@ class EnterBillingViewTest(TestCase):
             municipal_password=self.encrypted_password.encode()
         )
 
-    @patch('municipal_app.views.run_munibot')
-    def test_post_enter_billing_success(self, mock_run_munibot):
-        mock_run_munibot.return_value = ('Success', 'Bot output', None)
+    @patch('municipal_app.jobs.run_munibot')
+    def test_post_enter_billing_enqueues_job(self, mock_run_munibot):
         response = self.client.post(self.enter_billing_url, {'monto': '150.75'})
-        self.assertRedirects(response, self.enter_billing_url)
+        job = BotJob.objects.get(user=self.user)
+        self.assertRedirects(response, f'{self.enter_billing_url}?job={job.pk}')
+        mock_run_munibot.assert_not_called() # El bot no corre dentro del request
+        self.assertEqual(job.portal, BotJob.PORTAL_POSADAS)
+        self.assertEqual(job.status, BotJob.STATUS_QUEUED)
+        self.assertEqual(job.amount, Decimal('150.75'))
+        self.assertEqual(job.period, periodo_anterior())
+        self.assertEqual(ExecutionHistory.objects.count(), 0)
+
+    def test_post_enter_billing_no_credentials(self):
+        MunicipalCredentials.objects.filter(user=self.user).delete()
+        response = self.client.post(self.enter_billing_url, {'monto': '50.00'})
+        self.assertRedirects(response, reverse('municipal_credentials'))
+        self.assertEqual(BotJob.objects.count(), 0)
+        self.assertEqual(ExecutionHistory.objects.count(), 1) # History should still be recorded
+        history = ExecutionHistory.objects.get(user=self.user)
+        self.assertEqual(history.status, 'Failed')
+        self.assertEqual(history.error, 'Credenciales de la municipalidad no encontradas.')
+
+    def test_post_enter_billing_invalid_monto(self):
+        self.client.post(self.enter_billing_url, {'monto': 'invalid_amount'})
+        job = BotJob.objects.get(user=self.user)
+        self.assertIsNone(job.amount) # Invalid monto should be saved as None
+
+    def test_job_status_api(self):
+        self.client.post(self.enter_billing_url, {'monto': '10.00'})
+        job = BotJob.objects.get(user=self.user)
+        response = self.client.get(reverse('job_status', args=[job.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], BotJob.STATUS_QUEUED)
+        self.assertEqual(response.json()['amount'], '10.00')
+
+    def test_job_status_api_other_user(self):
+        other = User.objects.create_user(username='other', password='otherpassword')
+        job = BotJob.objects.create(user=other, portal=BotJob.PORTAL_POSADAS, period='2025-09')
+        response = self.client.get(reverse('job_status', args=[job.pk]))
+        self.assertEqual(response.status_code, 404)
+
+class BotJobWorkerTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.plain_password = 'test_municipal_password'
+        self.encrypted_password = f.encrypt(self.plain_password.encode()).decode()
+        self.credentials = MunicipalCredentials.objects.create(
+            user=self.user,
+            municipal_username='test_municipal_user',
+            municipal_password=self.encrypted_password.encode()
+        )
+
+    def _enqueue_and_process(self, monto):
+        enqueue_job(self.user, BotJob.PORTAL_POSADAS, monto)
+        job = claim_next_job()
+        self.assertEqual(job.status, BotJob.STATUS_RUNNING)
+        return process_job(job)
+
+    @patch('municipal_app.jobs.run_munibot')
+    def test_process_job_success(self, mock_run_munibot):
+        mock_run_munibot.return_value = ('Success', 'Bot output', None)
+        job = self._enqueue_and_process('150.75')
         mock_run_munibot.assert_called_once_with(
             'test_municipal_user',
             self.plain_password,
             '150.75',
-            os.path.join(settings.BASE_DIR, 'edgedriver_win64', 'msedgedriver.exe')
+            os.path.join(settings.BASE_DIR, 'edgedriver_win64', 'msedgedriver.exe'),
+            pool=None,
+            session_store=ANY,
+            politica_red=None,
+            periodo=periodo_anterior()
         )
+        self.assertEqual(job.status, BotJob.STATUS_DONE)
+        self.assertEqual(job.result, 'Success')
+        self.assertIsNotNone(job.finished_at)
         history = ExecutionHistory.objects.get(user=self.user)
         self.assertEqual(history.amount, Decimal('150.75'))
         self.assertEqual(history.status, 'Success')
         self.assertEqual(history.output, 'Bot output')
         self.assertIsNone(history.error)
 
-    @patch('municipal_app.views.run_munibot')
-    def test_post_enter_billing_script_failure(self, mock_run_munibot):
+    @patch('municipal_app.jobs.run_rentabot')
+    def test_process_job_files_the_requested_period(self, mock_run_rentabot):
+        mock_run_rentabot.return_value = ('Success', 'ok', None)
+        MisionesCredentials.objects.create(user=self.user, misiones_username='20-1',
+                                           misiones_password=f.encrypt(b'secret'))
+        enqueue_job(self.user, BotJob.PORTAL_MISIONES, '10.00', period='2025-06')
+        process_job(claim_next_job())
+        self.assertEqual(mock_run_rentabot.call_args.kwargs['periodo'], '2025-06')
+        self.assertEqual(mock_run_rentabot.call_args.kwargs['usuario_archivo'], self.user.pk)
+
+        # rentabot consulta y declara ese mes, y guarda las líneas con ese período
+        al_procesar = MagicMock()
+        estado = rentabot._estado_inicial(MagicMock(), [], '20-1', 'secret', None, False, '/tmp', False, '1000.00',
+                                          None, al_procesar, '2025-06')
+        self.assertEqual(estado['periodo_consulta'], '2025/06')
+        self.assertEqual(estado['mes_a_declarar'].strftime('%m/%Y'), '06/2025')
+        with patch('rentabot.leer_lineas_rentas', return_value=pd.DataFrame({'TIPO': [], 'TOTAL': []})):
+            estado['archivo'] = 'Rentas_2025-06.xlsx'
+            rentabot._procesar_excel(estado)
+        self.assertEqual(al_procesar.call_args[0][1], '2025-06')
+
+    @patch('municipal_app.jobs.run_munibot')
+    def test_process_job_script_failure(self, mock_run_munibot):
         mock_run_munibot.return_value = ('Failed', None, 'Script error')
-        response = self.client.post(self.enter_billing_url, {'monto': '100.00'})
-        self.assertRedirects(response, self.enter_billing_url)
+        job = self._enqueue_and_process('100.00')
+        self.assertEqual(job.result, 'Failed')
         history = ExecutionHistory.objects.get(user=self.user)
         self.assertEqual(history.amount, Decimal('100.00'))
         self.assertEqual(history.status, 'Failed')
         self.assertIsNone(history.output)
         self.assertEqual(history.error, 'Script error')
 
-    def test_post_enter_billing_no_credentials(self):
-        MunicipalCredentials.objects.filter(user=self.user).delete()
-        response = self.client.post(self.enter_billing_url, {'monto': '50.00'})
-        self.assertRedirects(response, reverse('municipal_credentials'))
-        self.assertEqual(ExecutionHistory.objects.count(), 1) # History should still be recorded
-        history = ExecutionHistory.objects.get(user=self.user)
-        self.assertEqual(history.status, 'Failed')
-        self.assertEqual(history.error, 'Credenciales de la municipalidad no encontradas.')
-
-    @patch('municipal_app.views.run_munibot')
-    def test_post_enter_billing_invalid_monto(self, mock_run_munibot):
-        mock_run_munibot.return_value = ('Success', 'Bot output', None)
-        response = self.client.post(self.enter_billing_url, {'monto': 'invalid_amount'})
-        self.assertRedirects(response, self.enter_billing_url)
-        mock_run_munibot.assert_called_once() # Should still attempt to run bot
-        history = ExecutionHistory.objects.get(user=self.user)
-        self.assertIsNone(history.amount) # Invalid monto should be saved as None
-        self.assertEqual(history.status, 'Success')
-
-    @patch('municipal_app.views.f', new=None) # Mock Fernet to be None
-    def test_post_enter_billing_fernet_not_initialized(self):
-        response = self.client.post(self.enter_billing_url, {'monto': '10.00'})
-        self.assertRedirects(response, self.enter_billing_url)
+    @patch('municipal_app.jobs.f', new=None) # Mock Fernet to be None
+    def test_process_job_fernet_not_initialized(self):
+        self._enqueue_and_process('10.00')
         history = ExecutionHistory.objects.get(user=self.user)
         self.assertEqual(history.status, 'Failed')
         self.assertIn('Fernet not initialized', history.error)
 
-    @patch('municipal_app.views.f')
-    def test_post_enter_billing_decryption_error(self, mock_fernet):
+    @patch('municipal_app.jobs.f')
+    def test_process_job_decryption_error(self, mock_fernet):
         mock_fernet.decrypt.side_effect = Exception("Decryption failed")
-        response = self.client.post(self.enter_billing_url, {'monto': '20.00'})
-        self.assertRedirects(response, self.enter_billing_url)
+        self._enqueue_and_process('20.00')
         history = ExecutionHistory.objects.get(user=self.user)
         self.assertEqual(history.status, 'Failed')
         self.assertIn('Ocurrió un error inesperado: Decryption failed', history.error)
+
+    @patch('municipal_app.jobs.run_munibot')
+    def test_claim_next_job_is_fifo_and_exclusive(self, mock_run_munibot):
+        first = enqueue_job(self.user, BotJob.PORTAL_POSADAS, '1.00')
+        second = enqueue_job(self.user, BotJob.PORTAL_POSADAS, '2.00')
+        self.assertEqual(claim_next_job().pk, first.pk)
+        self.assertEqual(claim_next_job().pk, second.pk)
+        self.assertIsNone(claim_next_job())
+
+class BrowserPoolTest(TestCase):
+    def setUp(self):
+        self.playwright = MagicMock()
+        self.playwright.chromium.launch.side_effect = lambda **kwargs: MagicMock()
+        factory = MagicMock()
+        factory.return_value.start.return_value = self.playwright
+        self.pool = BrowserPool(size=2, max_contexts=2, playwright_factory=factory).start()
+
+    def test_lease_gives_fresh_context_and_closes_it(self):
+        with self.pool.lease() as context:
+            self.assertIsNotNone(context)
+        context.close.assert_called_once()
+        self.assertEqual(self.playwright.chromium.launch.call_count, 2) # Sin relanzar navegadores
+
+    def test_leases_are_spread_across_browsers(self):
+        with self.pool.lease(), self.pool.lease():
+            self.assertEqual([b['active_leases'] for b in self.pool.stats()], [1, 1])
+
+    def test_browser_recycled_after_max_contexts(self):
+        for _ in range(3):
+            with self.pool.lease():
+                pass
+        self.assertEqual(self.playwright.chromium.launch.call_count, 2)
+        with self.pool.lease(): # El primer navegador llegó a max_contexts: se recicla
+            pass
+        self.assertEqual(self.playwright.chromium.launch.call_count, 3)
+        self.assertEqual(sorted(b['contexts_served'] for b in self.pool.stats()), [1, 1])
+
+    def test_health_check_relaunches_disconnected_browser(self):
+        self.pool._browsers[0].browser.is_connected.return_value = False
+        self.pool.health_check()
+        self.assertEqual(self.playwright.chromium.launch.call_count, 3)
+        self.assertTrue(all(b['healthy'] for b in self.pool.stats()))
+
+    def test_close_stops_playwright(self):
+        self.pool.close()
+        self.playwright.stop.assert_called_once()
+
+class EncryptedSessionStoreTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.store = EncryptedSessionStore(self.user, BotJob.PORTAL_POSADAS, ttl_minutes=30)
+        self.state = {'cookies': [{'name': 'PHPSESSID', 'value': 'secreto'}], 'origins': []}
+
+    def test_save_and_load_roundtrip_encrypted(self):
+        self.store.save(self.state)
+        session = PortalSession.objects.get(user=self.user)
+        self.assertNotIn(b'secreto', bytes(session.storage_state))
+        self.assertEqual(self.store.load(), self.state)
+
+    def test_expired_session_is_discarded(self):
+        self.store.save(self.state)
+        PortalSession.objects.filter(user=self.user).update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertIsNone(self.store.load())
+        self.assertFalse(PortalSession.objects.exists())
+
+    def test_clear(self):
+        self.store.save(self.state)
+        self.store.clear()
+        self.assertIsNone(self.store.load())
+
+class MunibotSessionReuseTest(TestCase):
+    def _page(self, url):
+        page = MagicMock()
+        page.url = url
+        return page
+
+    def test_saved_session_skips_login(self):
+        page = self._page(munibot.URL_RELACIONES)
+        store = MagicMock()
+        output = []
+        munibot._presentar_ddjj(page, 'u', 'p', '10.00', output, store, sesion_guardada=True)
+        self.assertNotIn(call(munibot.URL_LOGIN, timeout=ANY), page.goto.call_args_list)
+        store.clear.assert_not_called()
+        store.save.assert_not_called()
+
+    def test_rejected_session_falls_back_to_login(self):
+        page = self._page(munibot.URL_LOGIN)
+        urls = iter([munibot.URL_LOGIN, munibot.URL_RELACIONES])
+        type(page).url = property(lambda self: next(urls, munibot.URL_SECCION_DDJJ))
+        store = MagicMock()
+        munibot._presentar_ddjj(page, 'u', 'p', '10.00', [], store, sesion_guardada=True)
+        store.clear.assert_called_once()
+        self.assertIn(call(munibot.URL_LOGIN, timeout=ANY), page.goto.call_args_list)
+        store.save.assert_called_once_with(page.context.storage_state.return_value)
+
+    def test_ddjj_option_matches_the_period(self):
+        opciones = ['Seleccione...', 'DDJJ Marzo 2026', 'DDJJ 2026-02', 'Declaración 01/2026']
+        self.assertEqual(munibot._opcion_del_periodo(opciones, '2026-03'), 1)
+        self.assertEqual(munibot._opcion_del_periodo(opciones, '2026-02'), 2)
+        self.assertEqual(munibot._opcion_del_periodo(opciones, '2026-01'), 3)
+        self.assertEqual(munibot._opcion_del_periodo(['Seleccione...', 'Setiembre de 2025'], '2025-09'), 1)
+        with self.assertRaisesMessage(PasoFatal, 'no ofrece una declaración jurada para el período 2025-12'):
+            munibot._opcion_del_periodo(opciones, '2025-12')
+
+    def test_unlabelled_option_is_only_used_for_the_default_period(self):
+        opciones = ['Seleccione...', 'Declaración Jurada Mensual']
+        self.assertEqual(munibot._opcion_del_periodo(opciones, None), 1)
+        self.assertEqual(munibot._opcion_del_periodo(opciones, munibot._periodo_por_defecto()), 1)
+        with self.assertRaises(PasoFatal):
+            munibot._opcion_del_periodo(opciones, '2020-01')
+
+    def test_unavailable_period_fails_without_selecting(self):
+        page = self._page(munibot.URL_RELACIONES)
+        page.locator.return_value.locator.return_value.all_inner_texts.return_value = ['Seleccione...', 'DDJJ 08/2025']
+        output = []
+        with self.assertRaises(PasoFatal):
+            munibot._presentar_ddjj(page, 'u', 'p', '10.00', output, MagicMock(), sesion_guardada=True, periodo='2025-07')
+        page.select_option.assert_not_called()
+        self.assertNotIn('Declaración presentada con éxito.', output)
+
+class MedidorPasosTest(TestCase):
+    def test_records_each_step_with_its_budget(self):
+        medidor = MedidorPasos({'menu_lateral': 5000}, timeout_por_defecto=1000)
+        with medidor.paso('menu_lateral') as timeout:
+            self.assertEqual(timeout, 5000)
+        with medidor.paso('otro') as timeout:
+            self.assertEqual(timeout, 1000)
+        self.assertEqual([nombre for nombre, _, _ in medidor.tiempos], ['menu_lateral', 'otro'])
+        self.assertIn('menu_lateral', medidor.resumen())
+
+    def test_failed_step_is_recorded_and_reraised(self):
+        medidor = MedidorPasos()
+        with self.assertRaises(TimeoutError):
+            with medidor.paso('guardar'):
+                raise TimeoutError('timeout')
+        self.assertEqual(medidor.tiempos[0][2], 'error')
+        self.assertIn('(ERROR)', medidor.resumen())
+
+class MotorPasosTest(TestCase):
+    def _paso(self, nombre, fallas=0, error=TimeoutError, **kwargs):
+        """Paso que falla las primeras `fallas` veces y registra cada ejecución en estado['log']."""
+        pendientes = [fallas]
+        def funcion(estado, timeout):
+            estado['log'].append(nombre)
+            if pendientes[0] > 0:
+                pendientes[0] -= 1
+                raise error(f'{nombre} falló')
+        return Paso(nombre, funcion, **kwargs)
+
+    def _motor(self, pasos, **kwargs):
+        return MotorPasos(pasos, espera_reintento=0, **kwargs)
+
+    def test_retries_only_the_failed_step(self):
+        estado = self._motor([self._paso('login'), self._paso('descarga', fallas=1)]).ejecutar({'log': []})
+        self.assertEqual(estado['log'], ['login', 'descarga', 'descarga'])
+
+    def test_resumes_from_last_checkpoint_without_login(self):
+        preparar = MagicMock()
+        pasos = [
+            self._paso('login'),
+            self._paso('menu', punto_control=True, preparar=preparar),
+            self._paso('guardar', fallas=2),
+        ]
+        motor = self._motor(pasos)
+        estado = motor.ejecutar({'log': []})
+        self.assertEqual(estado['log'], ['login', 'menu', 'guardar', 'guardar', 'menu', 'guardar'])
+        preparar.assert_called_once()
+        self.assertIn("Reanudando desde 'menu'", '\n'.join(motor.output_messages))
+
+    def test_gives_up_after_resume_budget(self):
+        motor = self._motor([self._paso('menu', punto_control=True), self._paso('guardar', fallas=10, reintentos=0)])
+        with self.assertRaises(TimeoutError):
+            motor.ejecutar({'log': []})
+        self.assertEqual(motor.completados, ['menu', 'menu'])
+
+    def test_fatal_error_is_not_retried(self):
+        estado = {'log': []}
+        motor = self._motor([self._paso('menu', punto_control=True), self._paso('login', fallas=1, error=PasoFatal)])
+        with self.assertRaises(PasoFatal):
+            motor.ejecutar(estado)
+        self.assertEqual(estado['log'], ['menu', 'login'])
+
+    def test_async_engine_resumes_from_checkpoint(self):
+        pendientes = [1]
+        async def menu(estado, timeout):
+            estado['log'].append('menu')
+        async def guardar(estado, timeout):
+            estado['log'].append('guardar')
+            if pendientes[0]:
+                pendientes[0] -= 1
+                raise TimeoutError('guardar falló')
+        motor = self._motor([Paso('menu', menu, punto_control=True), Paso('guardar', guardar, reintentos=0)])
+        estado = asyncio.run(motor.ejecutar_async({'log': []}))
+        self.assertEqual(estado['log'], ['menu', 'guardar', 'menu', 'guardar'])
+
+class PaginaFalsa:
+    """
+    Página de Playwright falsa que anota cada acción como (ruta, args, kwargs). Con
+    `asincrona=True` las acciones devuelven corrutinas, como en `playwright.async_api`.
+    """
+    SINCRONICOS = {'locator', 'get_by_text', 'expect_download', 'expect_popup'}
+    OPCIONES_DDJJ = ['Seleccione...', 'Declaración Jurada Mensual 08/2025', 'Declaración Jurada Mensual 09/2025']
+
+    def __init__(self, asincrona, url='', llamadas=None, ruta=''):
+        self.asincrona = asincrona
+        self.url = url
+        self.llamadas = [] if llamadas is None else llamadas
+        self.ruta = ruta
+
+    def _hijo(self, ruta):
+        return PaginaFalsa(self.asincrona, self.url, self.llamadas, ruta)
+
+    def __getattr__(self, nombre):
+        return self._hijo(f'{self.ruta}.{nombre}' if self.ruta else nombre)
+
+    def __call__(self, *args, **kwargs):
+        if self.ruta.rsplit('.', 1)[-1] in self.SINCRONICOS:
+            return self._hijo(f'{self.ruta}({args!r}, {kwargs!r})')
+        self.llamadas.append((self.ruta, args, kwargs))
+        if self.ruta.endswith('count'):
+            resultado = 1
+        elif self.ruta.endswith('all_inner_texts'):
+            resultado = list(self.OPCIONES_DDJJ)
+        else:
+            resultado = self._hijo(f'{self.ruta}()')
+        if not self.asincrona:
+            return resultado
+        async def _valor():
+            return resultado
+        return _valor()
+
+    def __enter__(self):
+        return SimpleNamespace(value=self._hijo(f'{self.ruta}.value'))
+
+    def __exit__(self, *exc):
+        return False
+
+    async def __aenter__(self):
+        async def _valor():
+            return self._hijo(f'{self.ruta}.value')
+        return SimpleNamespace(value=_valor())
+
+    async def __aexit__(self, *exc):
+        return False
+
+class FlujosSyncAsyncTest(TestCase):
+    """Los flujos sync y async salen de los mismos pasos: mismas acciones y mismos mensajes."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+
+    def _rentabot(self, asincrona):
+        page, output = PaginaFalsa(asincrona), []
+        estado = rentabot._estado_inicial(page, output, '20-1', 'secret', MagicMock(), False, self.tmpdir, False, '1000.00',
+                                          periodo='2025-09')
+        motor = MotorPasos(rentabot.PASOS_RENTABOT_ASYNC if asincrona else rentabot.PASOS_RENTABOT,
+                           output_messages=output)
+        with patch('rentabot.procesar_excel_rentas', return_value={'PERCEPCIÓN': 1.0, 'RETENCIÓN': 2.0}):
+            if asincrona:
+                asyncio.run(motor.ejecutar_async(estado))
+            else:
+                motor.ejecutar(estado)
+        return page.llamadas, output
+
+    def _munibot(self, asincrona):
+        page, output, store = PaginaFalsa(asincrona, url=munibot.URL_SECCION_DDJJ), [], MagicMock()
+        estado = munibot._estado_inicial(page, 'u', 'p', '10.00', output, store, False, '2025-09')
+        motor = MotorPasos(munibot.PASOS_MUNIBOT_ASYNC if asincrona else munibot.PASOS_MUNIBOT, output_messages=output)
+        if asincrona:
+            asyncio.run(motor.ejecutar_async(estado))
+        else:
+            motor.ejecutar(estado)
+        store.save.assert_called_once()
+        return page.llamadas, output
+
+    def test_rentabot_async_runs_the_same_steps(self):
+        llamadas, output = self._rentabot(asincrona=False)
+        self.assertEqual(self._rentabot(asincrona=True), (llamadas, output))
+        self.assertIn(('fill', ('#periodo_desde', '2025/09'), {}), llamadas)
+        self.assertIn(('select_option', ('#mes_pos_fiscal', '09'), {}), llamadas)
+        self.assertIn(("expect_download((), {'timeout': 10000}).value.save_as",
+                       (os.path.join(self.tmpdir, 'Rentas_2025-09.xlsx'),), {}), llamadas)
+        self.assertIn("Clic en 'Guardar'...", output)
+
+    def test_munibot_async_runs_the_same_steps(self):
+        llamadas, output = self._munibot(asincrona=False)
+        self.assertEqual(self._munibot(asincrona=True), (llamadas, output))
+        self.assertIn(('goto', (munibot.URL_LOGIN,), {'timeout': 10000}), llamadas)
+        self.assertTrue(all(kwargs.get('timeout') == 10000 for ruta, _, kwargs in llamadas
+                            if ruta in ('goto', 'wait_for_load_state')))
+        self.assertIn(('select_option', (munibot.DROPDOWN_DDJJ,), {'index': 2}), llamadas)
+        self.assertIn('Período a declarar: 2025-09', output)
+
+    def test_errors_are_raised_inside_the_step(self):
+        def paso():
+            try:
+                yield MagicMock(side_effect=TimeoutError('lento'))()
+            except TimeoutError:
+                return 'sin efecto'
+        self.assertEqual(correr(paso()), 'sin efecto')
+
+class AsyncRunnerTest(TestCase):
+    def test_semaphore_limits_concurrency_per_portal(self):
+        en_curso = {'posadas': 0, 'misiones': 0}
+        maximo = {'posadas': 0, 'misiones': 0}
+
+        def flujo(portal):
+            async def _flujo(browser, **kwargs):
+                en_curso[portal] += 1
+                maximo[portal] = max(maximo[portal], en_curso[portal])
+                await asyncio.sleep(0.01)
+                en_curso[portal] -= 1
+                return 'Success', kwargs['n'], ''
+            return _flujo
+
+        filings = [{'key': i, 'portal': 'posadas' if i % 2 else 'misiones', 'kwargs': {'n': i}} for i in range(10)]
+        with patch.dict(async_runner.FLUJOS, {'posadas': flujo('posadas'), 'misiones': flujo('misiones')}):
+            resultados = asyncio.run(async_runner.run_filings(filings, concurrencia={'posadas': 3, 'misiones': 1}, browser=MagicMock()))
+
+        self.assertEqual(maximo, {'posadas': 3, 'misiones': 1})
+        self.assertEqual(resultados[4], ('Success', 4, ''))
+        self.assertEqual(len(resultados), 10)
+
+    def test_failed_filing_does_not_stop_the_others(self):
+        async def falla(browser, **kwargs):
+            raise RuntimeError('portal caído')
+
+        async def anda(browser, **kwargs):
+            return 'Success', 'ok', ''
+
+        filings = [{'key': 'a', 'portal': 'posadas', 'kwargs': {}}, {'key': 'b', 'portal': 'misiones', 'kwargs': {}}]
+        with patch.dict(async_runner.FLUJOS, {'posadas': falla, 'misiones': anda}):
+            resultados = asyncio.run(async_runner.run_filings(filings, browser=MagicMock()))
+        self.assertEqual(resultados['a'][0], 'Failed')
+        self.assertIn('portal caído', resultados['a'][2])
+        self.assertEqual(resultados['b'][0], 'Success')
+
+    def test_misiones_filings_lease_cdp_browsers(self):
+        navegadores = []
+
+        async def flujo(browser, **kwargs):
+            navegadores.append(browser)
+            return 'Success', '', ''
+
+        navegador_cdp = MagicMock(close=AsyncMock())
+        playwright = MagicMock()
+        playwright.chromium.connect_over_cdp = AsyncMock(return_value=navegador_cdp)
+        playwright.chromium.launch = AsyncMock(return_value=MagicMock(close=AsyncMock()))
+        async_playwright = MagicMock()
+        async_playwright.return_value.__aenter__ = AsyncMock(return_value=playwright)
+        async_playwright.return_value.__aexit__ = AsyncMock(return_value=False)
+        launcher = MagicMock()
+        launcher.lease_async.return_value.__aenter__ = AsyncMock(return_value='http://127.0.0.1:9333')
+        launcher.lease_async.return_value.__aexit__ = AsyncMock(return_value=False)
+        compartido = MagicMock()
+
+        filings = [{'key': 'm', 'portal': 'misiones', 'kwargs': {}}, {'key': 'p', 'portal': 'posadas', 'kwargs': {}}]
+        with patch.dict(async_runner.FLUJOS, {'posadas': flujo, 'misiones': flujo}), \
+                patch('async_runner.async_playwright', async_playwright):
+            asyncio.run(async_runner.run_filings(filings, browser=compartido, cdp_launcher=launcher))
+            playwright.chromium.connect_over_cdp.assert_awaited_once_with('http://127.0.0.1:9333')
+            self.assertCountEqual(navegadores, [navegador_cdp, compartido])
+            navegador_cdp.close.assert_awaited_once()
+            launcher.lease_async.return_value.__aexit__.assert_awaited_once()
+            launcher.lease.assert_not_called()
+
+            # Solo presentaciones de Misiones: no se lanza el navegador compartido
+            asyncio.run(async_runner.run_filings(filings[:1], cdp_launcher=launcher))
+            playwright.chromium.launch.assert_not_called()
+            asyncio.run(async_runner.run_filings(filings[1:], cdp_launcher=launcher))
+            playwright.chromium.launch.assert_awaited_once()
+
+class ProcessJobsConcurrentlyTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        MunicipalCredentials.objects.create(
+            user=self.user,
+            municipal_username='test_municipal_user',
+            municipal_password=f.encrypt(b'secret')
+        )
+
+    @patch('async_runner.run_filings_sync')
+    def test_jobs_run_together_and_write_history(self, mock_run_filings):
+        enqueue_job(self.user, BotJob.PORTAL_POSADAS, '10.00')
+        enqueue_job(self.user, BotJob.PORTAL_POSADAS, '20.00')
+        enqueue_job(self.user, BotJob.PORTAL_MISIONES, '30.00') # Sin credenciales de Misiones
+        jobs = claim_jobs(5)
+        mock_run_filings.side_effect = lambda filings, concurrencia=None, cdp_launcher=None: {
+            filing['key']: ('Success', 'ok', None) for filing in filings
+        }
+
+        process_jobs_concurrently(jobs)
+
+        filings = mock_run_filings.call_args[0][0]
+        self.assertEqual(len(filings), 2)
+        self.assertEqual(filings[0]['kwargs']['municipal_password'], 'secret')
+        self.assertEqual(ExecutionHistory.objects.filter(status='Success').count(), 2)
+        misiones_job = BotJob.objects.get(portal=BotJob.PORTAL_MISIONES)
+        self.assertEqual(misiones_job.result, 'Failed')
+        self.assertEqual(misiones_job.error, 'Credenciales de Renta Misiones no encontradas.')
+        self.assertFalse(BotJob.objects.exclude(status=BotJob.STATUS_DONE).exists())
+
+FAKE_CDP_BROWSER = '''#!{python}
+import sys
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+puerto = int(next(a for a in sys.argv if a.startswith("--remote-debugging-port=")).split("=")[1])
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b'{{"Browser": "Fake"}}')
+
+    def log_message(self, *args):
+        pass
+
+HTTPServer(("127.0.0.1", puerto), Handler).serve_forever()
+'''
+
+class CDPLauncherTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.executable = os.path.join(self.tmpdir, 'fake_browser')
+        with open(self.executable, 'w') as script:
+            script.write(FAKE_CDP_BROWSER.format(python=sys.executable))
+        os.chmod(self.executable, 0o755)
+        self.launcher = CDPLauncher(cantidad=2, ejecutable=self.executable, timeout_arranque=10).start()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+        self.addCleanup(self.launcher.stop)
+
+    def test_each_browser_gets_its_own_port(self):
+        endpoints = self.launcher.endpoints()
+        self.assertEqual(len(set(endpoints)), 2)
+        for endpoint in endpoints:
+            with urllib.request.urlopen(f'{endpoint}/json/version', timeout=2) as response:
+                self.assertEqual(response.status, 200)
+
+    def test_leases_use_different_browsers(self):
+        with self.launcher.lease() as primero, self.launcher.lease() as segundo:
+            self.assertNotEqual(primero, segundo)
+
+    def test_async_lease_relaunches_off_the_event_loop(self):
+        self.launcher._navegadores[0].proceso.kill()
+        self.launcher._navegadores[0].proceso.wait()
+
+        async def tomar():
+            with patch('cdp_launcher.asyncio.to_thread', wraps=asyncio.to_thread) as to_thread:
+                async with self.launcher.lease_async() as primero, self.launcher.lease_async() as segundo:
+                    self.assertNotEqual(primero, segundo)
+            return to_thread.call_count
+        self.assertEqual(asyncio.run(tomar()), 4)
+        self.assertTrue(all(n.vivo() and n.en_uso == 0 for n in self.launcher._navegadores))
+
+    def test_dead_browser_is_relaunched_on_lease(self):
+        navegador = self.launcher._navegadores[0]
+        navegador.proceso.kill()
+        navegador.proceso.wait()
+        with self.launcher.lease():
+            pass
+        self.assertTrue(all(n.vivo() for n in self.launcher._navegadores))
+        self.assertEqual(self.launcher._navegadores[0].puerto, navegador.puerto)
+
+    def test_failed_rentabot_run_closes_its_context(self):
+        playwright = MagicMock()
+        navegador = playwright.chromium.connect_over_cdp.return_value
+        with patch('rentabot.sync_playwright') as sync_playwright, \
+                patch('rentabot.MotorPasos') as motor:
+            sync_playwright.return_value.__enter__.return_value = playwright
+            motor.return_value.ejecutar.side_effect = PasoFatal('login rechazado')
+            status, _, error = rentabot.run_rentabot(None, cdp_endpoint='http://127.0.0.1:9333', misiones_username='20-1',
+                                                     misiones_password='secret', directorio_descargas=self.tmpdir,
+                                                     politica_red=False)
+        self.assertEqual(status, 'Failed')
+        self.assertIn('login rechazado', error)
+        navegador.new_context.return_value.close.assert_called_once()
+        navegador.close.assert_called_once()
+
+class PoliticaRedTest(TestCase):
+    def setUp(self):
+        self.politica = PoliticaRed(('sistema.posadas.gov.ar',))
+
+    def _route(self, url, resource_type):
+        route = MagicMock()
+        route.request.url = url
+        route.request.resource_type = resource_type
+        return route
+
+    def test_blocks_heavy_types_and_third_parties(self):
+        self.assertEqual(self.politica.motivo_bloqueo('https://sistema.posadas.gov.ar/logo.png', 'image'), 'tipo')
+        self.assertEqual(self.politica.motivo_bloqueo('https://www.google-analytics.com/ga.js', 'script'), 'tercero')
+        self.assertIsNone(self.politica.motivo_bloqueo('https://sistema.posadas.gov.ar/app.js', 'script'))
+        self.assertIsNone(self.politica.motivo_bloqueo('https://code.jquery.com/jquery.min.js', 'script'))
+        self.assertIsNone(self.politica.motivo_bloqueo('https://otro.gov.ar/', 'document'))
+
+    @patch('municipal_app.jobs.run_munibot', return_value=('Success', 'ok', None))
+    def test_worker_settings_disable_or_widen_the_filter(self, mock_run_munibot):
+        user = User.objects.create_user(username='contribuyente', password='x')
+        MunicipalCredentials.objects.create(user=user, municipal_username='muni', municipal_password=f.encrypt(b'clave'))
+        with override_settings(BOT_FILTRO_RED=False):
+            process_job(claim_job(enqueue_job(user, BotJob.PORTAL_POSADAS, '1').pk))
+        self.assertIs(mock_run_munibot.call_args.kwargs['politica_red'], False)
+
+        with override_settings(BOT_FILTRO_RED_HOSTS_EXTRA=['cdn.posadas.example']):
+            process_job(claim_job(enqueue_job(user, BotJob.PORTAL_POSADAS, '1').pk))
+        politica = mock_run_munibot.call_args.kwargs['politica_red']
+        self.assertIsNone(politica.motivo_bloqueo('https://cdn.posadas.example/app.js', 'script'))
+        self.assertEqual(politica.motivo_bloqueo('https://sistema.posadas.gov.ar/logo.png', 'image'), 'tipo')
+        self.assertEqual(politica.motivo_bloqueo('https://www.google-analytics.com/ga.js', 'script'), 'tercero')
+
+    def test_filter_aborts_and_counts(self):
+        target = MagicMock()
+        filtro = self.politica.instalar(target)
+        handler = target.route.call_args[0][1]
+        imagen = self._route('https://sistema.posadas.gov.ar/logo.png', 'image')
+        script = self._route('https://sistema.posadas.gov.ar/app.js', 'script')
+        handler(imagen)
+        handler(script)
+        imagen.abort.assert_called_once()
+        script.continue_.assert_called_once()
+        self.assertEqual(filtro.total_bloqueadas, 1)
+        self.assertEqual(filtro.permitidas, 1)
+        self.assertIn('image=1', filtro.resumen())
+        self.assertIn('~29 KB estimados', filtro.resumen())
+
+XLSX_FALSO = b'PK\x03\x04' + b'0' * 200_000
+
+class ExportRentasHandler(BaseHTTPRequestHandler):
+    """Imita consultas_ret_perc.php: entrega el Excel solo con la cookie de sesión."""
+
+    def do_POST(self):
+        cuerpo = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+        self.server.recibidos.append((self.path, cuerpo, self.headers.get('Cookie')))
+        self.send_response(200)
+        self.end_headers()
+        if self.headers.get('Cookie') == 'PHPSESSID=abc':
+            self.wfile.write(XLSX_FALSO)
+        else:
+            self.wfile.write(b'<html><form><input type="password"></form></html>')
+
+    def log_message(self, *args):
+        pass
+
+class DescargaHttpRentasTest(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ExportRentasHandler)
+        self.server.recibidos = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+        self.destino = os.path.join(self.tmpdir, 'Rentas_2025-09.xlsx')
+        self.formulario = {
+            'action': f'http://127.0.0.1:{self.server.server_port}/consultas_ret_perc.php?x=1',
+            'method': 'POST',
+            'enctype': 'application/x-www-form-urlencoded',
+            'campos': [['periodo_desde', '2025/09'], ['periodo_hasta', '2025/09'], ['btn_excel', '']],
+        }
+
+    def _page(self, cookies):
+        page = MagicMock()
+        page.evaluate.side_effect = lambda script, *args: self.formulario if args else 'UA de prueba'
+        page.context.cookies.return_value = cookies
+        page.url = 'https://atm.misiones.gob.ar/consultas_ret_perc.php'
+        return page
+
+    def test_streams_spreadsheet_with_browser_cookies(self):
+        output = []
+        archivo = correr(rentabot._descargar_excel_http(self._page([{'name': 'PHPSESSID', 'value': 'abc'}]),
+                                                        self.destino, 10000, output))
+        self.assertEqual(archivo, self.destino)
+        with open(archivo, 'rb') as f:
+            self.assertEqual(f.read(), XLSX_FALSO)
+        path, cuerpo, cookie = self.server.recibidos[0]
+        self.assertEqual(path, '/consultas_ret_perc.php?x=1')
+        self.assertIn('periodo_desde=2025%2F09', cuerpo)
+        self.assertEqual(cookie, 'PHPSESSID=abc')
+
+    def test_non_spreadsheet_response_falls_back(self):
+        output = []
+        archivo = correr(rentabot._descargar_excel_http(self._page([]), self.destino, 10000, output))
+        self.assertIsNone(archivo)
+        self.assertEqual(os.listdir(self.tmpdir), [])
+        self.assertIn('Usando', output[-1])
+
+    def test_button_without_form_falls_back(self):
+        self.formulario = None
+        page = self._page([])
+        self.assertIsNone(correr(rentabot._descargar_excel_http(page, self.destino, 10000, [])))
+        self.assertEqual(self.server.recibidos, [])
+
+class FilePeriodCommandTest(TestCase):
+    def setUp(self):
+        self.users = []
+        for i in range(4):
+            user = User.objects.create_user(username=f'contribuyente{i}', password='x')
+            MunicipalCredentials.objects.create(
+                user=user,
+                municipal_username=f'muni{i}',
+                municipal_password=f.encrypt(b'clave'),
+            )
+            self.users.append(user)
+
+    def _job(self, user, status, result=''):
+        return BotJob.objects.create(user=user, portal=BotJob.PORTAL_POSADAS, period='2025-09', status=status, result=result)
+
+    def test_plan_uses_jobs_as_checkpoints(self):
+        self._job(self.users[0], BotJob.STATUS_DONE, 'Success')
+        interrumpido = self._job(self.users[1], BotJob.STATUS_RUNNING)
+        self._job(self.users[2], BotJob.STATUS_DONE, 'Failed')
+        plan = planificar_periodo(BotJob.PORTAL_POSADAS, '2025-09', {'contribuyente3': Decimal('99.50')})
+        self.assertEqual(plan['presentados'], 1)
+        self.assertEqual(plan['interrumpidos'], [interrumpido.pk])
+        pendientes = BotJob.objects.filter(pk__in=plan['pendientes'])
+        self.assertEqual(sorted(job.user.username for job in pendientes), ['contribuyente2', 'contribuyente3'])
+        self.assertEqual(pendientes.get(user=self.users[3]).amount, Decimal('99.50'))
+
+    @patch('municipal_app.bulk_filing.BrowserPool')
+    @patch('municipal_app.jobs.run_munibot')
+    def test_rerun_does_not_file_twice(self, mock_run_munibot, mock_pool):
+        mock_run_munibot.return_value = ('Success', 'ok', None)
+        salida = StringIO()
+        call_command('file_period', portal='posadas', period='2025-09', processes=1, stdout=salida)
+        self.assertEqual(mock_run_munibot.call_count, 4)
+        self.assertIn('presentaciones por minuto', salida.getvalue())
+        self.assertIn('p95', salida.getvalue())
+
+        salida = StringIO()
+        call_command('file_period', portal='posadas', period='2025-09', processes=1, stdout=salida)
+        self.assertEqual(mock_run_munibot.call_count, 4)
+        self.assertIn('0 pendiente(s), 4 ya presentado(s)', salida.getvalue())
+
+    def test_jobs_failed_by_the_stale_sweep_are_not_refiled(self):
+        perdido = BotJob.objects.create(user=self.users[0], portal=BotJob.PORTAL_POSADAS, period='2025-09',
+                                        status=BotJob.STATUS_DONE, result='Failed', error=ERROR_INTERRUMPIDO)
+        plan = planificar_periodo(BotJob.PORTAL_POSADAS, '2025-09')
+        self.assertEqual(plan['interrumpidos'], [perdido.pk])
+        self.assertFalse(BotJob.objects.filter(pk__in=plan['pendientes'], user=self.users[0]).exists())
+
+        plan = planificar_periodo(BotJob.PORTAL_POSADAS, '2025-09', reintentar_interrumpidos=True)
+        self.assertEqual(plan['interrumpidos'], [])
+        self.assertTrue(BotJob.objects.filter(pk__in=plan['pendientes'], user=self.users[0]).exists())
+
+    @patch('municipal_app.bulk_filing.CDPLauncher')
+    @patch('municipal_app.bulk_filing.BrowserPool')
+    def test_batches_use_defaults_without_bot_settings(self, mock_pool, mock_launcher):
+        with self.settings():
+            del settings.BOT_BROWSER_POOL_SIZE, settings.BOT_BROWSER_MAX_CONTEXTS, settings.BOT_CDP_BROWSERS
+            self.assertEqual(procesar_lote([], BotJob.PORTAL_POSADAS), [])
+            self.assertEqual(procesar_lote([], BotJob.PORTAL_MISIONES), [])
+        mock_pool.assert_called_once_with(size=1, max_contexts=50)
+        mock_launcher.assert_called_once_with(cantidad=1)
+
+    def test_invalid_period_is_rejected(self):
+        with self.assertRaises(CommandError):
+            call_command('file_period', portal='posadas', period='2025-13')
+
+    def test_sharding_and_percentiles(self):
+        self.assertEqual(repartir([1, 2, 3, 4, 5], 2), [[1, 3, 5], [2, 4]])
+        self.assertEqual(repartir([1], 4), [[1]])
+        duraciones = list(range(1, 21))
+        self.assertEqual(percentil(duraciones, 50), 10)
+        self.assertEqual(percentil(duraciones, 95), 19)
+        self.assertIsNone(percentil([], 50))
+
+class RunBotWorkerCommandTest(TestCase):
+    def _jobs(self, cantidad):
+        jobs = []
+        for i in range(cantidad):
+            job = MagicMock(pk=i + 1, portal=BotJob.PORTAL_POSADAS, period='2025-09', result='Success')
+            job.user.username = f'contribuyente{i}'
+            jobs.append(job)
+        return jobs
+
+    @patch('browser_pool.BrowserPool')
+    def test_each_pool_browser_runs_its_own_job(self, mock_pool):
+        cola = iter(self._jobs(4))
+        lock = threading.Lock()
+        juntos = threading.Barrier(2, timeout=5)  # Falla si los dos trabajos no corren a la vez
+        pools = []
+
+        def claim():
+            with lock:
+                return next(cola, None)
+
+        def procesar(job, pool=None, cdp_launcher=None):
+            pools.append(pool)
+            juntos.wait()
+            return job
+
+        with patch('municipal_app.management.commands.run_bot_worker.claim_next_job', side_effect=claim), \
+                patch('municipal_app.management.commands.run_bot_worker.process_job', side_effect=procesar):
+            call_command('run_bot_worker', once=True, pool_size=2, cdp_browsers=0, stdout=StringIO())
+        self.assertEqual(len(pools), 4)
+        self.assertEqual(mock_pool.call_count, 2)
+        mock_pool.assert_called_with(size=1, max_contexts=settings.BOT_BROWSER_MAX_CONTEXTS)
+        self.assertEqual(mock_pool.return_value.start.return_value.close.call_count, 2)
+
+    def test_stale_running_jobs_are_failed_on_start(self):
+        user = User.objects.create_user(username='contribuyente', password='x')
+        ahora = timezone.now()
+        colgado = BotJob.objects.create(user=user, portal=BotJob.PORTAL_POSADAS, period='2025-09',
+                                        status=BotJob.STATUS_RUNNING, started_at=ahora - timedelta(hours=2))
+        en_curso = BotJob.objects.create(user=user, portal=BotJob.PORTAL_POSADAS, period='2025-09',
+                                         status=BotJob.STATUS_RUNNING, started_at=ahora - timedelta(minutes=5))
+        salida = StringIO()
+        call_command('run_bot_worker', once=True, pool_size=0, cdp_browsers=0, stale_minutes=60, stdout=salida)
+        colgado.refresh_from_db()
+        en_curso.refresh_from_db()
+        self.assertEqual((colgado.status, colgado.result, colgado.error), (BotJob.STATUS_DONE, 'Failed', ERROR_INTERRUMPIDO))
+        self.assertEqual(ExecutionHistory.objects.get(user=user).error, ERROR_INTERRUMPIDO)
+        self.assertEqual(en_curso.status, BotJob.STATUS_RUNNING)
+        self.assertIn(f'Job #{colgado.pk}', salida.getvalue())
+
+class RentasExcelTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+
+    def _excel(self, nombre, filas):
+        ruta = os.path.join(self.tmpdir, nombre)
+        pd.DataFrame(filas, columns=['CUIT', 'FECHA', 'ALÍC.', 'COEF.', 'TOTAL']).to_excel(ruta, index=False)
+        return ruta
+
+    def test_classifies_by_column(self):
+        df = pd.DataFrame({'ALÍC.': [3.31, None, None, 3.31], 'COEF.': [None, 1.0, None, 1.0], 'TOTAL': [10.0, 20.0, 5.0, 1.0]})
+        self.assertEqual(list(rentabot.clasificar_tipos(df)), ['PERCEPCIÓN', 'RETENCIÓN', 'OTRO', 'PERCEPCIÓN'])
+        self.assertEqual(rentabot.totales_por_tipo(df), {'PERCEPCIÓN': 11.0, 'RETENCIÓN': 20.0})
+        self.assertIsNone(rentabot.totales_por_tipo(df.iloc[0:0]))
+
+    def test_single_file_totals(self):
+        ruta = self._excel('Rentas_2025-09.xlsx', [['30-1', '10/09/2025', None, 1.0, 808.0], ['30-1', '20/09/2025', None, 1.0, 352.0]])
+        self.assertEqual(rentabot.procesar_excel_rentas(ruta), {'PERCEPCIÓN': 0.0, 'RETENCIÓN': 1160.0})
+
+    def test_totals_per_period_across_files(self):
+        agosto = self._excel('Rentas_2025-08.xlsx', [['30-1', '05/08/2025', 3.31, None, 100.0], ['30-1', None, None, 1.0, 40.0]])
+        septiembre = self._excel('Rentas_2025-09.xlsx', [['30-1', '10/09/2025', None, 1.0, 808.0], ['30-1', '30/08/2025', 3.31, None, 1.0]])
+        self.assertEqual(rentabot.procesar_rentas_periodos([agosto, septiembre]), {
+            '2025-08': {'PERCEPCIÓN': 101.0, 'RETENCIÓN': 40.0},
+            '2025-09': {'PERCEPCIÓN': 0.0, 'RETENCIÓN': 808.0},
+        })
+
+    def test_archive_answers_multi_period_queries(self):
+        archivo = os.path.join(self.tmpdir, 'archivo')
+        agosto = self._excel('Rentas_2025-08.xlsx', [['30-1', '05/08/2025', 3.31, None, 100.0], ['30-1', None, None, 1.0, 40.0]])
+        septiembre = self._excel('Rentas_2025-09.xlsx', [['30-1', '10/09/2025', None, 1.0, 808.0], ['30-1', '30/08/2025', 3.31, None, 1.0]])
+        for ruta in (agosto, septiembre):
+            rentabot.archivar_excel_rentas(ruta, archivo, '20-12345678-9')
+        rentabot.archivar_excel_rentas(septiembre, archivo, 'otro/usuario')
+        # Volver a archivar el mismo período reemplaza la partición
+        rentabot.archivar_excel_rentas(agosto, archivo, '20-12345678-9')
+        os.remove(agosto)
+        os.remove(septiembre)
+
+        self.assertEqual(list(rentas_archive.particiones(archivo, '20-12345678-9')), ['2025-08', '2025-09'])
+        self.assertEqual(rentabot.totales_rentas_archivadas(archivo, '20-12345678-9'), {
+            '2025-08': {'PERCEPCIÓN': 101.0, 'RETENCIÓN': 40.0},
+            '2025-09': {'PERCEPCIÓN': 0.0, 'RETENCIÓN': 808.0},
+        })
+        # El rango se aplica al período de cada línea (su FECHA), no al de la descarga
+        self.assertEqual(rentabot.totales_rentas_archivadas(archivo, '20-12345678-9', desde='2025-09'),
+                         {'2025-09': {'PERCEPCIÓN': 0.0, 'RETENCIÓN': 808.0}})
+        self.assertEqual(rentabot.totales_rentas_archivadas(archivo, '20-12345678-9', hasta='2025-08'),
+                         {'2025-08': {'PERCEPCIÓN': 101.0, 'RETENCIÓN': 40.0}})
+        self.assertEqual(rentabot.totales_rentas_archivadas(archivo, 'sin-datos'), {})
+        lineas = rentas_archive.cargar(archivo, 'otro/usuario', columnas=['CUIT', 'TOTAL'])
+        self.assertEqual(list(lineas.columns), ['CUIT', 'TOTAL', 'PARTICION'])
+        self.assertEqual(len(lineas), 2)
+
+    @patch('rentas_archive.pyarrow', None)
+    def test_archive_requires_pyarrow(self):
+        ruta = self._excel('Rentas_2025-09.xlsx', [['30-1', '10/09/2025', None, 1.0, 808.0]])
+        with self.assertRaisesMessage(ImportError, 'pyarrow'):
+            rentabot.archivar_excel_rentas(ruta, os.path.join(self.tmpdir, 'archivo'), 7)
+        with self.assertRaisesMessage(ImportError, 'pyarrow'):
+            rentabot.totales_rentas_archivadas(os.path.join(self.tmpdir, 'archivo'), 7)
+
+    def test_step_archives_and_uses_the_same_read(self):
+        archivo = os.path.join(self.tmpdir, 'archivo')
+        ruta = self._excel('Rentas_2025-09.xlsx', [['30-1', '10/09/2025', None, 1.0, 808.0]])
+        estado = {'archivo': ruta, 'directorio_archivo': archivo, 'usuario_archivo': 7, 'misiones_username': '20-1',
+                  'periodo_consulta': '2025/09', 'output': []}
+        with patch('rentabot.procesar_excel_rentas') as releer:
+            self.assertEqual(rentabot._procesar_excel(estado), {'PERCEPCIÓN': 0.0, 'RETENCIÓN': 808.0})
+        releer.assert_not_called()
+        # La partición es la del usuario de Django, no la del CUIT con el que se entra al portal
+        self.assertEqual(list(rentas_archive.particiones(archivo, 7)), ['2025-09'])
+        self.assertEqual(rentas_archive.particiones(archivo, '20-1'), {})
+
+        # Si archivar falla, los totales salen igual del Excel
+        estado['periodo_consulta'] = 'sin período'
+        self.assertEqual(rentabot._procesar_excel(estado), {'PERCEPCIÓN': 0.0, 'RETENCIÓN': 808.0})
+        self.assertIn('No se pudo archivar', estado['output'][-1])
+
+class RentasLineTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='rentas', password='x')
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+
+    def _lineas(self, nombre, filas):
+        ruta = os.path.join(self.tmpdir, nombre)
+        columnas = ['CUIT', 'RAZÓN SOCIAL', 'RÉG', 'FECHA', 'BASE IMP.', 'ALÍC.', 'COEF.', 'TOTAL']
+        pd.DataFrame(filas, columns=columnas).to_excel(ruta, index=False)
+        return rentabot.leer_lineas_rentas(ruta)
+
+    def test_saves_in_batches_and_aggregates_in_the_database(self):
+        septiembre = self._lineas('Rentas_2025-09.xlsx', [
+            ['30-1', 'AGENTE UNO', 26, '10/09/2025', 24410.0, None, 1.0, 808.0],
+            ['30-1', 'AGENTE UNO', 26, '20/09/2025', 10000.0, None, 1.0, 352.5],
+            ['30-2', 'AGENTE DOS', 26, '05/09/2025', 3021.15, 3.31, None, 100.0],
+            ['30-2', 'AGENTE DOS', None, None, None, None, None, 5.0],
+            ['30-3', 'SIN MONTO', 26, '05/09/2025', None, None, 1.0, None],
+        ])
+        agosto = self._lineas('Rentas_2025-08.xlsx', [['30-1', 'AGENTE UNO', 26, '05/08/2025', 1000.0, None, 1.0, 40.0]])
+
+        with patch.object(RentasLine.objects, 'bulk_create', wraps=RentasLine.objects.bulk_create) as bulk_create:
+            self.assertEqual(guardar_lineas(self.user, septiembre, '2025-09', tamanio_lote=2), 4)
+        self.assertEqual([len(llamada.args[0]) for llamada in bulk_create.call_args_list], [2, 2])
+        guardar_lineas(self.user, agosto, '2025-08')
+
+        linea = RentasLine.objects.get(user=self.user, period='2025-09', agent_cuit='30-2', line_type=RentasLine.TYPE_PERCEPCION)
+        self.assertEqual((linea.line_date.isoformat(), linea.regime, linea.rate, linea.total), ('2025-09-05', '26', Decimal('3.3100'), Decimal('100.00')))
+        self.assertEqual(totales_por_periodo(self.user), {
+            '2025-08': {'PERCEPCIÓN': Decimal('0.00'), 'RETENCIÓN': Decimal('40.00')},
+            '2025-09': {'PERCEPCIÓN': Decimal('100.00'), 'RETENCIÓN': Decimal('1160.50')},
+        })
+        self.assertEqual(list(totales_por_periodo(self.user, desde='2025-09')), ['2025-09'])
+        self.assertEqual(totales_por_periodo(User.objects.create_user(username='otro', password='x')), {})
+        self.assertEqual([(fila['agent_cuit'], fila['line_type'], fila['total'], fila['lineas']) for fila in totales_por_agente(self.user, '2025-09')],
+                         [('30-1', 'RETENCIÓN', Decimal('1160.50'), 2), ('30-2', 'PERCEPCIÓN', Decimal('100.00'), 1), ('30-2', 'OTRO', Decimal('5.00'), 1)])
+
+        # Volver a guardar el período reemplaza las líneas, no las duplica
+        guardar_lineas(self.user, septiembre.iloc[:1], '2025-09')
+        self.assertEqual(totales_por_periodo(self.user, desde='2025-09')['2025-09']['RETENCIÓN'], Decimal('808.00'))
+        self.assertEqual(RentasLine.objects.filter(user=self.user, period='2025-09').count(), 1)
+
+    def test_step_hands_the_same_read_to_al_procesar(self):
+        ruta = os.path.join(self.tmpdir, 'Rentas_2025-09.xlsx')
+        pd.DataFrame([['30-1', '10/09/2025', None, 1.0, 808.0]], columns=['CUIT', 'FECHA', 'ALÍC.', 'COEF.', 'TOTAL']).to_excel(ruta, index=False)
+        al_procesar = MagicMock(side_effect=lambda df, periodo: guardar_lineas(self.user, df, periodo))
+        estado = {'archivo': ruta, 'directorio_archivo': None, 'al_procesar': al_procesar, 'misiones_username': '20-1',
+                  'periodo_consulta': '2025/09', 'output': []}
+        with patch('rentabot.procesar_excel_rentas') as releer:
+            self.assertEqual(rentabot._procesar_excel(estado), {'PERCEPCIÓN': 0.0, 'RETENCIÓN': 808.0})
+        releer.assert_not_called()
+        self.assertEqual(al_procesar.call_args.args[1], '2025-09')
+        self.assertEqual(totales_por_periodo(self.user), {'2025-09': {'PERCEPCIÓN': Decimal('0.00'), 'RETENCIÓN': Decimal('808.00')}})
+
+        # Si guardar las líneas falla, los totales se declaran igual
+        al_procesar.side_effect = ValueError('base bloqueada')
+        self.assertEqual(rentabot._procesar_excel(estado), {'PERCEPCIÓN': 0.0, 'RETENCIÓN': 808.0})
+        self.assertIn('No se pudieron guardar las líneas de Rentas: base bloqueada', estado['output'][-1])
+
+    def test_rentas_totals_command(self):
+        guardar_lineas(self.user, self._lineas('Rentas_2025-09.xlsx', [['30-1', 'AGENTE UNO', 26, '10/09/2025', 1.0, None, 1.0, 808.0]]), '2025-09')
+        salida = StringIO()
+        call_command('rentas_totals', '--user', 'rentas', stdout=salida)
+        self.assertIn('2025-09  PERCEPCIÓN: 0.00  RETENCIÓN: 808.00', salida.getvalue())
+        salida = StringIO()
+        call_command('rentas_totals', '--user', 'rentas', '--by-agent', '2025-09', stdout=salida)
+        self.assertIn('AGENTE UNO', salida.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('rentas_totals', '--user', 'rentas', '--from', '2025/09')
+
+class CacheEmbeddingsTest(TestCase):
+    def setUp(self):
+        self.ahora = 0.0
+        self.cache = CacheEmbeddings(2, 60, reloj=lambda: self.ahora)
+
+    def test_normalizes_question(self):
+        self.assertEqual(normalizar_pregunta('  ¿Cuándo vence   IIBB? '), 'cuando vence iibb')
+
+    def test_lru_ttl_and_counters(self):
+        calcular = MagicMock(side_effect=lambda: [1.0, 2.0])
+        vector = self.cache.obtener_o_calcular('¿Qué es una percepción?', calcular)
+        self.assertEqual(vector.dtype, 'float32')
+        self.assertFalse(vector.flags.writeable)
+        self.cache.obtener_o_calcular('que es una percepcion', calcular)
+        self.assertEqual(calcular.call_count, 1)
+
+        self.cache.obtener_o_calcular('b', calcular)
+        self.cache.obtener_o_calcular('que es una percepcion', calcular)  # pasa a ser la más usada
+        self.cache.obtener_o_calcular('c', calcular)  # descarta 'b'
+        self.assertIsNone(self.cache.obtener('b'))
+        self.assertIsNotNone(self.cache.obtener('c'))
+
+        self.ahora = 61
+        self.assertIsNone(self.cache.obtener('c'))
+        self.assertEqual(self.cache.estadisticas(), {'entradas': 1, 'aciertos': 3, 'fallos': 5, 'tasa_aciertos': 3 / 8})
+
+    def test_buscar_contexto_reuses_the_question_embedding(self):
+        from . import chatbot_rag
+        indice = faiss.IndexFlatL2(2)
+        indice.add(np.array([[1.0, 0.0], [0.0, 1.0]], dtype='float32'))
+        cache = CacheEmbeddings(10, 60)
+        with patch.object(chatbot_rag, '_cached_index', indice), \
+                patch.object(chatbot_rag, '_cached_texts', ['vencimientos', 'percepciones']), \
+                patch.object(chatbot_rag, '_cached_version', 'v1'), \
+                patch.object(chatbot_rag, '_cache_embeddings', cache), \
+                patch.object(chatbot_rag, 'version_indice', return_value='v1'), \
+                patch.object(chatbot_rag.genai, 'embed_content', return_value={'embedding': [0.0, 1.0]}) as embed:
+            self.assertEqual(chatbot_rag.buscar_contexto('¿Percepciones?', k=1), ['percepciones'])
+            self.assertEqual(chatbot_rag.buscar_contexto('percepciones', k=1), ['percepciones'])
+        embed.assert_called_once()
+        self.assertEqual(cache.estadisticas()['aciertos'], 1)
+
+    def test_hit_rate_is_logged_periodically(self):
+        from . import chatbot_rag
+        with patch.object(chatbot_rag, '_cache_embeddings', CacheEmbeddings(10, 60)), \
+                patch.object(chatbot_rag, 'CACHE_LOG_CADA', 2), \
+                patch.object(chatbot_rag.genai, 'embed_content', return_value={'embedding': [0.0, 1.0]}), \
+                self.assertLogs('municipal_app.chatbot_rag', 'INFO') as registro:
+            for _ in range(4):
+                chatbot_rag.embedding_pregunta('¿Percepciones?')
+        self.assertEqual(registro.output, [
+            'INFO:municipal_app.chatbot_rag:Cache de embeddings de preguntas: 1/2 aciertos (50.0%), 1 entradas',
+            'INFO:municipal_app.chatbot_rag:Cache de embeddings de preguntas: 3/4 aciertos (75.0%), 1 entradas',
+        ])
+
+class CacheRespuestasTest(TestCase):
+    def test_returns_answer_of_a_close_question(self):
+        cache = CacheRespuestas(2, 0.05)
+        cache.guardar([1.0, 0.0, 0.0], 'vence el 15', 'v1')
+        self.assertEqual(cache.buscar([0.99, 0.05, 0.0], 'v1'), 'vence el 15')
+        self.assertIsNone(cache.buscar([0.0, 1.0, 0.0], 'v1'))
+
+        cache.guardar([0.0, 1.0, 0.0], 'alícuota 3,31%', 'v1')
+        cache.guardar([0.0, 0.0, 1.0], 'convenio multilateral', 'v1')  # descarta la más vieja
+        self.assertIsNone(cache.buscar([1.0, 0.0, 0.0], 'v1'))
+        self.assertEqual(cache.buscar([0.0, 0.0, 2.0], 'v1'), 'convenio multilateral')
+
+        # Un índice de conocimiento nuevo invalida todo lo guardado
+        self.assertIsNone(cache.buscar([0.0, 0.0, 1.0], 'v2'))
+        self.assertEqual(cache.estadisticas(), {'entradas': 0, 'aciertos': 2, 'fallos': 3, 'tasa_aciertos': 0.4})
+
+    def test_generar_respuesta_rag_skips_the_model_for_paraphrases(self):
+        from . import chatbot_rag
+        embeddings = {'¿cuándo vence iibb?': [1.0, 0.0], 'fecha de vencimiento de iibb': [0.98, 0.1], 'que es una percepcion': [0.0, 1.0]}
+        modelo = MagicMock()
+        modelo.generate_content.side_effect = lambda prompt: MagicMock(text=f'respuesta {modelo.generate_content.call_count}')
+        version = ['v1']
+        with patch.object(chatbot_rag, '_cache_embeddings', CacheEmbeddings(10, 60)), \
+                patch.object(chatbot_rag, '_cache_respuestas', CacheRespuestas(10, 0.05)), \
+                patch.object(chatbot_rag, 'version_indice', side_effect=lambda: version[0]), \
+                patch.object(chatbot_rag, 'buscar_contexto', return_value=['El vencimiento es el día 15.']), \
+                patch.object(chatbot_rag.genai, 'embed_content', side_effect=lambda model, content, task_type: {'embedding': embeddings[content]}), \
+                patch.object(chatbot_rag.genai, 'GenerativeModel', return_value=modelo), \
+                patch.object(chatbot_rag, 'CACHE_LOG_CADA', 4), \
+                self.assertLogs('municipal_app.chatbot_rag', 'INFO') as registro:
+            self.assertEqual(chatbot_rag.generar_respuesta_rag('¿cuándo vence iibb?'), 'respuesta 1')
+            self.assertEqual(chatbot_rag.generar_respuesta_rag('fecha de vencimiento de iibb'), 'respuesta 1')
+            self.assertEqual(chatbot_rag.generar_respuesta_rag('que es una percepcion'), 'respuesta 2')
+            version[0] = 'v2'
+            self.assertEqual(chatbot_rag.generar_respuesta_rag('¿cuándo vence iibb?'), 'respuesta 3')
+        self.assertEqual(modelo.generate_content.call_count, 3)
+        # Cada 4 consultas queda en el log la tasa de aciertos de la cache de respuestas
+        self.assertIn('INFO:municipal_app.chatbot_rag:Cache de respuestas: 1/4 aciertos (25.0%), 0 entradas', registro.output)
+
+class RagIndexTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+        self.embeddings = np.random.default_rng(0).random((300, 16), dtype='float32')
+
+    def test_index_types_and_saved_configuration(self):
+        for tipo in rag_index.TIPOS_INDICE:
+            configuracion = rag_index.configuracion_indice(tipo, nlist=1000, nprobe=1000, ef_search=300)
+            indice = rag_index.construir_indice(self.embeddings, configuracion)
+            self.assertEqual(indice.ntotal, 300)
+            self.assertEqual(rag_index.comparar_con_flat(indice, self.embeddings, k=3)['recall'], 1.0)
+        self.assertEqual(faiss.extract_index_ivf(rag_index.construir_indice(self.embeddings, rag_index.configuracion_indice('ivf', nlist=1000))).nlist, 300 // 39)
+
+        self.assertEqual(rag_index.leer_configuracion(self.tmpdir)['tipo'], 'flat')
+        rag_index.guardar_configuracion(self.tmpdir, rag_index.configuracion_indice('hnsw', ef_search=128))
+        self.assertEqual(rag_index.leer_configuracion(self.tmpdir)['ef_search'], 128)
+        with self.assertRaises(ValueError):
+            rag_index.configuracion_indice('lsh')
+
+    def test_index_rag_docs_command_builds_the_requested_type(self):
+        from . import chatbot_rag
+        docs = os.path.join(self.tmpdir, 'docs')
+        os.makedirs(docs)
+        with open(os.path.join(docs, 'normativa.txt'), 'w', encoding='utf-8') as archivo:
+            archivo.write('\n\n'.join(f'Párrafo {numero}' for numero in range(300)))
+        indice_dir = os.path.join(self.tmpdir, 'indice')
+        salida = StringIO()
+        with patch.object(chatbot_rag, 'DOCS_DIR', docs), patch.object(chatbot_rag, 'INDEX_DIR', indice_dir), \
+                patch.object(chatbot_rag.genai, 'embed_content', side_effect=lambda model, content, task_type: {
+                    'embedding': [self.embeddings[int(texto.split()[1])].tolist() for texto in content]}), \
+                patch('sys.stdout', StringIO()):
+            call_command('index_rag_docs', '--index-type', 'hnsw', '--m', '16', '--ef-search', '200', '--report', stdout=salida)
+        self.assertIn('Recall@3 frente a flat', salida.getvalue())
+        self.assertEqual(rag_index.leer_configuracion(indice_dir)['m'], 16)
+        indice = faiss.read_index(os.path.join(indice_dir, 'index.faiss'))
+        self.assertIsInstance(faiss.downcast_index(indice.index), faiss.IndexHNSWFlat)
+
+    def _embeddings_por_texto(self, model, content, task_type):
+        # Vector determinístico por texto: el mismo fragmento siempre da el mismo embedding
+        return {'embedding': [np.random.default_rng(int(hashlib.sha256(texto.encode()).hexdigest()[:8], 16)).random(8).tolist()
+                              for texto in content]}
+
+    def test_reindexing_only_embeds_changed_chunks(self):
+        from . import chatbot_rag
+        docs = os.path.join(self.tmpdir, 'docs')
+        os.makedirs(docs)
+        def escribir(nombre, parrafos):
+            with open(os.path.join(docs, nombre), 'w', encoding='utf-8') as archivo:
+                archivo.write('\n\n'.join(parrafos))
+        escribir('iibb.txt', ['Vence el 15.', 'Alícuota general 3,31%.', 'Convenio multilateral.'])
+        escribir('tasas.txt', ['Tasa de higiene.', 'Tasa de publicidad.'])
+        indice_dir = os.path.join(self.tmpdir, 'indice')
+
+        with patch.object(chatbot_rag, 'DOCS_DIR', docs), patch.object(chatbot_rag, 'INDEX_DIR', indice_dir), \
+                patch.object(chatbot_rag.genai, 'embed_content', side_effect=self._embeddings_por_texto) as embed, \
+                patch('sys.stdout', StringIO()):
+            primera = chatbot_rag.crear_indice_rag('flat')
+            self.assertEqual((primera['resumen']['archivos_nuevos'], primera['resumen']['fragmentos_nuevos']), (2, 5))
+
+            escribir('iibb.txt', ['Vence el 18.', 'Alícuota general 3,31%.', 'Convenio multilateral.'])
+            os.remove(os.path.join(docs, 'tasas.txt'))
+            escribir('sellos.txt', ['Impuesto de sellos.'])
+            embed.reset_mock()
+            segunda = chatbot_rag.crear_indice_rag('flat')
+            self.assertEqual(embed.call_args.kwargs['content'], ['Vence el 18.', 'Impuesto de sellos.'])
+            self.assertEqual(segunda['resumen'], {
+                'archivos_nuevos': 1, 'archivos_modificados': 1, 'archivos_sin_cambios': 0, 'archivos_eliminados': 1,
+                'fragmentos_nuevos': 2, 'fragmentos_reutilizados': 2, 'fragmentos_retomados': 0, 'fragmentos_eliminados': 3,
+            })
+            self.assertEqual(set(segunda['tiempos']), {'lectura', 'embeddings', 'indice', 'guardado'})
+
+            indice = faiss.read_index(os.path.join(indice_dir, 'index.faiss'))
+            with open(os.path.join(indice_dir, 'textos.pkl'), 'rb') as archivo:
+                textos = pickle.load(archivo)
+            self.assertEqual(indice.ntotal, 4)
+            self.assertEqual(sorted(textos.values()), ['Alícuota general 3,31%.', 'Convenio multilateral.', 'Impuesto de sellos.', 'Vence el 18.'])
+            consulta = np.array(self._embeddings_por_texto(None, ['Vence el 18.'], None)['embedding'], dtype='float32')
+            self.assertEqual(textos[int(indice.search(consulta, 1)[1][0][0])], 'Vence el 18.')
+
+            embed.reset_mock()
+            tercera = chatbot_rag.crear_indice_rag('flat')
+            embed.assert_not_called()
+            self.assertEqual(tercera['resumen']['fragmentos_reutilizados'], 4)
+            self.assertNotIn('guardado', tercera['tiempos'])
+
+    def test_removing_every_document_clears_the_published_index(self):
+        from . import chatbot_rag
+        docs = os.path.join(self.tmpdir, 'docs')
+        os.makedirs(docs)
+        with open(os.path.join(docs, 'iibb.txt'), 'w', encoding='utf-8') as archivo:
+            archivo.write('Vence el 15.\n\nAlícuota general 3,31%.')
+        indice_dir = os.path.join(self.tmpdir, 'indice')
+
+        with patch.object(chatbot_rag, 'DOCS_DIR', docs), patch.object(chatbot_rag, 'INDEX_DIR', indice_dir), \
+                patch.object(chatbot_rag, '_cached_index', None), patch.object(chatbot_rag, '_cached_texts', None), \
+                patch.object(chatbot_rag, '_cached_version', None), \
+                patch.object(chatbot_rag.genai, 'embed_content', side_effect=self._embeddings_por_texto), \
+                patch('sys.stdout', StringIO()):
+            chatbot_rag.crear_indice_rag('ivf')
+            self.assertTrue(chatbot_rag.cargar_recursos_rag())
+
+            os.remove(os.path.join(docs, 'iibb.txt'))
+            resultado = chatbot_rag.crear_indice_rag('ivf')
+            self.assertEqual((resultado['resumen']['archivos_eliminados'], resultado['resumen']['fragmentos_eliminados']), (1, 2))
+            self.assertFalse(os.path.exists(os.path.join(indice_dir, 'index.faiss')))
+            self.assertFalse(os.path.exists(os.path.join(indice_dir, 'textos.pkl')))
+            self.assertEqual(rag_manifest.leer_manifiesto(indice_dir)['archivos'], {})
+            self.assertEqual(faiss.read_index(os.path.join(indice_dir, 'vectores.faiss')).ntotal, 0)
+            self.assertFalse(chatbot_rag.cargar_recursos_rag())
+            self.assertEqual(chatbot_rag.buscar_contexto('¿Cuándo vence?'), [])
+
+            # Vuelve un documento: se embebe de nuevo y se publica otra vez
+            with open(os.path.join(docs, 'iibb.txt'), 'w', encoding='utf-8') as archivo:
+                archivo.write('Vence el 15.')
+            self.assertEqual(chatbot_rag.crear_indice_rag('flat')['resumen']['fragmentos_nuevos'], 1)
+            self.assertEqual(faiss.read_index(os.path.join(indice_dir, 'index.faiss')).ntotal, 1)
+
+class EmbeddingPipelineTest(TestCase):
+    def test_retries_rate_limits_with_exponential_backoff(self):
+        esperas = []
+        llamada = MagicMock(side_effect=[api_exceptions.ResourceExhausted('cuota'), Exception('429 Too Many Requests'), 'ok'])
+        with patch('municipal_app.embedding_pipeline.random.uniform', side_effect=lambda minimo, maximo: maximo):
+            self.assertEqual(con_reintentos(llamada, 5, espera_inicial=1.0, dormir=esperas.append)('lote'), 'ok')
+        self.assertEqual(esperas, [1.0, 2.0])
+
+        with self.assertRaises(ValueError):
+            con_reintentos(MagicMock(side_effect=ValueError('texto inválido')), 5, dormir=esperas.append)()
+        with self.assertRaises(api_exceptions.ResourceExhausted):
+            con_reintentos(MagicMock(side_effect=api_exceptions.ResourceExhausted('cuota')), 2, dormir=lambda segundos: None)()
+
+    def test_delivers_batches_in_order_with_bounded_concurrency(self):
+        activos, maximo, lock = [0], [0], threading.Lock()
+        def embeber(lote):
+            with lock:
+                activos[0] += 1
+                maximo[0] = max(maximo[0], activos[0])
+            time.sleep(0.02 if lote[0] % 2 == 0 else 0.001)  # Los lotes impares terminan antes
+            with lock:
+                activos[0] -= 1
+            return lote[0] * 10
+        entregados = []
+        procesar_en_orden([[numero] for numero in range(8)], embeber, 2, lambda numero, lote, resultado: entregados.append((numero, resultado)))
+        self.assertEqual(entregados, [(numero, numero * 10) for numero in range(8)])
+        self.assertLessEqual(maximo[0], 2)
+
+    @override_settings(RAG_EMBEDDING_BATCH_SIZE=2, RAG_EMBEDDING_WORKERS=2, RAG_EMBEDDING_CHECKPOINT_BATCHES=1)
+    def test_interrupted_indexing_resumes_without_re_embedding(self):
+        from . import chatbot_rag
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir, ignore_errors=True)
+        docs, indice_dir = os.path.join(tmpdir, 'docs'), os.path.join(tmpdir, 'indice')
+        os.makedirs(docs)
+        parrafos = [f'Artículo {numero}.' for numero in range(7)]
+        with open(os.path.join(docs, 'codigo.txt'), 'w', encoding='utf-8') as archivo:
+            archivo.write('\n\n'.join(parrafos))
+        vector = lambda texto: [float(parrafos.index(texto)), 1.0]
+
+        def embed_que_falla(model, content, task_type):
+            if 'Artículo 4.' in content:
+                raise ValueError('conexión cortada')
+            return {'embedding': [vector(texto) for texto in content]}
+        pedidos = []
+        def embed(model, content, task_type):
+            pedidos.extend(content)
+            return {'embedding': [vector(texto) for texto in content]}
+
+        with patch.object(chatbot_rag, 'DOCS_DIR', docs), patch.object(chatbot_rag, 'INDEX_DIR', indice_dir), \
+                patch('sys.stdout', StringIO()):
+            with patch.object(chatbot_rag.genai, 'embed_content', side_effect=embed_que_falla):
+                self.assertIsNone(chatbot_rag.crear_indice_rag('flat'))
+            self.assertFalse(os.path.exists(os.path.join(indice_dir, 'index.faiss')))
+            self.assertEqual(sum(map(len, rag_manifest.leer_manifiesto(indice_dir)['pendientes'].values())), 4)
+
+            with patch.object(chatbot_rag.genai, 'embed_content', side_effect=embed):
+                resultado = chatbot_rag.crear_indice_rag('flat')
+        self.assertEqual(pedidos, parrafos[4:])
+        self.assertEqual((resultado['resumen']['fragmentos_retomados'], resultado['resumen']['fragmentos_nuevos']), (4, 3))
+        self.assertNotIn('pendientes', rag_manifest.leer_manifiesto(indice_dir))
+        indice = faiss.read_index(os.path.join(indice_dir, 'index.faiss'))
+        with open(os.path.join(indice_dir, 'textos.pkl'), 'rb') as archivo:
+            textos = pickle.load(archivo)
+        self.assertEqual(indice.ntotal, 7)
+        for texto in parrafos:
+            self.assertEqual(textos[int(indice.search(np.array([vector(texto)], dtype='float32'), 1)[1][0][0])], texto)
+
+class ExtractTotalFromExcelTest(TestCase):
+    def _xlsx(self, celdas, nombre='factura.xlsx'):
+        wb = openpyxl.Workbook()
+        for coordenada, valor in celdas.items():
+            wb.active[coordenada] = valor
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        return SimpleUploadedFile(nombre, buffer.getvalue())
+
+    def test_a1_total_wins(self):
+        self.assertEqual(extract_total_from_excel(self._xlsx({'A1': 1500.5, 'B9': 3})), Decimal('1500.5'))
+
+    def test_first_number_of_last_numeric_row(self):
+        archivo = self._xlsx({'A1': 'Detalle', 'B2': 10, 'A5': 'Total', 'C5': 250.75, 'D5': 1, 'A6': 'firma'})
+        self.assertEqual(extract_total_from_excel(archivo), Decimal('250.75'))
+
+    def test_without_numbers_fails(self):
+        with self.assertRaisesMessage(ValueError, 'No se encontró un monto numérico'):
+            extract_total_from_excel(self._xlsx({'A1': 'vacío'}))
+
+    @override_settings(MAX_UPLOAD_SIZE=1024)
+    def test_upload_size_limit(self):
+        archivo = self._xlsx({'A1': 'x' * 5000, 'B2': 10})
+        with self.assertRaisesMessage(ValueError, 'tamaño máximo'):
+            extract_total_from_excel(archivo)
+
+    @override_settings(MAX_UPLOAD_SIZE=1024)
+    def test_size_limit_enforced_while_reading(self):
+        archivo = self._xlsx({'A1': 'x' * 5000, 'B2': 10})
+        archivo.size = None  # Tamaño desconocido: el límite lo aplica la lectura
+        with self.assertRaisesMessage(ValueError, 'tamaño máximo'):
+            extract_total_from_excel(archivo)
+
+class ExtractTotalFromPdfTest(TestCase):
+    def _pdf(self, paginas):
+        return SimpleUploadedFile('factura.pdf', pdf_minimo(paginas))
+
+    def test_total_on_last_page_reads_one_page(self):
+        archivo = self._pdf([['Total 999,99'], ['Detalle 10,00'], ['Subtotal 100,00', 'Total a pagar: 1.234,56', 'Hoja 3']])
+        with patch('municipal_app.utils._montos_de_pagina', wraps=utils._montos_de_pagina) as analizar:
+            self.assertEqual(extract_total_from_pdf(archivo), Decimal('1234.56'))
+        self.assertEqual(analizar.call_count, 1)
+
+    def test_anchor_on_earlier_page(self):
+        archivo = self._pdf([['Importe total: 500,00'], ['Observaciones', 'Hoja 2 de 2']])
+        self.assertEqual(extract_total_from_pdf(archivo), Decimal('500.00'))
+
+    def test_without_anchor_uses_last_amount(self):
+        archivo = self._pdf([['Item 10,00', 'Item 20,00'], ['Neto 30,50'], ['Sin montos']])
+        self.assertEqual(extract_total_from_pdf(archivo), Decimal('30.50'))
+
+    @override_settings(PDF_POOL_MIN_PAGES=2, PDF_POOL_PROCESSES=2)
+    def test_long_pdf_uses_process_pool(self):
+        archivo = self._pdf([['Item 1,00'], ['TOTAL $ 2.500,00'], ['Anexo 7,00'], ['Anexo 8,00']])
+        with patch('municipal_app.utils.ProcessPoolExecutor.shutdown', autospec=True,
+                   side_effect=utils.ProcessPoolExecutor.shutdown) as shutdown:
+            self.assertEqual(extract_total_from_pdf(archivo), Decimal('2500.00'))
+        # Con el total encontrado no se espera a los bloques que siguen corriendo
+        shutdown.assert_called_once_with(ANY, wait=False, cancel_futures=True)
+
+class ParsedUploadCacheTest(TestCase):
+    def _archivo(self, contenido=b'Total a pagar: 1.234,56', nombre='factura.pdf'):
+        return SimpleUploadedFile(nombre, pdf_minimo([[contenido.decode()]]))
+
+    def test_same_content_is_parsed_once(self):
+        with patch('municipal_app.upload_cache.extract_total_from_file', wraps=utils.extract_total_from_file) as parsear:
+            self.assertEqual(extract_total_cached(self._archivo()), Decimal('1234.56'))
+            self.assertEqual(extract_total_cached(self._archivo(nombre='reintento.pdf')), Decimal('1234.56'))
+        self.assertEqual(parsear.call_count, 1)
+        entrada = ParsedUploadCache.objects.get()
+        self.assertEqual(entrada.hits, 1)
+        self.assertEqual(entrada.file_type, 'pdf')
+        self.assertEqual(entrada.parser_version, utils.PARSER_VERSION)
+
+    def test_hash_leaves_file_ready_to_parse(self):
+        archivo = self._archivo()
+        self.assertEqual(len(hash_upload(archivo)), 64)
+        self.assertEqual(archivo.read(5), b'%PDF-')
+
+    def test_parse_errors_are_not_cached(self):
+        with self.assertRaises(ValueError):
+            extract_total_cached(SimpleUploadedFile('roto.pdf', b'no es un pdf'))
+        self.assertFalse(ParsedUploadCache.objects.exists())
+
+    @override_settings(UPLOAD_CACHE_MAX_ENTRIES=2)
+    def test_least_recently_used_entries_are_evicted(self):
+        for monto in ('1,00', '2,00', '3,00'):
+            extract_total_cached(self._archivo(f'Total {monto}'.encode()))
+        self.assertEqual(sorted(ParsedUploadCache.objects.values_list('amount', flat=True)), ['2.00', '3.00'])
+
+    def test_billing_view_uses_cache(self):
+        user = User.objects.create_user(username='cliente', password='x')
+        MunicipalCredentials.objects.create(user=user, municipal_username='m', municipal_password=f.encrypt(b'clave'))
+        self.client.login(username='cliente', password='x')
+        self.client.post(reverse('enter_billing'), {'file': self._archivo()})
+        with patch('municipal_app.upload_cache.extract_total_from_file') as parsear:
+            self.client.post(reverse('enter_billing'), {'file': self._archivo()})
+        parsear.assert_not_called()
+        self.assertEqual(list(BotJob.objects.values_list('amount', flat=True)), [Decimal('1234.56')] * 2)
+
+class BulkUploadTest(TestCase):
+    def _pdf(self, nombre, texto):
+        return SimpleUploadedFile(nombre, pdf_minimo([[texto]]))
+
+    def _zip(self, nombre, miembros):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_salida:
+            for nombre_miembro, contenido in miembros.items():
+                zip_salida.writestr(nombre_miembro, contenido)
+        return SimpleUploadedFile(nombre, buffer.getvalue())
+
+    def test_files_and_zip_members_in_order(self):
+        wb = openpyxl.Workbook()
+        wb.active['A1'] = 300
+        excel = io.BytesIO()
+        wb.save(excel)
+        archivos = [
+            self._pdf('enero.pdf', 'Total: 1.000,50'),
+            self._zip('clientes.zip', {
+                'febrero/cliente.xlsx': excel.getvalue(),
+                '../notas.doc': b'hola',
+                '__MACOSX/._cliente.xlsx': b'basura',
+                'marzo.pdf': pdf_minimo([['sin montos']]),
+            }),
+        ]
+        filas = procesar_carga_masiva(archivos, procesos=2)
+        self.assertEqual([fila['archivo'] for fila in filas],
+                         ['enero.pdf', 'clientes.zip/febrero/cliente.xlsx', 'clientes.zip/../notas.doc', 'clientes.zip/marzo.pdf'])
+        self.assertEqual([fila['monto'] for fila in filas], [Decimal('1000.50'), Decimal('300'), None, None])
+        self.assertIn('no soportado', filas[2]['error'])
+        self.assertIn('No se encontró un monto', filas[3]['error'])
+
+    def test_duplicates_are_parsed_once_and_cached(self):
+        with patch('municipal_app.bulk_upload.extract_total_from_file', wraps=utils.extract_total_from_file) as parsear:
+            filas = procesar_carga_masiva([self._pdf('a.pdf', 'Total 5,00'), self._pdf('b.pdf', 'Total 5,00')], procesos=1)
+            self.assertEqual([fila['monto'] for fila in filas], [Decimal('5.00')] * 2)
+            self.assertEqual(parsear.call_count, 1)
+            filas = procesar_carga_masiva([self._pdf('c.pdf', 'Total 5,00')], procesos=1)
+        self.assertEqual(parsear.call_count, 1)
+        self.assertTrue(filas[0]['cache'])
+
+    @override_settings(MAX_UPLOAD_SIZE=1024)
+    def test_zip_member_over_size_limit_is_not_extracted(self):
+        filas = procesar_carga_masiva([self._zip('grande.zip', {'grande.pdf': b'%PDF-' + b'0' * 5000})], procesos=1)
+        self.assertIn('tamaño máximo', filas[0]['error'])
+
+    def test_invalid_zip(self):
+        filas = procesar_carga_masiva([SimpleUploadedFile('roto.zip', b'no es un zip')], procesos=1)
+        self.assertIn('ZIP inválido', filas[0]['error'])
+
+    @override_settings(BULK_UPLOAD_MAX_FILES=1)
+    def test_view_rejects_too_many_files(self):
+        User.objects.create_user(username='contador', password='x')
+        self.client.login(username='contador', password='x')
+        respuesta = self.client.post(reverse('bulk_upload'), {'files': [self._pdf('a.pdf', 'Total 1,00'), self._pdf('b.pdf', 'Total 2,00')]})
+        self.assertContains(respuesta, 'hasta 1 archivos')
+
+    @override_settings(BULK_UPLOAD_PROCESSES=1)
+    def test_view_renders_results_table(self):
+        User.objects.create_user(username='contador', password='x')
+        self.client.login(username='contador', password='x')
+        respuesta = self.client.post(reverse('bulk_upload'), {'files': [self._pdf('a.pdf', 'Total 1,00'), self._pdf('b.pdf', 'Total 2,50')]})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['total'], Decimal('3.50'))
+        self.assertContains(respuesta, 'b.pdf')
+
+class DiskUploadHandlerTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cliente', password='x')
+        MunicipalCredentials.objects.create(user=self.user, municipal_username='m', municipal_password=f.encrypt(b'clave'))
+        self.client.login(username='cliente', password='x')
+
+    def _subir(self, nombre, contenido, url='enter_billing', campo='file'):
+        return self.client.post(reverse(url), {campo: SimpleUploadedFile(nombre, contenido)}, follow=True)
+
+    def test_upload_is_parsed_from_a_temp_file(self):
+        recibidos = []
+        def parsear(archivo):
+            recibidos.append((type(archivo).__name__, os.path.exists(archivo.temporary_file_path())))
+            return Decimal('10.00')
+        with patch('municipal_app.upload_cache.extract_total_from_file', side_effect=parsear):
+            self._subir('factura.pdf', pdf_minimo([['Total 10,00']]))
+        self.assertEqual(recibidos, [('TemporaryUploadedFile', True)])
+        self.assertEqual(BotJob.objects.get().amount, Decimal('10.00'))
+
+    def test_wrong_magic_bytes_are_rejected_before_parsing(self):
+        with patch('municipal_app.upload_cache.extract_total_from_file') as parsear:
+            respuesta = self._subir('factura.xlsx', pdf_minimo([['Total 10,00']]))
+        parsear.assert_not_called()
+        self.assertContains(respuesta, 'no corresponde a un archivo Excel')
+        self.assertFalse(BotJob.objects.exists())
+
+    def test_tiny_file_is_checked_on_completion(self):
+        respuesta = self._subir('factura.pdf', b'%PD')
+        self.assertContains(respuesta, 'no corresponde a un archivo PDF')
+
+    @override_settings(MAX_UPLOAD_SIZE=1024)
+    def test_size_limit_stops_the_upload(self):
+        respuesta = self._subir('factura.pdf', b'%PDF-' + b'0' * 200_000)
+        self.assertContains(respuesta, 'tamaño máximo')
+        self.assertFalse(BotJob.objects.exists())
+
+    def test_csrf_is_still_enforced(self):
+        cliente = Client(enforce_csrf_checks=True)
+        cliente.login(username='cliente', password='x')
+        respuesta = cliente.post(reverse('enter_billing'), {'file': SimpleUploadedFile('factura.pdf', pdf_minimo([['Total 1,00']]))})
+        self.assertEqual(respuesta.status_code, 403)
+
+    def test_anonymous_upload_is_redirected_before_reading_the_body(self):
+        anonimo = Client(enforce_csrf_checks=True)
+        with patch('municipal_app.upload_handlers.ArchivoFacturacionUploadHandler') as handler:
+            for url in ('enter_billing', 'enter_misiones', 'bulk_upload'):
+                respuesta = anonimo.post(reverse(url), {'file': SimpleUploadedFile('factura.pdf', pdf_minimo([['Total 1,00']]))})
+                self.assertEqual(respuesta.status_code, 302)
+                self.assertIn(settings.LOGIN_URL, respuesta['Location'])
+        handler.assert_not_called()
+
+    @override_settings(BULK_UPLOAD_PROCESSES=1)
+    def test_bulk_upload_lists_rejected_files(self):
+        respuesta = self.client.post(reverse('bulk_upload'), {'files': [
+            SimpleUploadedFile('falso.pdf', b'<html>login</html>'),
+            SimpleUploadedFile('bueno.pdf', pdf_minimo([['Total 7,00']])),
+        ]})
+        filas = {fila['archivo']: fila for fila in respuesta.context['resultados']}
+        self.assertIn('no corresponde a un archivo PDF', filas['falso.pdf']['error'])
+        self.assertEqual(filas['bueno.pdf']['monto'], Decimal('7.00'))
+
+    def test_mmap_hash_matches_content_hash(self):
+        with tempfile.NamedTemporaryFile(delete=False) as archivo:
+            archivo.write(b'contenido')
+        self.addCleanup(os.remove, archivo.name)
+        self.assertEqual(hash_archivo(archivo.name), hashlib.sha256(b'contenido').hexdigest())
+        open(archivo.name, 'wb').close()
+        self.assertEqual(hash_archivo(archivo.name), hashlib.sha256().hexdigest())
+
+class BenchParsersCommandTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+
+    def test_synthetic_files_parse(self):
+        rentas = escribir_rentas_xlsx(os.path.join(self.tmpdir, 'Rentas_2025-09.xlsx'), 200)
+        self.assertEqual(list(rentabot._leer_rentas(rentas).columns), ['CUIT', 'RAZÓN SOCIAL', 'RÉG', 'FECHA', 'BASE IMP.', 'ALÍC.', 'COEF.', 'TOTAL'])
+        totales = rentabot.procesar_excel_rentas(rentas)
+        self.assertGreater(totales['PERCEPCIÓN'], 0)
+        self.assertGreater(totales['RETENCIÓN'], 0)
+
+        ruta_pdf = escribir_factura_pdf(os.path.join(self.tmpdir, 'factura.pdf'), 120, lineas_por_pagina=50)
+        with open(ruta_pdf, 'rb') as archivo:
+            self.assertGreater(extract_total_from_pdf(archivo), 0)
+
+    def test_writes_comparable_json(self):
+        primera = os.path.join(self.tmpdir, 'antes.json')
+        segunda = os.path.join(self.tmpdir, 'despues.json')
+        opciones = {'sizes': '20', 'repeat': 1, 'data_dir': self.tmpdir, 'stdout': StringIO()}
+        call_command('bench_parsers', output=primera, **opciones)
+        salida = StringIO()
+        call_command('bench_parsers', output=segunda, compare=primera, **{**opciones, 'stdout': salida})
+
+        with open(segunda, encoding='utf-8') as archivo:
+            reporte = json.load(archivo)
+        self.assertEqual([(r['parser'], r['filas']) for r in reporte['resultados']],
+                         [('extract_total_from_excel', 20), ('extract_total_from_pdf', 20), ('procesar_excel_rentas', 20),
+                          ('extract_total_from_csv', 20)])
+        for resultado in reporte['resultados']:
+            self.assertIsNone(resultado['error'])
+            self.assertGreater(resultado['pico_memoria_bytes'], 0)
+            self.assertGreater(resultado['segundos'], 0)
+        self.assertIn('tiempo x', salida.getvalue())
+
+    def test_unknown_parser_is_rejected(self):
+        with self.assertRaises(CommandError):
+            call_command('bench_parsers', parsers='no_existe', output=os.path.join(self.tmpdir, 'x.json'))
+
+class ExtractTotalFromCsvTest(TestCase):
+    def _csv(self, contenido, nombre='retenciones.csv', encoding='utf-8'):
+        return SimpleUploadedFile(nombre, contenido.encode(encoding) if isinstance(contenido, str) else contenido)
+
+    def test_sums_total_column_with_argentine_numbers(self):
+        archivo = self._csv('CUIT;RAZÓN SOCIAL;FECHA;BASE IMP.;ALÍC.;COEF.;TOTAL\n'
+                            '30-70308853-4;MERCADO LIBRE S.R.L.;10/09/2025;20.200,00;;1,00;808,00\n'
+                            '30-70308853-4;"AGENTE; S.A.";20/09/2025;8.800,00;;1,00;1.352,50\n'
+                            ';;;;;;\n')
+        self.assertEqual(extract_total_from_csv(archivo), Decimal('2160.50'))
+
+    def test_sniffs_delimiter_and_cp1252_encoding(self):
+        archivo = self._csv('Período\tImporte Total\n2025-09\t1.000,25\n2025-09\t(0,25)\n', nombre='export.txt', encoding='cp1252')
+        self.assertEqual(extract_total_from_csv(archivo), Decimal('1000.00'))
+
+    def test_utf16_export(self):
+        archivo = self._csv('TOTAL,OTRO\n"1.234,56",x\n', encoding='utf-16')
+        self.assertEqual(extract_total_from_csv(archivo), Decimal('1234.56'))
+
+    def test_without_header_uses_last_amount_row(self):
+        self.assertEqual(extract_total_from_csv(self._csv('Detalle;10,00\nTotal;150,75\nfirma\n')), Decimal('150.75'))
+
+    def test_streams_in_blocks(self):
+        # Más de un bloque de lectura, con una línea cortada entre bloques
+        filas = ''.join(f'{i};1,00\r\n' for i in range(20000))
+        self.assertEqual(extract_total_from_csv(self._csv('NRO;TOTAL\r\n' + filas)), Decimal('20000.00'))
+
+    def test_empty_and_amountless_files_fail(self):
+        with self.assertRaisesMessage(ValueError, 'no tiene montos'):
+            extract_total_from_csv(self._csv('TOTAL;OTRO\nx;y\n'))
+        with self.assertRaisesMessage(ValueError, 'vacío'):
+            extract_total_from_csv(self._csv(''))
+
+    def test_format_is_sniffed_from_content(self):
+        self.assertEqual(utils.extract_total_from_file(self._csv('TOTAL\n5,00\n', nombre='export')), Decimal('5.00'))
+        self.assertEqual(utils.extract_total_from_file(SimpleUploadedFile('factura.dat', pdf_minimo([['Total 3,00']]))), Decimal('3.00'))
+        with self.assertRaisesMessage(ValueError, 'no soportado'):
+            utils.extract_total_from_file(SimpleUploadedFile('binario.bin', b'\x00\x01\x02'))
+
+    def test_billing_view_accepts_csv(self):
+        user = User.objects.create_user(username='cliente', password='x')
+        MunicipalCredentials.objects.create(user=user, municipal_username='m', municipal_password=f.encrypt(b'clave'))
+        self.client.login(username='cliente', password='x')
+        self.client.post(reverse('enter_billing'), {'file': self._csv('TOTAL\n12,50\n')})
+        respuesta = self.client.post(reverse('enter_billing'), {'file': self._csv(b'\x00\x00binario')}, follow=True)
+        self.assertEqual(list(BotJob.objects.values_list('amount', flat=True)), [Decimal('12.50')])
+        self.assertContains(respuesta, 'no corresponde a un archivo CSV/TXT')
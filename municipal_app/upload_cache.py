@@ -0,0 +1,94 @@
+import hashlib
+import logging
+import mmap
+import os
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ParsedUploadCache
+from .utils import PARSER_VERSION, extract_total_from_file, file_type
+
+logger = logging.getLogger(__name__)
+
+TAMANIO_BLOQUE_HASH = 1024 * 1024
+
+
+def hash_archivo(ruta):
+    """SHA-256 de un archivo en disco, mapeado en memoria (sin copiarlo a buffers de Python)."""
+    digest = hashlib.sha256()
+    if os.path.getsize(ruta):  # mmap no acepta archivos vacíos
+        with open(ruta, 'rb') as archivo, mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+            digest.update(mapa)
+    return digest.hexdigest()
+
+
+def hash_upload(file):
+    """SHA-256 del contenido del archivo subido, leído por bloques (o mapeado, si ya está en disco). Deja el archivo al principio."""
+    if hasattr(file, 'temporary_file_path'):
+        return hash_archivo(file.temporary_file_path())
+    digest = hashlib.sha256()
+    if hasattr(file, 'chunks'):
+        for bloque in file.chunks(TAMANIO_BLOQUE_HASH):
+            digest.update(bloque)
+    else:
+        file.seek(0)
+        for bloque in iter(lambda: file.read(TAMANIO_BLOQUE_HASH), b''):
+            digest.update(bloque)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def extract_total_cached(file):
+    """
+    Igual que `extract_total_from_file`, pero si el mismo contenido ya se parseó con la
+    versión actual del parser devuelve el monto guardado. Los errores de parseo no se guardan.
+    """
+    sha256 = hash_upload(file)
+    monto = buscar_en_cache(sha256)
+    if monto is not None:
+        logger.debug(f"extract_total_cached: Monto de {file.name} tomado del cache ({sha256[:12]}).")
+        return monto
+
+    inicio = time.perf_counter()
+    monto = extract_total_from_file(file)
+    guardar_en_cache(sha256, monto, file.name, file.size, (time.perf_counter() - inicio) * 1000)
+    return monto
+
+
+def buscar_en_cache(sha256):
+    """Monto guardado para ese contenido con la versión actual del parser (y cuenta el uso), o None."""
+    entrada = ParsedUploadCache.objects.filter(sha256=sha256, parser_version=PARSER_VERSION).first()
+    if entrada is None:
+        return None
+    ParsedUploadCache.objects.filter(pk=entrada.pk).update(hits=F('hits') + 1, last_used_at=timezone.now())
+    return Decimal(entrada.amount)
+
+
+def guardar_en_cache(sha256, monto, nombre, tamanio, parse_ms):
+    """Guarda el monto parseado de un contenido y recorta el cache si se pasó del máximo."""
+    ParsedUploadCache.objects.update_or_create(
+        sha256=sha256,
+        parser_version=PARSER_VERSION,
+        defaults={
+            'amount': str(monto),
+            'file_type': file_type(nombre) or '',
+            'file_size': tamanio or 0,
+            'parse_ms': parse_ms,
+            'last_used_at': timezone.now(),
+        },
+    )
+    _evict()
+
+
+def _evict():
+    """Mantiene el cache en UPLOAD_CACHE_MAX_ENTRIES filas, borrando las usadas hace más tiempo."""
+    maximo = getattr(settings, 'UPLOAD_CACHE_MAX_ENTRIES', 500)
+    sobrantes = ParsedUploadCache.objects.count() - maximo
+    if sobrantes > 0:
+        viejas = list(ParsedUploadCache.objects.order_by('last_used_at', 'pk').values_list('pk', flat=True)[:sobrantes])
+        ParsedUploadCache.objects.filter(pk__in=viejas).delete()
+        logger.debug(f"extract_total_cached: {len(viejas)} entrada(s) del cache eliminadas.")
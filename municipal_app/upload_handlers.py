@@ -0,0 +1,127 @@
+import logging
+
+from django.conf import settings
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+from .utils import BOMS_UTF16, file_type
+
+logger = logging.getLogger(__name__)
+
+# Firmas de los archivos aceptados: .xlsx/.zip son ZIP, .xls es OLE2 y el PDF puede tener
+# basura antes de `%PDF-` (la especificación tolera hasta 1024 bytes). Un CSV/TXT es texto:
+# sin bytes nulos, salvo que sea UTF-16 (con BOM)
+FIRMAS = {
+    'excel': (b'PK\x03\x04', b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'),
+    'zip': (b'PK\x03\x04', b'PK\x05\x06'),
+}
+FIRMA_PDF = b'%PDF-'
+NOMBRES_TIPO = {'excel': 'Excel', 'pdf': 'PDF', 'zip': 'ZIP', 'csv': 'CSV/TXT'}
+BYTES_CABECERA = 1024
+
+
+def tipo_subida(nombre):
+    """'excel', 'pdf', 'zip' o None según la extensión."""
+    if (nombre or '').lower().endswith('.zip'):
+        return 'zip'
+    return file_type(nombre or '')
+
+
+def limite_subida(tipo):
+    """Tamaño máximo en bytes: los ZIP de la carga masiva tienen su propio límite."""
+    if tipo == 'zip':
+        return getattr(settings, 'MAX_ZIP_UPLOAD_SIZE', 100 * 1024 * 1024)
+    return getattr(settings, 'MAX_UPLOAD_SIZE', 10 * 1024 * 1024)
+
+
+class ArchivoFacturacionUploadHandler(TemporaryFileUploadHandler):
+    """
+    Recibe cada archivo directo a un temporal en disco (nunca en memoria, sin importar el
+    tamaño), corta la subida en cuanto supera el límite y valida la firma con los primeros
+    bytes, antes de recibir el resto. Los archivos rechazados no llegan a `request.FILES`:
+    el motivo queda en `request.errores_subida` como (nombre, mensaje).
+    """
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.tipo = tipo_subida(file_name)
+        self.limite = limite_subida(self.tipo)
+        self.cabecera = b''
+        self.firma_validada = self.tipo is None  # Los tipos no soportados los rechaza el parser, con su mensaje
+        if content_length is not None and content_length > self.limite:
+            self._rechazar(self._mensaje_tamanio())
+
+    def _mensaje_tamanio(self):
+        return f"El archivo supera el tamaño máximo permitido ({self.limite // (1024 * 1024)} MB)."
+
+    def _registrar_error(self, mensaje):
+        logger.warning(f"ArchivoFacturacionUploadHandler: {self.file_name} rechazado: {mensaje}")
+        if not hasattr(self.request, 'errores_subida'):
+            self.request.errores_subida = []
+        self.request.errores_subida.append((self.file_name, mensaje))
+
+    def _rechazar(self, mensaje):
+        self._registrar_error(mensaje)
+        raise SkipFile(mensaje)
+
+    def _firma_valida(self, completo):
+        """True/False si la cabecera ya alcanza para decidir, None si faltan bytes."""
+        if self.tipo == 'csv':
+            if self.cabecera.startswith(BOMS_UTF16):
+                return True
+            if b'\x00' in self.cabecera:
+                return False
+            return True if completo or len(self.cabecera) >= BYTES_CABECERA else None
+        if self.tipo == 'pdf':
+            if FIRMA_PDF in self.cabecera:
+                return True
+            return False if completo or len(self.cabecera) >= BYTES_CABECERA else None
+        if any(self.cabecera.startswith(firma) for firma in FIRMAS[self.tipo]):
+            return True
+        return False if completo or len(self.cabecera) >= 8 else None
+
+    def _controlar_firma(self, completo=False):
+        valida = self._firma_valida(completo)
+        if valida is False:
+            return f"El contenido no corresponde a un archivo {NOMBRES_TIPO[self.tipo]} válido."
+        self.firma_validada = valida is True
+        return None
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.limite:
+            self._rechazar(self._mensaje_tamanio())
+        if not self.firma_validada:
+            self.cabecera += raw_data[:BYTES_CABECERA - len(self.cabecera)]
+            error = self._controlar_firma()
+            if error:
+                self._rechazar(error)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        # Archivos más chicos que la firma: se decide recién al final (SkipFile ya no aplica acá)
+        error = None if self.firma_validada else self._controlar_firma(completo=True)
+        if error:
+            self._registrar_error(error)
+            self.file.close()
+            return None
+        return super().file_complete(file_size)
+
+
+class SubidaEnDiscoMixin:
+    """
+    Vistas que reciben archivos de facturación: instala `ArchivoFacturacionUploadHandler`
+    antes de que se lea el cuerpo del pedido. Va después de `LoginRequiredMixin`, así un
+    pedido sin sesión se redirige al login sin que se lea ni se guarde nada.
+    El chequeo CSRF se hace acá mismo, porque el middleware lee `request.POST` (y con eso
+    los archivos) antes de que la vista pueda cambiar los handlers.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # La marca va en la vista y no en `dispatch`: Django solo copia la del primer `dispatch` del MRO
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    def dispatch(self, request, *args, **kwargs):
+        request.upload_handlers = [ArchivoFacturacionUploadHandler(request)]
+        request.errores_subida = []
+        return csrf_protect(super().dispatch)(request, *args, **kwargs)
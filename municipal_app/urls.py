@@ -1,7 +1,7 @@
 from django.urls import path, include
 from django.contrib.auth import views as auth_views
 from django.views.generic.base import RedirectView
-from .views import RegisterView, MunicipalCredentialsView, EnterBillingView, ProfileView, ExecutionHistoryView, DashboardView, MisionesCredentialsView, EnterMisionesBillingView, MisionesHistoryView, AdminDashboardView, CombinedHistoryView, ChatbotView, chatbot_api
+from .views import RegisterView, MunicipalCredentialsView, EnterBillingView, BulkUploadView, ProfileView, ExecutionHistoryView, DashboardView, MisionesCredentialsView, EnterMisionesBillingView, MisionesHistoryView, AdminDashboardView, CombinedHistoryView, ChatbotView, chatbot_api, job_status_api
 
 urlpatterns = [
     # URL raíz que redirige a login
@@ -18,6 +18,9 @@ urlpatterns = [
     # URL para ingreso de facturación
     path('enter-billing/', EnterBillingView.as_view(), name='enter_billing'),
 
+    # URL para extraer los montos de muchos archivos a la vez
+    path('bulk-upload/', BulkUploadView.as_view(), name='bulk_upload'),
+
     # URL para perfil de usuario
     path('profile/', ProfileView.as_view(), name='profile'),
 
@@ -40,4 +43,7 @@ urlpatterns = [
 
     # API del Chatbot
     path('api/chatbot/', chatbot_api, name='chatbot_api'),
+
+    # Estado de los trabajos de bots encolados
+    path('api/jobs/<int:job_id>/', job_status_api, name='job_status'),
 ]
\ No newline at end of file
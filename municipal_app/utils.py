@@ -1,75 +1,357 @@
+import codecs
+import csv
+import io
+import itertools
+import math
 import openpyxl
 import pdfplumber
 import re
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
 from decimal import Decimal, InvalidOperation
 
+from django.conf import settings
+
+# Subir cuando cambie la forma de extraer montos: invalida los montos guardados en ParsedUploadCache
+PARSER_VERSION = 1
+
+
+class _LecturaLimitada:
+    """
+    Envuelve un archivo y falla en cuanto se lee más allá de `limite` bytes,
+    así el límite se respeta mientras se procesa y no solo con el tamaño declarado.
+    """
+
+    def __init__(self, archivo, limite):
+        self._archivo = archivo
+        self._limite = limite
+
+    def _controlar(self):
+        if self._archivo.tell() > self._limite:
+            raise ValueError(f"El archivo supera el tamaño máximo permitido ({self._limite // (1024 * 1024)} MB).")
+
+    def read(self, size=-1):
+        datos = self._archivo.read(size)
+        self._controlar()
+        return datos
+
+    def seek(self, offset, whence=0):
+        posicion = self._archivo.seek(offset, whence)
+        self._controlar()
+        return posicion
+
+    def tell(self):
+        return self._archivo.tell()
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+def _verificar_tamanio(file):
+    """Rechaza de entrada los archivos cuyo tamaño declarado supera MAX_UPLOAD_SIZE."""
+    limite = getattr(settings, 'MAX_UPLOAD_SIZE', 10 * 1024 * 1024)
+    tamanio = getattr(file, 'size', None)
+    if tamanio is not None and tamanio > limite:
+        raise ValueError(f"El archivo supera el tamaño máximo permitido ({limite // (1024 * 1024)} MB).")
+    return limite
+
+def _ruta_en_disco(file):
+    """Ruta del temporal si la subida ya está en disco (TemporaryUploadedFile), para que los parsers la abran directo."""
+    return file.temporary_file_path() if hasattr(file, 'temporary_file_path') else None
+
+def _es_monto(valor):
+    # Número distinto de cero; los VERDADERO/FALSO de Excel no se toman como montos
+    return bool(valor) and isinstance(valor, (int, float)) and not isinstance(valor, bool)
+
 def extract_total_from_excel(file):
     """
     Extrae el monto total de un archivo Excel.
     Asume que el total está en la celda A1 o busca la última fila con datos numéricos.
+
+    El libro se abre en modo read_only y se recorre una sola vez hacia adelante, fila por
+    fila, recordando el primer número de la última fila que tenga uno: la memoria no crece
+    con el tamaño de la planilla. El tamaño máximo (MAX_UPLOAD_SIZE) se controla mientras se lee;
+    si la subida ya está en disco se abre el archivo por su ruta (su tamaño es el real).
     """
     try:
-        wb = openpyxl.load_workbook(file)
-        sheet = wb.active
+        limite = _verificar_tamanio(file)
+        ruta = _ruta_en_disco(file)
+        if ruta is None and hasattr(file, 'seek'):
+            file.seek(0)
+        wb = openpyxl.load_workbook(ruta or _LecturaLimitada(file, limite), read_only=True)
+        try:
+            sheet = wb.active
+            # La dimensión que declaran algunos exportadores es incorrecta: se lee la hoja completa
+            sheet.reset_dimensions()
 
-        # Primero intenta celda A1
-        cell_value = sheet['A1'].value
-        if cell_value and isinstance(cell_value, (int, float)):
-            return Decimal(str(cell_value))
-
-        # Busca la última fila con datos numéricos
-        for row in range(sheet.max_row, 0, -1):
-            for col in range(1, sheet.max_column + 1):
-                cell_value = sheet.cell(row=row, column=col).value
-                if cell_value and isinstance(cell_value, (int, float)):
-                    return Decimal(str(cell_value))
+            ultimo_monto = None
+            for numero_fila, fila in enumerate(sheet.iter_rows(values_only=True), start=1):
+                # Primero intenta celda A1
+                if numero_fila == 1 and fila and _es_monto(fila[0]):
+                    return Decimal(str(fila[0]))
+                monto = next((valor for valor in fila if _es_monto(valor)), None)
+                if monto is not None:
+                    ultimo_monto = monto
+        finally:
+            wb.close()
 
+        if ultimo_monto is not None:
+            return Decimal(str(ultimo_monto))
         raise ValueError("No se encontró un monto numérico en el archivo Excel.")
 
     except Exception as e:
         raise ValueError(f"Error procesando archivo Excel: {str(e)}")
 
+# Patrón para montos: números con o sin decimales, opcionalmente con separadores
+PATRON_MONTO = r'(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)'
+# "Total", "TOTAL A PAGAR", "Importe total:", "Total $ 1.234,56"... seguido del monto
+PATRON_TOTAL = re.compile(
+    r'\b(?:importe\s+)?total(?:\s+(?:a\s+pagar|general|factura(?:do)?))?\s*[:=]?\s*(?:\$|ARS)?\s*' + PATRON_MONTO,
+    re.IGNORECASE,
+)
+
+def _normalizar_monto(texto):
+    # Limpia separadores
+    cleaned = texto.replace(',', '').replace('.', '')
+    if len(cleaned) > 2:
+        # Asume los últimos 2 dígitos son decimales
+        cleaned = cleaned[:-2] + '.' + cleaned[-2:]
+    else:
+        cleaned = '0.' + cleaned.zfill(2)
+    return Decimal(cleaned)
+
+def _montos_de_pagina(texto):
+    """Devuelve (monto junto a un ancla "Total" o None, último monto de la página o None)."""
+    texto = texto or ''
+    anclas = PATRON_TOTAL.findall(texto)
+    montos = re.findall(PATRON_MONTO, texto)
+    return (anclas[-1] if anclas else None), (montos[-1] if montos else None)
+
+def _montos_de_paginas(origen, indices):
+    """Para el pool de procesos: abre el PDF (ruta o bytes) y analiza las páginas `indices`, de la última a la primera."""
+    resultados = []
+    with pdfplumber.open(origen if isinstance(origen, str) else io.BytesIO(origen)) as pdf:
+        for indice in sorted(indices, reverse=True):
+            resultados.append(_montos_de_pagina(pdf.pages[indice].extract_text()))
+            pdf.pages[indice].flush_cache()
+    return resultados
+
+def _buscar_total_en_paralelo(file, cantidad_paginas, procesos):
+    """
+    Reparte las páginas en bloques consecutivos entre procesos. Los bloques se revisan desde
+    el final: el primero con un ancla da el total; los bloques anteriores que no empezaron se
+    cancelan y no se espera a los que están corriendo.
+    """
+    # Con la subida en disco cada proceso abre el archivo por su ruta; si no, recibe los bytes
+    origen = _ruta_en_disco(file)
+    if origen is None:
+        file.seek(0)
+        origen = file.read()
+    tamanio_bloque = max(1, math.ceil(cantidad_paginas / procesos))
+    bloques = [range(inicio, min(inicio + tamanio_bloque, cantidad_paginas))
+               for inicio in range(0, cantidad_paginas, tamanio_bloque)]
+    respaldo = None
+    executor = ProcessPoolExecutor(max_workers=procesos)
+    try:
+        futuros = [executor.submit(_montos_de_paginas, origen, list(bloque)) for bloque in reversed(bloques)]
+        for futuro in futuros:
+            for ancla, ultimo in futuro.result():
+                if ancla:
+                    return ancla
+                respaldo = respaldo or ultimo
+        return respaldo
+    finally:
+        # Sin esperar: salir del `with` bloquearía hasta que terminen los bloques que ya corren
+        executor.shutdown(wait=False, cancel_futures=True)
+
 def extract_total_from_pdf(file):
     """
     Extrae el monto total de un archivo PDF.
-    Busca patrones numéricos en el texto extraído.
+
+    Recorre las páginas desde la última y corta en la primera que tenga un monto junto a
+    un ancla tipo "Total" (en una factura suele ser la última página). Si ninguna página
+    tiene ancla, usa el último monto del documento, como antes. Los PDF con al menos
+    PDF_POOL_MIN_PAGES páginas se analizan en un pool de procesos (0 lo desactiva).
     """
     try:
-        with pdfplumber.open(file) as pdf:
-            text = ''
-            for page in pdf.pages:
-                text += page.extract_text() or ''
-
-        # Busca números decimales o enteros en el texto
-        # Patrón para montos: números con o sin decimales, opcionalmente con separadores
-        pattern = r'(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)'
-        matches = re.findall(pattern, text)
-
-        if matches:
-            # Toma el último match como posible total
-            last_match = matches[-1]
-            # Limpia separadores
-            cleaned = last_match.replace(',', '').replace('.', '')
-            if len(cleaned) > 2:
-                # Asume los últimos 2 dígitos son decimales
-                cleaned = cleaned[:-2] + '.' + cleaned[-2:]
-            else:
-                cleaned = '0.' + cleaned.zfill(2)
-            return Decimal(cleaned)
+        minimo_para_pool = getattr(settings, 'PDF_POOL_MIN_PAGES', 0)
+        monto = None
+        with pdfplumber.open(_ruta_en_disco(file) or file) as pdf:
+            cantidad_paginas = len(pdf.pages)
+            if not (minimo_para_pool and cantidad_paginas >= minimo_para_pool):
+                for page in reversed(pdf.pages):
+                    ancla, ultimo = _montos_de_pagina(page.extract_text())
+                    page.flush_cache()  # Libera los objetos de la página ya analizada
+                    if ancla:
+                        monto = ancla
+                        break
+                    # Sin ancla: el último monto del documento es el de la última página que tenga alguno
+                    monto = monto or ultimo
+        if minimo_para_pool and cantidad_paginas >= minimo_para_pool:
+            monto = _buscar_total_en_paralelo(file, cantidad_paginas, getattr(settings, 'PDF_POOL_PROCESSES', 4))
+
+        if monto:
+            return _normalizar_monto(monto)
 
         raise ValueError("No se encontró un monto en el archivo PDF.")
 
     except Exception as e:
         raise ValueError(f"Error procesando archivo PDF: {str(e)}")
 
+# Exportaciones de texto (ARCA / ATM): separador de campos más probable primero
+SEPARADORES_CSV = ';,\t|'
+BLOQUE_TEXTO = 64 * 1024
+# Encabezados que identifican la columna del total, en orden de preferencia
+COLUMNAS_TOTAL = ('TOTAL', 'IMPORTE TOTAL', 'MONTO TOTAL', 'IMPORTE', 'MONTO')
+BOMS_UTF16 = (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
+class _DialectoPuntoYComa(csv.excel):
+    # Lo habitual en exportaciones argentinas: la coma es el separador decimal
+    delimiter = ';'
+
+def _normalizar_encabezado(texto):
+    sin_tildes = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode()
+    return ' '.join(sin_tildes.upper().replace('.', ' ').split())
+
+def _monto_ar(texto):
+    """
+    '1.234,56' -> Decimal('1234.56'). Igual que `procesar_excel_rentas` (decimal=',' y
+    thousands='.'): el punto siempre es separador de miles. None si no es un monto.
+    """
+    texto = (texto or '').strip().replace('$', '').replace(' ', '').replace('\xa0', '')
+    negativo = texto.startswith('(') and texto.endswith(')')
+    texto = texto.strip('()')
+    try:
+        monto = Decimal(texto.replace('.', '').replace(',', '.')) if texto else None
+    except InvalidOperation:
+        return None
+    if monto is None or not monto.is_finite():
+        return None
+    return -monto if negativo else monto
+
+def _lineas_de_texto(origen, encoding):
+    """Líneas (con su fin de línea, como espera `csv.reader`) leídas por bloques: memoria constante."""
+    decodificador = codecs.getincrementaldecoder(encoding)(errors='replace')
+    pendiente = ''
+    for bloque in iter(lambda: origen.read(BLOQUE_TEXTO), b''):
+        pendiente += decodificador.decode(bloque)
+        lineas = pendiente.splitlines(keepends=True)
+        # La última línea puede estar cortada (o terminar en \r de un \r\n partido)
+        pendiente = lineas.pop() if lineas and not lineas[-1].endswith('\n') else ''
+        yield from lineas
+    pendiente += decodificador.decode(b'', final=True)
+    if pendiente:
+        yield pendiente
+
+def _encoding_de_muestra(muestra):
+    if muestra.startswith(BOMS_UTF16):
+        return 'utf-16'
+    # Si la muestra no es UTF-8 válido (salvo un carácter cortado al final), es Windows-1252
+    try:
+        muestra.decode('utf-8')
+    except UnicodeDecodeError as e:
+        if e.start < len(muestra) - 3:
+            return 'cp1252'
+    return 'utf-8-sig'
+
+def extract_total_from_csv(file):
+    """
+    Extrae el monto total de una exportación CSV/TXT (ej. retenciones y percepciones de ARCA o ATM).
+
+    Separador y encoding se detectan con una muestra del principio. Si hay una columna TOTAL
+    (o IMPORTE/MONTO) se suma esa columna en todas las filas; si no hay encabezado, se usa el
+    primer monto de la última fila que tenga uno, como en Excel. Las filas se leen de a una:
+    la memoria no crece con el tamaño del archivo.
+    """
+    try:
+        limite = _verificar_tamanio(file)
+        ruta = _ruta_en_disco(file)
+        origen = open(ruta, 'rb') if ruta else _LecturaLimitada(file, limite)
+        try:
+            if ruta is None:
+                file.seek(0)
+            muestra = origen.read(BLOQUE_TEXTO)
+            origen.seek(0)
+            encoding = _encoding_de_muestra(muestra)
+            texto_muestra = muestra.decode(encoding, errors='replace')
+            try:
+                dialecto = csv.Sniffer().sniff(texto_muestra, delimiters=SEPARADORES_CSV)
+            except csv.Error:
+                dialecto = _DialectoPuntoYComa
+
+            filas = csv.reader(_lineas_de_texto(origen, encoding), dialecto)
+            encabezado = next(filas, None)
+            if encabezado is None:
+                raise ValueError("El archivo está vacío.")
+            columnas = [_normalizar_encabezado(nombre) for nombre in encabezado]
+            indice_total = next((columnas.index(nombre) for nombre in COLUMNAS_TOTAL if nombre in columnas), None)
+
+            if indice_total is not None:
+                total, encontrados = Decimal('0'), 0
+                for fila in filas:
+                    monto = _monto_ar(fila[indice_total]) if indice_total < len(fila) else None
+                    if monto is not None:
+                        total += monto
+                        encontrados += 1
+                if encontrados:
+                    return total
+                raise ValueError(f"La columna {encabezado[indice_total].strip()} no tiene montos.")
+
+            # Sin columna de total: la primera fila también puede ser de datos
+            ultimo_monto = None
+            for fila in itertools.chain([encabezado], filas):
+                ultimo_monto = next((monto for monto in map(_monto_ar, fila) if monto), None) or ultimo_monto
+            if ultimo_monto is not None:
+                return ultimo_monto
+            raise ValueError("No se encontró un monto en el archivo de texto.")
+        finally:
+            if ruta:
+                origen.close()
+
+    except Exception as e:
+        raise ValueError(f"Error procesando archivo CSV/TXT: {str(e)}")
+
+def detectar_tipo(file):
+    """
+    'excel', 'pdf', 'csv' o None según el contenido (firma de los primeros bytes); la
+    extensión solo desempata cuando el contenido no alcanza para decidir.
+    """
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    cabecera = file.read(1024) if hasattr(file, 'read') else b''
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    if b'%PDF-' in cabecera:
+        return 'pdf'
+    if cabecera.startswith((b'PK\x03\x04', b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1')):
+        return 'excel'
+    if cabecera.startswith(BOMS_UTF16) or (cabecera and b'\x00' not in cabecera):
+        return 'csv'
+    return file_type(getattr(file, 'name', '') or '')
+
 def extract_total_from_file(file):
     """
     Función general para extraer total de cualquier archivo soportado.
     """
-    filename = file.name.lower()
-    if filename.endswith(('.xlsx', '.xls')):
+    tipo = detectar_tipo(file)
+    if tipo == 'excel':
         return extract_total_from_excel(file)
-    elif filename.endswith('.pdf'):
+    elif tipo == 'pdf':
         return extract_total_from_pdf(file)
+    elif tipo == 'csv':
+        return extract_total_from_csv(file)
     else:
-        raise ValueError("Tipo de archivo no soportado. Solo Excel y PDF.")
\ No newline at end of file
+        raise ValueError("Tipo de archivo no soportado. Solo Excel, PDF y CSV/TXT.")
+
+def file_type(filename):
+    """'excel', 'pdf', 'csv' o None según la extensión del archivo."""
+    filename = filename.lower()
+    if filename.endswith(('.xlsx', '.xls')):
+        return 'excel'
+    elif filename.endswith('.pdf'):
+        return 'pdf'
+    elif filename.endswith(('.csv', '.txt')):
+        return 'csv'
+    return None
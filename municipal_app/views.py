@@ -1,7 +1,5 @@
 import logging
-import os
 import sys # Import sys to print path
-from decimal import Decimal, InvalidOperation # Added for amount validation
 
 from cryptography.fernet import Fernet
 
@@ -17,14 +15,12 @@ from django.conf import settings
 # Print sys.path for debugging
 print("sys.path in views.py:", sys.path)
 
-from .forms import MunicipalCredentialsForm, UserProfileForm, MisionesCredentialsForm, FileUploadForm
-from .models import MunicipalCredentials, ExecutionHistory, MisionesCredentials, MisionesExecutionHistory
-from .utils import extract_total_from_file
-from munibot import run_munibot
-try:
-    from rentabot import run_rentabot
-except ImportError:
-    run_rentabot = None
+from .forms import MunicipalCredentialsForm, UserProfileForm, MisionesCredentialsForm, FileUploadForm, BulkUploadForm
+from .models import MunicipalCredentials, ExecutionHistory, MisionesCredentials, MisionesExecutionHistory, BotJob
+from .upload_cache import extract_total_cached
+from .bulk_upload import procesar_carga_masiva
+from .upload_handlers import SubidaEnDiscoMixin
+from .jobs import enqueue_job, parse_amount
 
 logger = logging.getLogger(__name__)
 
@@ -105,7 +101,17 @@ class MunicipalCredentialsView(LoginRequiredMixin, generic.UpdateView):
                 messages.error(self.request, f"{form.fields[field].label}: {error}")
         return self.render_to_response(self.get_context_data(form=form))
 
-class EnterBillingView(LoginRequiredMixin, generic.TemplateView):
+class BotJobContextMixin:
+    """Agrega al contexto el trabajo indicado en `?job=<id>` para que la página consulte su estado."""
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        job_id = self.request.GET.get('job')
+        if job_id and job_id.isdigit():
+            context['job'] = BotJob.objects.filter(pk=job_id, user=self.request.user).first()
+        return context
+
+class EnterBillingView(LoginRequiredMixin, SubidaEnDiscoMixin, BotJobContextMixin, generic.TemplateView):
     template_name = 'municipal_app/enter_billing.html'
 
     def post(self, request, *args, **kwargs):
@@ -114,9 +120,14 @@ class EnterBillingView(LoginRequiredMixin, generic.TemplateView):
 
         # Manejar carga de archivo
         uploaded_file = request.FILES.get('file')
+        # Archivo rechazado mientras se recibía (tamaño o contenido inválido, ver upload_handlers)
+        if request.errores_subida:
+            messages.error(request, f'Error procesando archivo: {request.errores_subida[0][1]}')
+            logger.error(f"EnterBillingView: Archivo rechazado al recibirlo: {request.errores_subida[0][1]}")
+            return redirect('enter_billing')
         if uploaded_file:
             try:
-                extracted_monto = extract_total_from_file(uploaded_file)
+                extracted_monto = extract_total_cached(uploaded_file)
                 monto = str(extracted_monto)
                 messages.info(request, f'Monto extraído del archivo: {monto}')
                 logger.debug(f"EnterBillingView: Monto extraído del archivo: {monto}")
@@ -132,84 +143,46 @@ class EnterBillingView(LoginRequiredMixin, generic.TemplateView):
         logger.debug(f"EnterBillingView: POST request para usuario {user.username}")
         logger.debug(f"EnterBillingView: Monto final: {monto}")
 
-        execution_status = 'Failed'
-        execution_output = None
-        execution_error = None
-
-        try:
-            credentials = MunicipalCredentials.objects.get(user=user)
-            municipal_username = str(credentials.municipal_username or '')
-            
-            municipal_password_encrypted = credentials.municipal_password
-            municipal_password = ''
-            if f and municipal_password_encrypted:
-                try:
-                    municipal_password = f.decrypt(municipal_password_encrypted).decode()
-                    logger.debug(f"EnterBillingView: Contraseña descifrada para {user.username}.")
-                except Exception as decrypt_e:
-                    execution_error = f'Error al descifrar la contraseña: {decrypt_e}'
-                    logger.error(f"EnterBillingView: {execution_error}")
-                    messages.error(request, 'Error de seguridad: No se pudo descifrar la contraseña. Contacta al administrador.')
-                    raise
-            else:
-                execution_error = 'Error de seguridad: No se pudo descifrar la contraseña. Fernet no inicializado o contraseña vacía.'
-                logger.error(f"EnterBillingView: {execution_error}")
-                messages.error(request, 'Error de seguridad: No se pudo descifrar la contraseña. Contacta al administrador.')
-                raise Exception("Fernet not initialized or encrypted password missing.")
-
-            logger.debug(f"EnterBillingView: Credenciales recuperadas. Usuario: {municipal_username}, Contraseña (descifrada): {municipal_password[:10]}...")
-
-            monto_str = str(monto) if monto is not None else ''
-            logger.debug(f"EnterBillingView: Monto a pasar al script: {monto_str}")
-
-            # Ruta al driver de Edge
-            driver_path = os.path.join(settings.BASE_DIR, 'edgedriver_win64', 'msedgedriver.exe')
-            logger.debug(f"EnterBillingView: Usando driver path: {driver_path}")
-
-            # Ejecutar munibot.py directamente
-            run_status, run_output, run_error = run_munibot(municipal_username, municipal_password, monto_str, driver_path)
-
-            execution_status = run_status
-            execution_output = run_output
-            execution_error = run_error
-
-            if execution_status == 'Success':
-                logger.info(f"EnterBillingView: Script ejecutado con éxito. Salida: {execution_output}")
-                messages.success(request, 'El proceso de declaración jurada mensual se ha ejecutado correctamente.')
-            else:
-                logger.error(f"EnterBillingView: Error al ejecutar el script. Error: {execution_error}")
-                messages.error(request, f'Error al ejecutar el script: {execution_error}')
-
-        except MunicipalCredentials.DoesNotExist:
+        if not MunicipalCredentials.objects.filter(user=user).exists():
             execution_error = 'Credenciales de la municipalidad no encontradas.'
             logger.error(f"EnterBillingView: Error: {execution_error}")
+            ExecutionHistory.objects.create(user=user, amount=parse_amount(monto), status='Failed', error=execution_error)
             messages.error(request, 'Por favor, ingresa tus credenciales de la municipalidad primero.')
             return redirect('municipal_credentials')
-        except Exception as e:
-            execution_error = f'Ocurrió un error inesperado: {e}'
-            logger.error(f"EnterBillingView: Ocurrió un error inesperado: {e}")
-            messages.error(request, f'Ocurrió un error: {e}')
-        finally:
-            logger.debug(f"EnterBillingView: Guardando historial de ejecución. Estado: {execution_status}, Monto: {monto}, Error: {execution_error}")
-
-            amount_to_save = None
-            if monto:
-                try:
-                    amount_to_save = Decimal(monto)
-                except InvalidOperation:
-                    # El monto no es un número válido, se guarda como nulo
-                    logger.warning(f"Valor de monto no válido '{monto}' recibido del usuario {user.username}")
-                    amount_to_save = None
-
-            ExecutionHistory.objects.create(
-                user=user,
-                amount=amount_to_save, # Usar el valor validado
-                status=execution_status,
-                output=execution_output,
-                error=execution_error
-            )
-
-        return redirect('enter_billing')
+
+        # El bot se ejecuta en el worker (`manage.py run_bot_worker`); acá solo se encola.
+        job = enqueue_job(user, BotJob.PORTAL_POSADAS, monto)
+        messages.info(request, f'La declaración jurada mensual fue encolada (trabajo #{job.pk}). Te avisaremos cuando termine.')
+        return redirect(f'{reverse("enter_billing")}?job={job.pk}')
+
+class BulkUploadView(LoginRequiredMixin, SubidaEnDiscoMixin, generic.FormView):
+    """Extrae el total de muchos archivos de una vez (varios Excel/PDF o un ZIP) y muestra una tabla por archivo."""
+    form_class = BulkUploadForm
+    template_name = 'municipal_app/bulk_upload.html'
+
+    def form_valid(self, form):
+        # Los archivos rechazados mientras se recibían (tamaño o contenido inválido) no llegan al formulario
+        rechazados = [{'archivo': nombre, 'monto': None, 'error': error, 'cache': False}
+                      for nombre, error in self.request.errores_subida]
+        if not form.cleaned_data['files'] and not rechazados:
+            form.add_error('files', 'Debes subir al menos un archivo.')
+            return self.form_invalid(form)
+        try:
+            resultados = rechazados + procesar_carga_masiva(form.cleaned_data['files'])
+        except ValueError as e:
+            messages.error(self.request, f'Error procesando la carga: {e}')
+            logger.error(f"BulkUploadView: Error procesando la carga de {self.request.user.username}: {e}")
+            return self.render_to_response(self.get_context_data(form=form))
+
+        montos = [fila['monto'] for fila in resultados if fila['monto'] is not None]
+        logger.info(f"BulkUploadView: {len(resultados)} archivo(s) procesados para {self.request.user.username}, {len(montos)} con monto.")
+        return self.render_to_response(self.get_context_data(
+            form=self.form_class(),
+            resultados=resultados,
+            total=sum(montos),
+            con_monto=len(montos),
+            con_error=len(resultados) - len(montos),
+        ))
 
 class ExecutionHistoryView(LoginRequiredMixin, generic.ListView):
     model = ExecutionHistory
@@ -319,7 +292,7 @@ class MisionesCredentialsView(LoginRequiredMixin, generic.UpdateView):
                 messages.error(self.request, f"{form.fields[field].label}: {error}")
         return self.render_to_response(self.get_context_data(form=form))
 
-class EnterMisionesBillingView(LoginRequiredMixin, generic.TemplateView):
+class EnterMisionesBillingView(LoginRequiredMixin, SubidaEnDiscoMixin, BotJobContextMixin, generic.TemplateView):
     template_name = 'municipal_app/enter_misiones_billing.html'
 
     def post(self, request, *args, **kwargs):
@@ -328,105 +301,40 @@ class EnterMisionesBillingView(LoginRequiredMixin, generic.TemplateView):
 
         # Manejar carga de archivo
         uploaded_file = request.FILES.get('file')
+        # Archivo rechazado mientras se recibía (tamaño o contenido inválido, ver upload_handlers)
+        if request.errores_subida:
+            messages.error(request, f'Error procesando archivo: {request.errores_subida[0][1]}')
+            logger.error(f"EnterMisionesBillingView: Archivo rechazado al recibirlo: {request.errores_subida[0][1]}")
+            return redirect('enter_misiones')
         if uploaded_file:
             try:
-                extracted_monto = extract_total_from_file(uploaded_file)
+                extracted_monto = extract_total_cached(uploaded_file)
                 monto = str(extracted_monto)
                 messages.info(request, f'Monto extraído del archivo: {monto}')
                 logger.debug(f"EnterMisionesBillingView: Monto extraído del archivo: {monto}")
             except ValueError as e:
                 messages.error(request, f'Error procesando archivo: {e}')
                 logger.error(f"EnterMisionesBillingView: Error procesando archivo: {e}")
-                return redirect('enter_missions')
+                return redirect('enter_misiones')
         elif not monto:
             messages.error(request, 'Debes ingresar un monto manualmente o subir un archivo.')
             logger.error(f"EnterMisionesBillingView: No se proporcionó monto ni archivo")
-            return redirect('enter_missions')
+            return redirect('enter_misiones')
 
         logger.debug(f"EnterMisionesBillingView: POST request para usuario {user.username}")
         logger.debug(f"EnterMisionesBillingView: Monto final: {monto}")
 
-        execution_status = 'Failed'
-        execution_output = None
-        execution_error = None
-
-        try:
-            credentials = MisionesCredentials.objects.get(user=user)
-            misiones_username = str(credentials.misiones_username or '')
-            
-            misiones_password_encrypted = credentials.misiones_password
-            misiones_password = ''
-            if f and misiones_password_encrypted:
-                try:
-                    misiones_password = f.decrypt(misiones_password_encrypted).decode()
-                    logger.debug(f"EnterMisionesBillingView: Contraseña descifrada para {user.username}.")
-                except Exception as decrypt_e:
-                    execution_error = f'Error al descifrar la contraseña: {decrypt_e}'
-                    logger.error(f"EnterMisionesBillingView: {execution_error}")
-                    messages.error(self.request, 'Error de seguridad: No se pudo descifrar la contraseña. Contacta al administrador.')
-                    raise
-            else:
-                execution_error = 'Error de seguridad: No se pudo descifrar la contraseña. Fernet no inicializado o contraseña vacía.'
-                logger.error(f"EnterMisionesBillingView: {execution_error}")
-                messages.error(self.request, 'Error de seguridad: No se pudo descifrar la contraseña. Contacta al administrador.')
-                raise Exception("Fernet not initialized or encrypted password missing.")
-
-            logger.debug(f"EnterMisionesBillingView: Credenciales recuperadas. Usuario: {misiones_username}, Contraseña (descifrada): {misiones_password[:10]}...")
-
-            monto_str = str(monto) if monto is not None else ''
-            logger.debug(f"EnterMisionesBillingView: Monto a pasar al script: {monto_str}")
-
-            # Ruta al driver de Edge
-            driver_path = os.path.join(settings.BASE_DIR, 'edgedriver_win64', 'msedgedriver.exe')
-            logger.debug(f"EnterMisionesBillingView: Usando driver path: {driver_path}")
-
-            # Ejecutar rentabot.py directamente
-            if run_rentabot:
-                run_status, run_output, run_error = run_rentabot(misiones_username, misiones_password, monto_str, driver_path)
-            else:
-                run_status, run_output, run_error = ('Failed', 'rentabot not implemented yet', 'rentabot module not found')
-
-            execution_status = run_status
-            execution_output = run_output
-            execution_error = run_error
-
-            if execution_status == 'Success':
-                logger.info(f"EnterMisionesBillingView: Script ejecutado con éxito. Salida: {execution_output}")
-                messages.success(self.request, 'El proceso de declaración de facturación mensual en Renta Misiones se ha ejecutado correctamente.')
-            else:
-                logger.error(f"EnterMisionesBillingView: Error al ejecutar el script. Error: {execution_error}")
-                messages.error(self.request, f'Error al ejecutar el script: {execution_error}')
-
-        except MisionesCredentials.DoesNotExist:
+        if not MisionesCredentials.objects.filter(user=user).exists():
             execution_error = 'Credenciales de Renta Misiones no encontradas.'
             logger.error(f"EnterMisionesBillingView: Error: {execution_error}")
+            MisionesExecutionHistory.objects.create(user=user, amount=parse_amount(monto), status='Failed', error=execution_error)
             messages.error(self.request, 'Por favor, ingresa tus credenciales de Renta Misiones primero.')
             return redirect('misiones_credentials')
-        except Exception as e:
-            execution_error = f'Ocurrió un error inesperado: {e}'
-            logger.error(f"EnterMisionesBillingView: Ocurrió un error inesperado: {e}")
-            messages.error(self.request, f'Ocurrió un error: {e}')
-        finally:
-            logger.debug(f"EnterMisionesBillingView: Guardando historial de ejecución. Estado: {execution_status}, Monto: {monto}, Error: {execution_error}")
-
-            amount_to_save = None
-            if monto:
-                try:
-                    amount_to_save = Decimal(monto)
-                except InvalidOperation:
-                    # El monto no es un número válido, se guarda como nulo
-                    logger.warning(f"Valor de monto no válido '{monto}' recibido del usuario {user.username}")
-                    amount_to_save = None
-
-            MisionesExecutionHistory.objects.create(
-                user=user,
-                amount=amount_to_save, # Usar el valor validado
-                status=execution_status,
-                output=execution_output,
-                error=execution_error
-            )
-
-        return redirect('enter_missions')
+
+        # El bot se ejecuta en el worker (`manage.py run_bot_worker`); acá solo se encola.
+        job = enqueue_job(user, BotJob.PORTAL_MISIONES, monto)
+        messages.info(request, f'La declaración de Renta Misiones fue encolada (trabajo #{job.pk}). Te avisaremos cuando termine.')
+        return redirect(f'{reverse("enter_misiones")}?job={job.pk}')
 
 class MisionesHistoryView(LoginRequiredMixin, generic.ListView):
     model = MisionesExecutionHistory
@@ -652,6 +560,7 @@ class ChatbotView(LoginRequiredMixin, generic.TemplateView):
 import json
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.contrib.auth.decorators import login_required
 from .chatbot_rag import generar_respuesta_rag
 
 @csrf_exempt
@@ -677,3 +586,23 @@ def chatbot_api(request):
             return JsonResponse({'error': f'Error interno del servidor: {str(e)}'}, status=500)
 
     return JsonResponse({'error': 'Solo se permite el método POST.'}, status=405)
+
+
+@login_required
+def job_status_api(request, job_id):
+    """
+    Devuelve el estado de un trabajo de bot para que la página de facturación lo consulte (polling).
+    """
+    job = BotJob.objects.filter(pk=job_id, user=request.user).first()
+    if job is None:
+        return JsonResponse({'error': 'Trabajo no encontrado.'}, status=404)
+
+    return JsonResponse({
+        'id': job.pk,
+        'portal': job.portal,
+        'period': job.period,
+        'amount': str(job.amount) if job.amount is not None else None,
+        'status': job.status,
+        'result': job.result,
+        'error': job.error,
+    })
@@ -151,6 +151,64 @@ FERNET_KEY = os.getenv('FERNET_KEY')
 # ¡IMPORTANTE! Carga tu clave desde una variable de entorno en producción.
 # Por ahora, puedes ponerla aquí para desarrollo.
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+# Tipo de índice de la base de conocimiento del chatbot: flat (exacto), ivf o hnsw (aproximados)
+RAG_INDEX_TYPE = os.getenv('RAG_INDEX_TYPE', 'flat')
+# Indexación: fragmentos por llamada a la API de embeddings, llamadas en paralelo, reintentos
+# ante límites de tasa y cada cuántos lotes se guarda el avance (para retomar si se corta)
+RAG_EMBEDDING_BATCH_SIZE = int(os.getenv('RAG_EMBEDDING_BATCH_SIZE', '100'))
+RAG_EMBEDDING_WORKERS = int(os.getenv('RAG_EMBEDDING_WORKERS', '4'))
+RAG_EMBEDDING_MAX_RETRIES = int(os.getenv('RAG_EMBEDDING_MAX_RETRIES', '5'))
+RAG_EMBEDDING_CHECKPOINT_BATCHES = int(os.getenv('RAG_EMBEDDING_CHECKPOINT_BATCHES', '20'))
+# Embeddings de preguntas del chatbot que se guardan en memoria (LRU) y segundos que se reutilizan
+RAG_EMBEDDING_CACHE_SIZE = int(os.getenv('RAG_EMBEDDING_CACHE_SIZE', '512'))
+RAG_EMBEDDING_CACHE_TTL_SECONDS = int(os.getenv('RAG_EMBEDDING_CACHE_TTL_SECONDS', '3600'))
+# Cada cuántas consultas a las caches del chatbot se registra su tasa de aciertos en el log (0 = nunca)
+RAG_CACHE_STATS_EVERY = int(os.getenv('RAG_CACHE_STATS_EVERY', '100'))
+# Respuestas del chatbot que se reutilizan para preguntas equivalentes, y distancia coseno máxima
+# entre los embeddings de dos preguntas para considerarlas la misma (0 = solo preguntas idénticas)
+RAG_ANSWER_CACHE_SIZE = int(os.getenv('RAG_ANSWER_CACHE_SIZE', '256'))
+RAG_ANSWER_CACHE_MAX_DISTANCE = float(os.getenv('RAG_ANSWER_CACHE_MAX_DISTANCE', '0.05'))
+
+# --- Configuración del worker de bots ---
+# Navegadores Chromium headless que el worker mantiene abiertos, uno por trabajo en paralelo (0 = lanzar Edge en cada ejecución, de a uno)
+BOT_BROWSER_POOL_SIZE = int(os.getenv('BOT_BROWSER_POOL_SIZE', '1'))
+# Contextos servidos por navegador antes de reciclarlo
+BOT_BROWSER_MAX_CONTEXTS = int(os.getenv('BOT_BROWSER_MAX_CONTEXTS', '50'))
+# Minutos que se reutiliza la sesión (storage_state cifrado) de un login exitoso en los portales
+BOT_SESSION_TTL_MINUTES = int(os.getenv('BOT_SESSION_TTL_MINUTES', '30'))
+# Minutos en 'running' tras los cuales run_bot_worker, al arrancar, da un trabajo por perdido y lo marca fallido (0 = nunca)
+BOT_STALE_JOB_MINUTES = int(os.getenv('BOT_STALE_JOB_MINUTES', '60'))
+# Navegadores headless con depuración remota (CDP) que el worker lanza para rentabot (0 = usar el Edge abierto a mano en 9222)
+BOT_CDP_BROWSERS = int(os.getenv('BOT_CDP_BROWSERS', '1'))
+# Presentaciones simultáneas por portal cuando el worker usa el runner async (--concurrent)
+BOT_CONCURRENCY = {
+    'posadas': int(os.getenv('BOT_CONCURRENCY_POSADAS', '5')),
+    'misiones': int(os.getenv('BOT_CONCURRENCY_MISIONES', '2')),
+}
+# Filtro de red de los bots (imágenes, fuentes y hosts de terceros abortados); False lo desactiva si un portal cambia y deja de cargar
+BOT_FILTRO_RED = os.getenv('BOT_FILTRO_RED', 'True') == 'True'
+# Hosts extra que el filtro deja pasar además del dominio del portal, separados por coma (ej. 'cdn.portal.gob.ar,fonts.example.com')
+BOT_FILTRO_RED_HOSTS_EXTRA = [host.strip() for host in os.getenv('BOT_FILTRO_RED_HOSTS_EXTRA', '').split(',') if host.strip()]
+# Fase 1 de rentabot: pedir el Excel con un request HTTP directo (cookies del navegador) en lugar del botón
+BOT_RENTAS_DESCARGA_HTTP = os.getenv('BOT_RENTAS_DESCARGA_HTTP', 'False') == 'True'
+# Archivo columnar de las planillas de Rentas descargadas, por usuario y período (vacío = no se archivan)
+RENTAS_ARCHIVE_DIR = os.getenv('RENTAS_ARCHIVE_DIR', str(BASE_DIR / 'archivo_rentas')) or None
+# Líneas de Rentas por INSERT al guardarlas en la base después de cada descarga (bulk_create)
+RENTAS_LINES_BATCH_SIZE = int(os.getenv('RENTAS_LINES_BATCH_SIZE', '1000'))
+# Tamaño máximo (MB) de los archivos de facturación que se suben para extraer el monto
+MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE_MB', '10')) * 1024 * 1024
+# Tamaño máximo (MB) de un ZIP en la carga masiva (cada archivo de adentro sigue limitado por MAX_UPLOAD_SIZE)
+MAX_ZIP_UPLOAD_SIZE = int(os.getenv('MAX_ZIP_UPLOAD_SIZE_MB', '100')) * 1024 * 1024
+# Montos de archivos ya parseados que se guardan (por hash del contenido) antes de descartar los menos usados
+UPLOAD_CACHE_MAX_ENTRIES = int(os.getenv('UPLOAD_CACHE_MAX_ENTRIES', '500'))
+# PDFs con al menos esta cantidad de páginas se analizan en un pool de procesos (0 = nunca)
+PDF_POOL_MIN_PAGES = int(os.getenv('PDF_POOL_MIN_PAGES', '0'))
+PDF_POOL_PROCESSES = int(os.getenv('PDF_POOL_PROCESSES', '4'))
+# Carga masiva: procesos que parsean los archivos en paralelo (1 = en el proceso web) y archivos por carga
+BULK_UPLOAD_PROCESSES = int(os.getenv('BULK_UPLOAD_PROCESSES', '4'))
+BULK_UPLOAD_MAX_FILES = int(os.getenv('BULK_UPLOAD_MAX_FILES', '100'))
+# Procesos en paralelo de `manage.py file_period` (presentación masiva de un período)
+BOT_FILE_PERIOD_PROCESSES = int(os.getenv('BOT_FILE_PERIOD_PROCESSES', '2'))
 
 # Configuración de Logging para depuración
 LOGGING = {
@@ -1,42 +1,59 @@
 # rentabot_playwright.py
 
+import asyncio
 import os
+import re
 import time
+import numpy as np
 import pandas as pd
 from playwright.sync_api import sync_playwright
 from datetime import datetime, timedelta
 from pathlib import Path
 
+from bot_network import POLITICAS_RED
+from descarga_http import JS_FORMULARIO_DEL_BOTON, armar_request, descargar_planilla
+from bot_steps import EnHilo, Esperar, MedidorPasos, MotorPasos, Paso, PasoFatal, pasos_async, pasos_sync
+import rentas_archive
+
 # ==============================================================================
-# FUNCIÓN PARA PROCESAR EL ARCHIVO EXCEL (sin cambios)
+# FUNCIÓN PARA PROCESAR EL ARCHIVO EXCEL
 # ==============================================================================
+TIPOS_RENTAS = ('PERCEPCIÓN', 'RETENCIÓN')
+
+def _leer_rentas(ruta_archivo):
+    df = pd.read_excel(ruta_archivo, decimal=',', thousands='.')
+    df.columns = [str(col).strip() for col in df.columns]
+    return df
+
+def _columna_o_vacia(df, nombre):
+    return df[nombre] if nombre in df.columns else pd.Series(np.nan, index=df.index)
+
+def clasificar_tipos(df):
+    """
+    Tipo de cada línea, por columnas: con alícuota es PERCEPCIÓN, con coeficiente es
+    RETENCIÓN y el resto OTRO (misma regla que antes se aplicaba fila por fila).
+    """
+    condiciones = [_columna_o_vacia(df, 'ALÍC.').notna(), _columna_o_vacia(df, 'COEF.').notna()]
+    return pd.Series(np.select(condiciones, list(TIPOS_RENTAS), default='OTRO'), index=df.index)
+
+def totales_por_tipo(df):
+    """Suma de TOTAL por tipo; None si no hay líneas."""
+    if df.empty:
+        return None
+    sumas = pd.to_numeric(df['TOTAL'], errors='coerce').groupby(clasificar_tipos(df)).sum()
+    return {tipo: float(sumas.get(tipo, 0.0)) for tipo in TIPOS_RENTAS}
+
 def procesar_excel_rentas(ruta_archivo):
     try:
         print("\n--- INICIANDO PROCESAMIENTO DEL ARCHIVO EXCEL ---")
-        df = pd.read_excel(ruta_archivo, decimal=',', thousands='.')
-        df.columns = [col.strip() for col in df.columns]
-
-        totales = {'PERCEPCIÓN': 0.0, 'RETENCIÓN': 0.0}
-
-        def clasificar_por_columna(row):
-            if pd.notna(row.get('ALÍC.')): return 'PERCEPCIÓN'
-            elif pd.notna(row.get('COEF.')): return 'RETENCIÓN'
-            else: return 'OTRO'
-            
-        df['TIPO'] = df.apply(clasificar_por_columna, axis=1)
+        totales = totales_por_tipo(_leer_rentas(ruta_archivo))
         
-        resultados = df.groupby('TIPO').agg({'TOTAL': 'sum'}).reset_index()
-        
-        if resultados.empty:
+        if totales is None:
             print("No se encontraron datos para procesar.")
             return None
 
         print("\n✅ RESUMEN EXTRAÍDO DEL ARCHIVO:")
-        for index, fila in resultados.iterrows():
-            tipo = fila['TIPO']
-            total_monto = fila['TOTAL']
-            if tipo in totales:
-                totales[tipo] = total_monto
+        for tipo, total_monto in totales.items():
             print(f"Total {tipo}: {total_monto:,.2f}")
         
         print("-" * 40)
@@ -47,223 +64,587 @@ def procesar_excel_rentas(ruta_archivo):
         print(f"Error inesperado al procesar el archivo Excel: {e}")
         return None
 
+def _periodos(df, ruta_archivo):
+    """Período 'YYYY-MM' de cada línea según FECHA; si falta, el del nombre del archivo (Rentas_YYYY-MM.xlsx)."""
+    fechas = _columna_o_vacia(df, 'FECHA')
+    if not pd.api.types.is_datetime64_any_dtype(fechas):
+        fechas = pd.to_datetime(fechas, format='%d/%m/%Y', errors='coerce')
+    periodos = fechas.dt.strftime('%Y-%m')
+    del_nombre = re.search(r'(\d{4})-(\d{2})', os.path.basename(str(ruta_archivo)))
+    return periodos.fillna(del_nombre.group(0) if del_nombre else 'SIN PERÍODO')
+
+def _lineas_rentas(df, ruta_archivo):
+    """Período, tipo y monto de cada línea de una planilla de Rentas."""
+    return pd.DataFrame({
+        'PERIODO': _periodos(df, ruta_archivo),
+        'TIPO': clasificar_tipos(df),
+        'TOTAL': pd.to_numeric(df['TOTAL'], errors='coerce'),
+    })
+
+def _totales_por_periodo(lineas):
+    tabla = (lineas.pivot_table(index='PERIODO', columns='TIPO', values='TOTAL', aggfunc='sum', fill_value=0.0, observed=True)
+             .reindex(columns=list(TIPOS_RENTAS), fill_value=0.0)
+             .sort_index())
+    return {str(periodo): {tipo: float(valor) for tipo, valor in fila.items()}
+            for periodo, fila in tabla.to_dict(orient='index').items()}
+
+def procesar_rentas_periodos(rutas_archivos):
+    """
+    Totales de varios archivos de Rentas (uno o más períodos) en una sola agregación.
+
+    Returns:
+        dict: {'YYYY-MM': {'PERCEPCIÓN': float, 'RETENCIÓN': float}}, ordenado por período.
+    """
+    marcos = [_lineas_rentas(_leer_rentas(ruta), ruta) for ruta in rutas_archivos]
+    if not marcos:
+        return {}
+    return _totales_por_periodo(pd.concat(marcos, ignore_index=True))
+
+def leer_lineas_rentas(ruta_archivo):
+    """Planilla de Rentas con las columnas originales más PERIODO, TIPO y TOTAL (numérico) ya calculados."""
+    df = _leer_rentas(ruta_archivo)
+    lineas = _lineas_rentas(df, ruta_archivo)
+    return df.assign(PERIODO=lineas['PERIODO'], TIPO=lineas['TIPO'], TOTAL=lineas['TOTAL'])
+
+def archivar_excel_rentas(ruta_archivo, directorio_archivo, usuario, periodo=None):
+    """
+    Lee la planilla una vez y la guarda en el archivo columnar (ver `rentas_archive`), con las
+    columnas originales más PERIODO y TIPO ya calculados. `periodo` es el de la consulta
+    (por defecto, el del nombre Rentas_YYYY-MM.xlsx).
+
+    Returns:
+        DataFrame: Las líneas archivadas (sirve para calcular los totales sin releer el archivo).
+    """
+    if periodo is None:
+        del_nombre = re.search(r'\d{4}-\d{2}', os.path.basename(str(ruta_archivo)))
+        periodo = del_nombre.group(0) if del_nombre else None
+    df = leer_lineas_rentas(ruta_archivo)
+    rentas_archive.guardar_particion(df, directorio_archivo, usuario, periodo)
+    return df
+
+def totales_rentas_archivadas(directorio_archivo, usuario, desde=None, hasta=None):
+    """
+    Igual que `procesar_rentas_periodos`, pero desde el archivo columnar: lee solo las
+    columnas PERIODO, TIPO y TOTAL del usuario, y solo las líneas cuyo PERIODO (el de su
+    FECHA, que es por el que se agrupa) está entre `desde` y `hasta` (YYYY-MM). Una
+    descarga puede traer líneas de otros meses, así que no alcanza con elegir particiones.
+    """
+    filtros = None
+    if desde or hasta:
+        # Los límites por defecto también dejan afuera las líneas 'SIN PERÍODO'
+        filtros = [('PERIODO', '>=', desde or '0000-01'), ('PERIODO', '<=', hasta or '9999-12')]
+    lineas = rentas_archive.cargar(directorio_archivo, usuario, columnas=['PERIODO', 'TIPO', 'TOTAL'], filtros=filtros)
+    if lineas.empty:
+        return {}
+    return _totales_por_periodo(lineas)
+
+URL_CONSULTAS_RET_PERC = "https://extranet.atm.misiones.gob.ar/Extranet/Aplicaciones/consultas_ret_perc.php"
+CELDA_OBLIGACION = 'td[role="gridcell"][aria-describedby="obligaciones_grid_i_impuesto_det"][title="0,00"]'
+
+# Login de la extranet de ATM (solo se usa cuando no hay una sesión guardada válida)
+URL_LOGIN_MISIONES = "https://extranet.atm.misiones.gob.ar/Extranet/"
+CAMPO_USUARIO_LOGIN = 'input[name="usuario"], input[name="username"], input[type="text"]'
+CAMPO_CLAVE_LOGIN = 'input[type="password"]'
+BOTON_LOGIN = 'button[type="submit"], input[type="submit"]'
+BOTON_EXCEL = "#btn_excel"
+
+# Navegador abierto a mano con --remote-debugging-port (modo heredado, sin credenciales)
+DEBUG_PORT_MANUAL = "http://127.0.0.1:9222"
+
+# ==============================================================================
+# PRESUPUESTOS DE ESPERA POR PASO (ms)
+# ==============================================================================
+# Cada paso espera una condición concreta de la pantalla (fila de la grilla visible,
+# modal adjunto, listado cerrado...) en lugar de dormir un tiempo fijo. Si la condición
+# no se cumple dentro del presupuesto, el paso falla con timeout.
+TIMEOUTS_PASOS = {
+    'login': 30000,
+    'consulta_periodo': 30000,
+    'descarga_excel': 60000,
+    'menu_lateral': 5000,
+    'ingresos_brutos': 5000,
+    'presentacion_ddjj': 10000,
+    'buscar_obligacion': 20000,
+    'editar_obligacion': 10000,
+    'agregar_rubro': 10000,
+    'actividad': 10000,
+    'facturacion': 5000,
+    'base_imponible': 5000,
+    'alicuota': 5000,
+    'bonificacion': 5000,
+    'guardar': 15000,
+}
+
+def _elegir_opcion_lupa(page, lupa_selector, opcion_selector, timeout):
+    """Abre un listado de lupa, elige la opción y espera a que el listado se cierre."""
+    lupa_locator = page.locator(lupa_selector)
+    yield lupa_locator.wait_for(state="visible", timeout=timeout)
+    yield lupa_locator.click()
+    opcion_locator = page.locator(opcion_selector)
+    yield opcion_locator.wait_for(state="visible", timeout=timeout)
+    yield opcion_locator.click()
+    yield opcion_locator.wait_for(state="hidden", timeout=timeout)
+
+def _requiere_login(page):
+    """La extranet muestra el formulario de login en lugar de la consulta cuando no hay sesión."""
+    return (yield page.locator("#periodo_desde").count()) == 0 and (yield page.locator(CAMPO_CLAVE_LOGIN).count()) > 0
+
+def _asegurar_sesion(page, misiones_username, misiones_password, session_store, sesion_guardada, timeout, output_messages):
+    """
+    Deja la página en la consulta de retenciones/percepciones con una sesión válida.
+    Usa la sesión guardada si el portal la acepta; si no, hace login con las credenciales.
+    """
+    yield page.goto(URL_CONSULTAS_RET_PERC, timeout=timeout)
+    if not (yield from _requiere_login(page)):
+        output_messages.append("Sesión guardada reutilizada (sin login)." if sesion_guardada else "Sesión activa en el navegador.")
+        return
+
+    if sesion_guardada:
+        output_messages.append("La sesión guardada fue rechazada. Haciendo login completo...")
+        yield EnHilo(session_store.clear)
+    if not misiones_username:
+        raise PasoFatal("No hay sesión de Renta Misiones y no se recibieron credenciales para iniciarla.")
+
+    yield page.goto(URL_LOGIN_MISIONES, timeout=timeout)
+    yield page.locator(CAMPO_USUARIO_LOGIN).first.fill(misiones_username, timeout=timeout)
+    yield page.locator(CAMPO_CLAVE_LOGIN).first.fill(misiones_password, timeout=timeout)
+    yield page.locator(BOTON_LOGIN).first.click(timeout=timeout)
+    yield page.wait_for_load_state("load", timeout=timeout)
+    output_messages.append("Login en Renta Misiones hecho.")
+
+    yield page.goto(URL_CONSULTAS_RET_PERC, timeout=timeout)
+    if (yield from _requiere_login(page)):
+        raise PasoFatal("El portal rechazó el login. Revisá las credenciales de Renta Misiones.")
+    if session_store is not None:
+        yield EnHilo(session_store.save, (yield page.context.storage_state()))
+        output_messages.append("Sesión guardada para las próximas ejecuciones.")
+
+def _descargar_excel_http(page, destino, timeout, output_messages):
+    """
+    Fase 1 en un solo request: reproduce el formulario de 'GENERAR EXCEL' con las cookies
+    del contexto y guarda la respuesta en `destino`. Devuelve None si hay que usar la interfaz.
+    """
+    formulario = yield page.evaluate(JS_FORMULARIO_DEL_BOTON, BOTON_EXCEL)
+    request = None
+    if formulario is not None:
+        request = armar_request(formulario, (yield page.context.cookies(formulario['action'])),
+                                (yield page.evaluate("navigator.userAgent")), page.url)
+    archivo = (yield EnHilo(descargar_planilla, request, destino, timeout / 1000)) if request is not None else None
+    if archivo is None:
+        output_messages.append("La descarga directa no devolvió una planilla. Usando 'GENERAR EXCEL' en la página...")
+    else:
+        output_messages.append("Excel descargado por HTTP con la sesión del navegador.")
+    return archivo
+
+# ==============================================================================
+# PASOS DEL FLUJO (cada uno reintentable; ver bot_steps.MotorPasos)
+# ==============================================================================
+# `estado` lleva la página, los mensajes y lo que cada paso deja para los siguientes
+# (archivo descargado, datos a declarar). Al reanudar desde un punto de control, lo
+# obtenido antes de ese punto no se vuelve a pedir al portal.
+def _estado_inicial(page, output_messages, misiones_username, misiones_password, session_store, sesion_guardada,
+                    directorio_descargas, descarga_http, base_imponible, directorio_archivo=None, al_procesar=None,
+                    periodo=None, usuario_archivo=None):
+    # Sin período ('YYYY-MM') explícito se declara el mes anterior
+    if periodo:
+        mes_a_declarar = datetime.strptime(periodo, "%Y-%m")
+    else:
+        mes_a_declarar = datetime.today().replace(day=1) - timedelta(days=1)
+    return {
+        'page': page,
+        'output': output_messages,
+        'misiones_username': misiones_username,
+        'misiones_password': misiones_password,
+        'session_store': session_store,
+        'sesion_guardada': sesion_guardada,
+        'directorio_descargas': directorio_descargas,
+        'descarga_http': descarga_http,
+        'directorio_archivo': directorio_archivo,
+        'usuario_archivo': usuario_archivo,
+        'al_procesar': al_procesar,
+        'base_imponible': base_imponible,
+        'mes_a_declarar': mes_a_declarar,
+        'periodo_consulta': mes_a_declarar.strftime("%Y/%m"),
+        'archivo': None,
+        'datos_ddjj': None,
+    }
+
+def _volver_a_consulta(estado, timeout):
+    """Recarga la consulta: cierra menús y modales a medio usar antes de repetir un paso."""
+    yield estado['page'].goto(URL_CONSULTAS_RET_PERC, timeout=timeout)
+
+def _paso_login(estado, timeout):
+    # La sesión guardada se prueba una sola vez: si este paso se reintenta, ya fue usada o descartada
+    sesion_guardada, estado['sesion_guardada'] = estado['sesion_guardada'], False
+    yield from _asegurar_sesion(estado['page'], estado['misiones_username'], estado['misiones_password'],
+                                estado['session_store'], sesion_guardada, timeout, estado['output'])
+
+def _paso_consulta_periodo(estado, timeout):
+    page, output_messages, periodo_consulta = estado['page'], estado['output'], estado['periodo_consulta']
+    # --- FASE 1: OBTENCIÓN DE DATOS DE RENTAS ---
+    output_messages.append("\n--- INICIANDO FASE 1: OBTENCIÓN DE DATOS DE RENTAS ---")
+    output_messages.append(f"Calculando período a consultar: {periodo_consulta}")
+    # Ingreso de período (la página de consulta ya quedó abierta tras validar la sesión)
+    yield page.locator("#periodo_desde").wait_for(state="visible", timeout=timeout)
+    yield page.fill("#periodo_desde", periodo_consulta)
+    yield page.fill("#periodo_hasta", periodo_consulta)
+    output_messages.append("Período ingresado.")
+
+def _limpiar_descargas(directorio_descargas):
+    for f in os.listdir(directorio_descargas):
+        if f.endswith(('.xlsx', '.xls')):
+            os.remove(os.path.join(directorio_descargas, f))
+
+def _paso_descarga_excel(estado, timeout):
+    page, output_messages, directorio_descargas = estado['page'], estado['output'], estado['directorio_descargas']
+    # Limpieza de archivos antiguos
+    yield EnHilo(_limpiar_descargas, directorio_descargas)
+
+    # Click en GENERAR EXCEL y espera descarga (o request directo, si está activado)
+    nombre_nuevo = os.path.join(directorio_descargas, f"Rentas_{estado['periodo_consulta'].replace('/', '-')}.xlsx")
+    archivo_descargado = None
+    if estado['descarga_http']:
+        archivo_descargado = yield from _descargar_excel_http(page, nombre_nuevo, timeout, output_messages)
+    if archivo_descargado is None:
+        output_messages.append("Haciendo clic en 'GENERAR EXCEL'... Esperando la descarga...")
+        download = yield Esperar(page.expect_download(timeout=timeout), lambda: page.click(BOTON_EXCEL))
+
+        # Renombrar archivo descargado
+        yield download.save_as(nombre_nuevo)
+        archivo_descargado = nombre_nuevo
+    output_messages.append(f"¡Archivo descargado y renombrado!: {archivo_descargado}")
+    estado['archivo'] = archivo_descargado
+
+def _registrar_datos(estado, datos_ddjj):
+    if datos_ddjj is None:
+        raise PasoFatal("No se pudieron procesar los datos de Rentas. No se puede continuar.")
+    estado['datos_ddjj'] = datos_ddjj
+    estado['output'].append(f"Datos a declarar recuperados: Retenciones={datos_ddjj.get('RETENCIÓN', 0):,.2f}, Percepciones={datos_ddjj.get('PERCEPCIÓN', 0):,.2f}")
+
+def _procesar_excel(estado):
+    """
+    Totales a declarar. Con archivo histórico o `al_procesar`, la planilla se lee una sola vez:
+    el mismo DataFrame se archiva, se entrega a `al_procesar(df, periodo)` y da los totales.
+    """
+    archivar = bool(estado['directorio_archivo']) and estado.get('usuario_archivo') is not None
+    if not (archivar or estado.get('al_procesar')):
+        return procesar_excel_rentas(estado['archivo'])
+    periodo = estado['periodo_consulta'].replace('/', '-')
+    try:
+        df = leer_lineas_rentas(estado['archivo'])
+    except Exception as e:
+        estado['output'].append(f"No se pudo leer la planilla de Rentas: {e}")
+        return procesar_excel_rentas(estado['archivo'])
+    # Ni el archivo histórico ni el guardado de las líneas deben frenar la presentación
+    if archivar:
+        try:
+            rentas_archive.guardar_particion(df, estado['directorio_archivo'], estado['usuario_archivo'], periodo)
+            estado['output'].append(f"Planilla archivada en {estado['directorio_archivo']} ({len(df)} líneas).")
+        except Exception as e:
+            estado['output'].append(f"No se pudo archivar la planilla de Rentas: {e}")
+    if estado.get('al_procesar'):
+        try:
+            estado['al_procesar'](df, periodo)
+        except Exception as e:
+            estado['output'].append(f"No se pudieron guardar las líneas de Rentas: {e}")
+    return totales_por_tipo(df)
+
+def _paso_procesar_excel(estado, timeout):
+    # El parseo con pandas es CPU: en la versión async corre en un hilo para no frenar las otras presentaciones
+    _registrar_datos(estado, (yield EnHilo(_procesar_excel, estado)))
+
+def _paso_menu_lateral(estado, timeout):
+    page = estado['page']
+    # --- FASE 2: NAVEGACIÓN Y PRESENTACIÓN DE DDJJ ---
+    estado['output'].append("\n--- INICIANDO FASE 2: PRESENTACIÓN DE DDJJ ---")
+    # Paso 1: Abrir menú hamburger (listo cuando "Ingresos Brutos" es visible)
+    yield page.click(".menu-toggler")
+    estado['output'].append("Abriendo el menú lateral (clic en el 'hamburger')...")
+    yield page.get_by_text("Ingresos Brutos").wait_for(state="visible", timeout=timeout)
+
+def _paso_ingresos_brutos(estado, timeout):
+    page = estado['page']
+    # Paso 2: Clic directo en "Ingresos Brutos" (listo cuando el submenú se expande)
+    yield page.get_by_text("Ingresos Brutos").click()
+    estado['output'].append("Clic en 'Ingresos Brutos' para expandir...")
+    yield page.get_by_text("Presentación DDJJ (IIBB Directo)").wait_for(state="visible", timeout=timeout)
+
+def _paso_presentacion_ddjj(estado, timeout):
+    page, output_messages = estado['page'], estado['output']
+    # Paso 3: Clic en submenú "Presentación DDJJ (IIBB Directo)" (listo cuando aparece el filtro de período)
+    yield page.get_by_text("Presentación DDJJ (IIBB Directo)").click()
+    output_messages.append("Haciendo clic en 'Presentación DDJJ (IIBB Directo)'...")
+    yield page.locator("#mes_pos_fiscal").wait_for(state="visible", timeout=timeout)
+    output_messages.append("✅ Navegación a Presentación DDJJ completada.")
+
+def _paso_buscar_obligacion(estado, timeout):
+    page, output_messages = estado['page'], estado['output']
+    # Poner fecha/período
+    periodo_mes = estado['mes_a_declarar'].strftime("%m")
+    periodo_anio = estado['mes_a_declarar'].strftime("%Y")
+    output_messages.append(f"Seleccionando Período: Mes {periodo_mes}, Año {periodo_anio}")
+
+    # Click en Buscar y espera la celda <td> específica con "0,00" en la grid
+    td_locator = page.locator(CELDA_OBLIGACION)
+    yield page.select_option("#mes_pos_fiscal", periodo_mes)
+    yield page.fill('[name="anio_pos_fiscal"]', periodo_anio)
+    yield page.click("#btn_buscar")
+    output_messages.append("Haciendo clic en 'Buscar'...")
+    yield td_locator.wait_for(state="visible", timeout=timeout)
+    yield td_locator.click()
+    output_messages.append('Clic en celda "0,00" de la grid...')
+
+def _paso_editar_obligacion(estado, timeout):
+    page, output_messages = estado['page'], estado['output']
+    # Click en botón Editar (listo cuando aparece "Agregar Rubro" en el form de detalles)
+    editar_locator = page.locator("#btn_editar")
+    yield editar_locator.wait_for(state="visible", timeout=timeout)  # Espera que se active post-selección
+    yield editar_locator.click()
+    output_messages.append("Haciendo clic en 'Editar'...")
+    yield page.locator("#add_rubro_a_grid").wait_for(state="visible", timeout=timeout)
+    output_messages.append("✅ Obligación editada/abierto form correctamente.")
+
+def _paso_agregar_rubro(estado, timeout):
+    page, output_messages = estado['page'], estado['output']
+    # --- AGREGANDO RUBRO Y LLENANDO FORM (clic en código "472120" post-búsqueda) ---
+    output_messages.append("\n--- AGREGANDO RUBRO Y LLENANDO FORM ---")
+    # Clic en "Agregar Rubro" (listo cuando el modal muestra la lupa de Actividad)
+    yield page.locator("#add_rubro_a_grid").click()
+    output_messages.append("Clic en 'Agregar Rubro'...")
+    yield page.locator("#d_actividad_lupa").wait_for(state="visible", timeout=timeout)
+
+def _paso_actividad(estado, timeout):
+    page, output_messages = estado['page'], estado['output']
+    # Doble clic en lupa Actividad, búsqueda y selección del código
+    yield page.locator("#d_actividad_lupa").dblclick()
+    output_messages.append("Doble clic en lupa 'Actividad'...")
+    busqueda_locator = page.locator('input[type="text"]:visible').first
+    yield busqueda_locator.wait_for(state="visible", timeout=timeout)
+    yield busqueda_locator.fill("venta al por menor")
+    output_messages.append("Buscando 'venta al por menor' en Actividad...")
+
+    # Clic en el código "472120" (o 47210) cuando el filtro lo muestra
+    codigo_locator = page.locator('td:has-text("472120")').first  # Cambia a "47210" si es el código exacto
+    yield codigo_locator.wait_for(state="visible", timeout=timeout)
+    yield codigo_locator.click()
+    output_messages.append("Clic en código '472120' para seleccionar...")
+    yield codigo_locator.wait_for(state="hidden", timeout=timeout)  # Listado cerrado
+
+    # Screenshot post-selección
+    yield page.screenshot(path="debug_actividad.png")
+    output_messages.append("Screenshot guardado: debug_actividad.png")
+
+def _paso_facturacion(estado, timeout):
+    # Clic en lupa Facturación y select #0
+    yield from _elegir_opcion_lupa(estado['page'], "#d_facturacion_lupa", "#0", timeout)
+    estado['output'].append("Seleccionada opción '0' en Facturación...")
+
+def _paso_base_imponible(estado, timeout):
+    yield estado['page'].fill("#i_base_imponible", estado['base_imponible'], timeout=timeout)
+    estado['output'].append(f"Rellenada base imponible: {estado['base_imponible']}")
+
+def _paso_alicuota(estado, timeout):
+    # Clic en lupa Alícuota y select #0
+    yield from _elegir_opcion_lupa(estado['page'], "#p_alicuota_lupa", "#0", timeout)
+    estado['output'].append("Seleccionada opción '0' en Alícuota...")
+
+def _paso_bonificacion(estado, timeout):
+    # Clic en lupa Bonificación y select #1
+    yield from _elegir_opcion_lupa(estado['page'], "#p_bonificacion_lupa", "#1", timeout)
+    estado['output'].append("Seleccionada opción '1' en Bonificación...")
+
+def _paso_guardar(estado, timeout):
+    page, output_messages = estado['page'], estado['output']
+    # Clic en Guardar (listo cuando el modal del rubro se cierra)
+    guardar_locator = page.locator("#sData")
+    yield guardar_locator.wait_for(state="visible", timeout=timeout)
+    yield guardar_locator.click()
+    output_messages.append("Clic en 'Guardar'...")
+    yield guardar_locator.wait_for(state="hidden", timeout=timeout)
+    output_messages.append("✅ Rubro agregado y guardado exitosamente.")
+
+    # Screenshot final
+    yield page.screenshot(path="debug_final.png")
+    output_messages.append("Screenshot final guardado: debug_final.png")
+
+# Puntos de control: la consulta (Fase 1) y el menú lateral (Fase 2); ambos recargan la
+# consulta antes de repetirse. Los pasos que abren o alternan algo en pantalla (submenú,
+# modal del rubro) no se reintentan en el lugar, porque repetir el clic lo desharía: si
+# fallan, el flujo se reanuda desde el menú lateral, sin login ni descarga de nuevo.
+FLUJO_RENTABOT = [
+    Paso('login', _paso_login),
+    Paso('consulta_periodo', _paso_consulta_periodo, punto_control=True, preparar=_volver_a_consulta),
+    Paso('descarga_excel', _paso_descarga_excel),
+    Paso('procesar_excel', _paso_procesar_excel, reintentos=0),
+    Paso('menu_lateral', _paso_menu_lateral, punto_control=True, preparar=_volver_a_consulta),
+    Paso('ingresos_brutos', _paso_ingresos_brutos, reintentos=0),
+    Paso('presentacion_ddjj', _paso_presentacion_ddjj, reintentos=0),
+    Paso('buscar_obligacion', _paso_buscar_obligacion),
+    Paso('editar_obligacion', _paso_editar_obligacion),
+    Paso('agregar_rubro', _paso_agregar_rubro, reintentos=0),
+    Paso('actividad', _paso_actividad),
+    Paso('facturacion', _paso_facturacion),
+    Paso('base_imponible', _paso_base_imponible),
+    Paso('alicuota', _paso_alicuota),
+    Paso('bonificacion', _paso_bonificacion),
+    Paso('guardar', _paso_guardar),
+]
+# El mismo flujo para playwright.sync_api (run_rentabot) y playwright.async_api (run_rentabot_async)
+PASOS_RENTABOT = pasos_sync(FLUJO_RENTABOT)
+PASOS_RENTABOT_ASYNC = pasos_async(FLUJO_RENTABOT)
+
 # ==============================================================================
 # FUNCIÓN PRINCIPAL CON PLAYWRIGHT (clic en código "472120" post-búsqueda)
 # ==============================================================================
-def run_rentabot(ruta_archivo):
+def run_rentabot(ruta_archivo, timeouts=None, cdp_endpoint=None, misiones_username=None, misiones_password=None,
+                 session_store=None, directorio_descargas=None, politica_red=None, descarga_http=False,
+                 directorio_archivo=None, al_procesar=None, periodo=None, usuario_archivo=None):
     """
     Automatiza el proceso de obtención de datos de rentas y presentación de DDJJ con Playwright.
 
     Args:
         ruta_archivo (str): Ruta al archivo Excel de rentas (opcional; si no, descarga primero).
+        timeouts (dict, optional): Presupuesto en ms por paso; pisa los valores de TIMEOUTS_PASOS.
+        cdp_endpoint (str, optional): Endpoint CDP de un navegador administrado por `CDPLauncher`.
+        misiones_username (str, optional): Usuario de Renta Misiones, para el login si no hay sesión.
+        misiones_password (str, optional): Contraseña de Renta Misiones.
+        session_store (optional): Objeto con `load()`, `save(state)` y `clear()` para reutilizar
+            la sesión de un login previo.
+        directorio_descargas (str, optional): Dónde guardar el Excel (por defecto `descargas_rentas/`).
+        politica_red (PoliticaRed, optional): Qué requests se abortan (imágenes, fuentes,
+            terceros...). Por defecto la del portal de Misiones; `False` desactiva el filtro.
+        descarga_http (bool): Si es True, la Fase 1 pide el Excel con un request HTTP directo
+            (cookies del contexto) y solo usa el botón de la página si eso no devuelve una planilla.
+        directorio_archivo (str, optional): Raíz del archivo columnar de planillas (ver
+            `rentas_archive`); la descarga se guarda ahí particionada por usuario y período.
+        usuario_archivo (int, optional): Id del usuario de Django que particiona el archivo
+            (sin él, la planilla no se archiva).
+        al_procesar (callable, optional): Se llama como `al_procesar(df, periodo)` con las líneas
+            de la planilla descargada (ver `leer_lineas_rentas`) y el período 'YYYY-MM' consultado.
+        periodo (str, optional): Período 'YYYY-MM' a consultar y declarar (por defecto, el mes anterior).
+
+    Sin credenciales ni `session_store` se usa el modo heredado: la sesión ya logueada del
+    Edge abierto a mano en 127.0.0.1:9222. Con credenciales, cada ejecución usa un contexto
+    y una página propios en el navegador indicado, así varias presentaciones corren a la vez.
+
+    El flujo corre como la secuencia de pasos `PASOS_RENTABOT`: un paso que falla se reintenta
+    solo, y si sigue fallando se reanuda desde el último punto de control en el mismo contexto,
+    sin repetir el login ni la descarga del Excel.
 
     Returns:
         tuple: (status, output, error)
                status (str): 'Success' o 'Failed'.
-               output (str): Mensajes de éxito o información.
+               output (str): Mensajes de éxito o información (incluye el tiempo real de cada paso).
                error (str): Mensajes de error si la ejecución falla.
     """
     output_messages = []
     error_messages = []
     status = 'Failed'
+    medidor = MedidorPasos({**TIMEOUTS_PASOS, **(timeouts or {})})
+    modo_administrado = bool(misiones_username or session_store is not None)
+    politica = POLITICAS_RED['misiones'] if politica_red is None else politica_red
+    filtro = None
 
     # Valor fijo para base imponible (para test; después lo sacamos de la página o Excel)
     base_imponible = "1000.00"
 
     # Configuración de descargas (igual que original)
-    directorio_descargas = os.path.join(os.getcwd(), "descargas_rentas")
+    directorio_descargas = directorio_descargas or os.path.join(os.getcwd(), "descargas_rentas")
     os.makedirs(directorio_descargas, exist_ok=True)
     output_messages.append(f"Los archivos se guardarán en: {directorio_descargas}")
 
-    # Puerto debug para conexión a sesión activa (igual que tu debuggerAddress)
-    debug_port = "http://127.0.0.1:9222"
-
     try:
         with sync_playwright() as p:
-            print("Conectando al navegador Edge en modo debug...")
-            browser = p.chromium.connect_over_cdp(debug_port)
-            context = browser.contexts[0]  # Usa el contexto existente (con sesión logueada)
-            page = context.pages[0] if context.pages else context.new_page()  # Usa página activa o crea nueva
-            
-            output_messages.append("¡Conexión exitosa!")
-
-            # --- FASE 1: OBTENCIÓN DE DATOS DE RENTAS ---
-            output_messages.append("\n--- INICIANDO FASE 1: OBTENCIÓN DE DATOS DE RENTAS ---")
-            page.goto("https://extranet.atm.misiones.gob.ar/Extranet/Aplicaciones/consultas_ret_perc.php")
-            
-            mes_a_declarar = datetime.today().replace(day=1) - timedelta(days=1)
-            periodo_consulta = mes_a_declarar.strftime("%Y/%m")
-            output_messages.append(f"Calculando período a consultar: {periodo_consulta}")
-            
-            # Ingreso de período
-            page.fill("#periodo_desde", periodo_consulta)
-            page.fill("#periodo_hasta", periodo_consulta)
-            output_messages.append("Período ingresado.")
-
-            # Limpieza de archivos antiguos
-            for f in os.listdir(directorio_descargas):
-                if f.endswith(('.xlsx', '.xls')):
-                    os.remove(os.path.join(directorio_descargas, f))
-
-            # Click en GENERAR EXCEL y espera descarga
-            with page.expect_download(timeout=60000) as download_info:  # 60s timeout
-                page.click("#btn_excel")
-            download = download_info.value
-            output_messages.append("Haciendo clic en 'GENERAR EXCEL'... Esperando la descarga...")
-
-            # Renombrar archivo descargado
-            nombre_nuevo = os.path.join(directorio_descargas, f"Rentas_{periodo_consulta.replace('/', '-')}.xlsx")
-            download.save_as(nombre_nuevo)
-            archivo_descargado = nombre_nuevo
-            output_messages.append(f"¡Archivo descargado y renombrado!: {archivo_descargado}")
-
-            datos_ddjj = None
-            if archivo_descargado and os.path.exists(archivo_descargado):
-                datos_ddjj = procesar_excel_rentas(archivo_descargado)
-                if datos_ddjj:
-                    output_messages.append(f"Datos a declarar recuperados: Retenciones={datos_ddjj.get('RETENCIÓN', 0):,.2f}, Percepciones={datos_ddjj.get('PERCEPCIÓN', 0):,.2f}")
-            else:
-                error_messages.append("ATENCIÓN: El archivo de Rentas no se descargó. No se puede continuar.")
-
-            # --- FASE 2: NAVEGACIÓN Y PRESENTACIÓN DE DDJJ ---
-            if datos_ddjj is not None:
-                output_messages.append("\n--- INICIANDO FASE 2: PRESENTACIÓN DE DDJJ ---")
-                
-                # Paso 1: Abrir menú hamburger
-                page.click(".menu-toggler")
-                output_messages.append("Abriendo el menú lateral (clic en el 'hamburger')...")
-                page.wait_for_timeout(2000)  # Wait extra para que el menú se estabilice
-                
-                # Paso 2: Clic directo en "Ingresos Brutos"
-                ingresos_brutos_locator = page.get_by_text("Ingresos Brutos")
-                ingresos_brutos_locator.wait_for(state="visible", timeout=5000)
-                ingresos_brutos_locator.click()
-                output_messages.append("Clic en 'Ingresos Brutos' para expandir...")
-                page.wait_for_timeout(1000)  # Pequeño delay para expansión JS
-                
-                # Paso 3: Clic en submenú "Presentación DDJJ (IIBB Directo)"
-                ddjj_locator = page.get_by_text("Presentación DDJJ (IIBB Directo)")
-                ddjj_locator.wait_for(state="visible", timeout=5000)
-                ddjj_locator.click()
-                output_messages.append("Haciendo clic en 'Presentación DDJJ (IIBB Directo)'...")
-                output_messages.append("✅ Navegación a Presentación DDJJ completada.")
-                
-                # Poner fecha/período
-                periodo_mes = mes_a_declarar.strftime("%m")
-                periodo_anio = mes_a_declarar.strftime("%Y")
-                output_messages.append(f"Seleccionando Período: Mes {periodo_mes}, Año {periodo_anio}")
-                
-                page.select_option("#mes_pos_fiscal", periodo_mes)
-                page.fill('[name="anio_pos_fiscal"]', periodo_anio)
-                
-                # Click en Buscar
-                page.click("#btn_buscar")
-                output_messages.append("Haciendo clic en 'Buscar'...")
-                page.wait_for_load_state("networkidle")  # Espera que la tabla cargue post-búsqueda
-                
-                # Espera y clic en la celda <td> específica con "0,00"
-                td_selector = 'td[role="gridcell"][aria-describedby="obligaciones_grid_i_impuesto_det"][title="0,00"]'
-                td_locator = page.locator(td_selector)
-                td_locator.wait_for(state="visible", timeout=20000)  # Espera que aparezca en la grid
-                td_locator.click()
-                output_messages.append('Clic en celda "0,00" de la grid...')
-                
-                # Click en botón Editar
-                editar_locator = page.locator("#btn_editar")
-                editar_locator.wait_for(state="visible", timeout=5000)  # Espera que se active post-selección
-                editar_locator.click()
-                output_messages.append("Haciendo clic en 'Editar'...")
-                page.wait_for_load_state("networkidle")  # Espera que cargue el form de detalles
-                output_messages.append("✅ Obligación editada/abierto form correctamente.")
-                
-                # --- AGREGANDO RUBRO Y LLENANDO FORM (clic en código "472120" post-búsqueda) ---
-                output_messages.append("\n--- AGREGANDO RUBRO Y LLENANDO FORM ---")
-                
-                # Clic en "Agregar Rubro"
-                add_rubro_locator = page.locator("#add_rubro_a_grid")
-                add_rubro_locator.wait_for(state="visible", timeout=10000)
-                add_rubro_locator.click()
-                output_messages.append("Clic en 'Agregar Rubro'...")
-                page.wait_for_selector("#d_actividad_lupa", timeout=10000)
-                page.wait_for_timeout(2000)  # Delay para modal
-                
-                # Doble clic en lupa Actividad
-                actividad_lupa_locator = page.locator("#d_actividad_lupa")
-                actividad_lupa_locator.wait_for(state="visible", timeout=5000)
-                actividad_lupa_locator.dblclick()
-                output_messages.append("Doble clic en lupa 'Actividad'...")
-                page.wait_for_timeout(3000)  # Delay para dropdown/search load
-                
-                # Búsqueda
-                page.fill('input[type="text"]:visible', "venta al por menor")  # Fill en input visible
-                output_messages.append("Buscando 'venta al por menor' en Actividad...")
-                page.wait_for_timeout(2000)  # Delay para filtro
-                
-                # Clic en el código "472120" (o 47210) en el resultado td
-                page.click('td:has-text("472120")')  # Cambia a "47210" si es el código exacto
-                output_messages.append("Clic en código '472120' para seleccionar...")
-                page.wait_for_timeout(1000)  # Delay para cierre dropdown
-                
-                # Screenshot post-selección
-                page.screenshot(path="debug_actividad.png")
-                output_messages.append("Screenshot guardado: debug_actividad.png")
-                
-                # Clic en lupa Facturación y select #0
-                facturacion_lupa_locator = page.locator("#d_facturacion_lupa")
-                facturacion_lupa_locator.wait_for(state="visible", timeout=5000)
-                facturacion_lupa_locator.click()
-                output_messages.append("Clic en lupa 'Facturación'...")
-                page.wait_for_selector("#0", timeout=5000)
-                page.click("#0")
-                output_messages.append("Seleccionada opción '0' en Facturación...")
-                page.wait_for_timeout(1000)
-                
-                # Rellenar base imponible
-                page.fill("#i_base_imponible", base_imponible)
-                output_messages.append(f"Rellenada base imponible: {base_imponible}")
-                page.wait_for_timeout(1000)
-                
-                # Clic en lupa Alícuota y select #0
-                alicuota_lupa_locator = page.locator("#p_alicuota_lupa")
-                alicuota_lupa_locator.wait_for(state="visible", timeout=5000)
-                alicuota_lupa_locator.click()
-                output_messages.append("Clic en lupa 'Alícuota'...")
-                page.wait_for_selector("#0", timeout=5000)
-                page.click("#0")
-                output_messages.append("Seleccionada opción '0' en Alícuota...")
-                page.wait_for_timeout(1000)
-                
-                # Clic en lupa Bonificación y select #1
-                bonificacion_lupa_locator = page.locator("#p_bonificacion_lupa")
-                bonificacion_lupa_locator.wait_for(state="visible", timeout=5000)
-                bonificacion_lupa_locator.click()
-                output_messages.append("Clic en lupa 'Bonificación'...")
-                page.wait_for_selector("#1", timeout=5000)
-                page.click("#1")
-                output_messages.append("Seleccionada opción '1' en Bonificación...")
-                page.wait_for_timeout(1000)
-                
-                # Clic en Guardar
-                guardar_locator = page.locator("#sData")
-                guardar_locator.wait_for(state="visible", timeout=5000)
-                guardar_locator.click()
-                output_messages.append("Clic en 'Guardar'...")
-                page.wait_for_load_state("networkidle")
-                output_messages.append("✅ Rubro agregado y guardado exitosamente.")
-                
-                # Screenshot final
-                page.screenshot(path="debug_final.png")
-                output_messages.append("Screenshot final guardado: debug_final.png")
-            
+            print("Conectando al navegador por CDP...")
+            browser = p.chromium.connect_over_cdp(cdp_endpoint or DEBUG_PORT_MANUAL)
+            context = None
+            try:
+                if modo_administrado:
+                    # Contexto y página dedicados: no se comparte estado con otras presentaciones
+                    storage_state = session_store.load() if session_store is not None else None
+                    context = browser.new_context(storage_state=storage_state, accept_downloads=True)
+                    page = context.new_page()
+                else:
+                    storage_state = None
+                    existente = browser.contexts[0]  # Usa el contexto existente (con sesión logueada), sin cerrarlo
+                    page = existente.pages[0] if existente.pages else existente.new_page()  # Usa página activa o crea nueva
+                filtro = politica.instalar(page) if politica else None
+
+                output_messages.append("¡Conexión exitosa!")
+
+                estado = _estado_inicial(page, output_messages, misiones_username, misiones_password, session_store,
+                                         storage_state is not None, directorio_descargas, descarga_http, base_imponible,
+                                         directorio_archivo, al_procesar, periodo, usuario_archivo)
+                MotorPasos(PASOS_RENTABOT, medidor, output_messages=output_messages).ejecutar(estado)
+            finally:
+                # El navegador CDP del worker sigue vivo entre trabajos: el contexto propio se
+                # cierra también cuando el flujo falla, para no acumular contextos ni cookies
+                if context is not None:
+                    context.close()
+                browser.close()  # Cierra la conexión (no el browser físico)
+
             output_messages.append("\nPROCESO COMPLETO DEL BOT FINALIZADO.")
-            browser.close()  # Cierra la conexión (no el browser físico)
             status = 'Success'
 
     except Exception as e:
         error_messages.append(f"Error durante el proceso: {e}")
+    finally:
+        if filtro is not None:
+            output_messages.append(filtro.resumen())
+        output_messages.append(medidor.resumen())
     
     return status, "\n".join(output_messages), "\n".join(error_messages)
 
+# ==============================================================================
+# VERSIÓN ASYNC (playwright.async_api) para el runner concurrente
+# ==============================================================================
+async def run_rentabot_async(ruta_archivo, browser, timeouts=None, misiones_username=None, misiones_password=None,
+                             session_store=None, directorio_descargas=None, politica_red=None, descarga_http=False,
+                             directorio_archivo=None, al_procesar=None, periodo=None, usuario_archivo=None):
+    """
+    Igual que `run_rentabot`, pero sobre `playwright.async_api` y un navegador compartido.
+    Cada llamada usa su propio contexto (con la sesión guardada del usuario, si hay) y su
+    propio directorio de descargas, para que varias presentaciones corran a la vez.
+
+    Returns:
+        tuple: (status, output, error), con el mismo formato que `run_rentabot`.
+    """
+    output_messages = []
+    error_messages = []
+    status = 'Failed'
+    medidor = MedidorPasos({**TIMEOUTS_PASOS, **(timeouts or {})})
+    base_imponible = "1000.00"
+    politica = POLITICAS_RED['misiones'] if politica_red is None else politica_red
+    filtro = None
+
+    directorio_descargas = directorio_descargas or os.path.join(os.getcwd(), "descargas_rentas")
+    os.makedirs(directorio_descargas, exist_ok=True)
+    output_messages.append(f"Los archivos se guardarán en: {directorio_descargas}")
+
+    try:
+        storage_state = await asyncio.to_thread(session_store.load) if session_store is not None else None
+        context = await browser.new_context(storage_state=storage_state, accept_downloads=True)
+        try:
+            page = await context.new_page()
+            filtro = await politica.instalar_async(page) if politica else None
+            estado = _estado_inicial(page, output_messages, misiones_username, misiones_password, session_store,
+                                     storage_state is not None, directorio_descargas, descarga_http, base_imponible,
+                                     directorio_archivo, al_procesar, periodo, usuario_archivo)
+            await MotorPasos(PASOS_RENTABOT_ASYNC, medidor, output_messages=output_messages).ejecutar_async(estado)
+        finally:
+            await context.close()
+        output_messages.append("\nPROCESO COMPLETO DEL BOT FINALIZADO.")
+        status = 'Success'
+
+    except Exception as e:
+        error_messages.append(f"Error durante el proceso: {e}")
+    finally:
+        if filtro is not None:
+            output_messages.append(filtro.resumen())
+        output_messages.append(medidor.resumen())
+
+    return status, "\n".join(output_messages), "\n".join(error_messages)
+
 # ==============================================================================
 # EJECUCIÓN DIRECTA (para tests; en Django, llamá run_rentabot)
 # ==============================================================================
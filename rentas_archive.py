@@ -0,0 +1,96 @@
+"""
+Archivo histórico de las planillas de Rentas descargadas, en formato columnar.
+
+Cada descarga se guarda una sola vez, ya normalizada, particionada por usuario (el id del
+usuario de Django) y período consultado:
+
+    <raiz>/usuario=<id>/periodo=<YYYY-MM>/rentas.parquet
+
+Las consultas de varios períodos leen solo las columnas y filas pedidas, sin volver a
+parsear los .xlsx. Necesita `pyarrow` (ver requirements.txt): sin él, guardar o consultar
+el archivo levanta ImportError en lugar de caer en un formato menos eficiente.
+"""
+import glob
+import os
+import re
+
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+PATRON_PERIODO = re.compile(r'\d{4}-(0[1-9]|1[0-2])')
+
+
+def _clave_usuario(usuario):
+    # El nombre de la partición no puede tener separadores de ruta ni '='
+    return re.sub(r'[^0-9A-Za-z._-]', '_', str(usuario or 'sin_usuario'))
+
+
+def _requerir_pyarrow():
+    if pyarrow is None:
+        raise ImportError("El archivo de planillas de Rentas necesita pyarrow (pip install pyarrow).")
+
+
+def ruta_particion(raiz, usuario, periodo):
+    if not PATRON_PERIODO.fullmatch(periodo or ''):
+        raise ValueError(f"Período inválido para el archivo de Rentas: {periodo!r} (se espera YYYY-MM).")
+    return os.path.join(raiz, f"usuario={_clave_usuario(usuario)}", f"periodo={periodo}", "rentas.parquet")
+
+
+def _compactar(df):
+    """Tipos columnares: textos repetidos como categorías y columnas mixtas como texto (Parquet no las acepta)."""
+    df = df.copy()
+    for columna in df.columns:
+        if df[columna].dtype == object:
+            valores = df[columna].astype('string')
+            df[columna] = valores.astype('category') if valores.nunique() <= len(df) // 2 else valores
+    return df
+
+
+def guardar_particion(df, raiz, usuario, periodo):
+    """
+    Guarda las líneas de un período (reemplaza la partición si ya existía). La escritura es
+    atómica: una descarga a medio guardar nunca queda visible para las consultas.
+
+    Returns:
+        str: La ruta del archivo de la partición.
+    """
+    _requerir_pyarrow()
+    ruta = ruta_particion(raiz, usuario, periodo)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.parcial"
+    _compactar(df.reset_index(drop=True)).to_parquet(temporal, index=False, engine='pyarrow')
+    os.replace(temporal, ruta)
+    return ruta
+
+
+def particiones(raiz, usuario, desde=None, hasta=None):
+    """{período: ruta} de las particiones archivadas del usuario entre `desde` y `hasta` (YYYY-MM, inclusive)."""
+    encontradas = {}
+    patron = os.path.join(glob.escape(os.path.join(raiz, f"usuario={_clave_usuario(usuario)}")), 'periodo=*', 'rentas.parquet')
+    for ruta in glob.glob(patron):
+        periodo = os.path.basename(os.path.dirname(ruta)).split('=', 1)[1]
+        if (desde and periodo < desde) or (hasta and periodo > hasta):
+            continue
+        encontradas[periodo] = ruta
+    return dict(sorted(encontradas.items()))
+
+
+def cargar(raiz, usuario, desde=None, hasta=None, columnas=None, filtros=None):
+    """
+    Líneas archivadas del usuario en las particiones (períodos de descarga) entre `desde` y
+    `hasta`, en un solo DataFrame con la columna PARTICION. Con `columnas` se leen solo esas
+    del disco, y con `filtros` (formato de pyarrow, ej. [('PERIODO', '>=', '2025-09')]) solo
+    las filas que los cumplen.
+    """
+    _requerir_pyarrow()
+    marcos = []
+    for periodo, ruta in particiones(raiz, usuario, desde, hasta).items():
+        df = pd.read_parquet(ruta, columns=columnas, filters=filtros, engine='pyarrow')
+        marcos.append(df.assign(PARTICION=periodo))
+    if not marcos:
+        return pd.DataFrame(columns=list(columnas or []) + ['PARTICION'])
+    return pd.concat(marcos, ignore_index=True)